@@ -1,21 +1,56 @@
 from flask import Flask, jsonify
-from routes.routes import bp_routes
-from routes.test_routes import test_routes
 from helper import getFreshTimeStamp
 
 def create_app():
+    """
+    Builds the Flask app. Nothing connects here: Mongo and Redis clients
+    are created on first use, once per worker process (configs/connections.py).
+    """
+    # imported here so `import app` stays cheap for tools that only need the factory
+    from configs import connections, event_loop
+    from configs.json_provider import FastJSONProvider
+    from routes.routes import bp_routes
+    from routes.test_routes import test_routes
+    from monitoring.metrics import init_metrics
+    from monitoring.request_logging import init_request_logging
+    from models.indexes import sync_indexes_command
+    from models.job_queue import jobs_worker_command
+
     app = Flask(__name__)
-    app.config.from_object('config')
+    app.config.from_object('config.BaseConfig')
+
+    # orjson encoder that understands ObjectId, datetime, Decimal128 and bytes
+    app.json = FastJSONProvider(app)
+
+    # Mongo / Redis settings are read from this app's config
+    connections.init_app(app)
+
+    # async views share one long-lived event loop per worker, and its clients
+    event_loop.init_app(app)
+
+    # Registering the blueprint
+    app.register_blueprint(bp_routes)
+    app.register_blueprint(test_routes)
+
+    # Latency metrics per route, exported on /metrics
+    init_metrics(app)
+
+    # Sampled, batched request logs in the request_logs collection
+    init_request_logging(app)
+
+    # flask --app app sync-indexes
+    app.cli.add_command(sync_indexes_command)
+
+    # flask --app app jobs-worker
+    app.cli.add_command(jobs_worker_command)
     return app
 
 app = create_app()  # Creating the app
 
-# Registering the blueprint
-app.register_blueprint(bp_routes)
-app.register_blueprint(test_routes)
-
 # reloading with timestamp time
 print(f"\n================  Reloaded at: {getFreshTimeStamp(timezone='Asia/Kolkata') }  ===================\n")
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=int("5000"), debug=True)
\ No newline at end of file
+    from configs.lifecycle import sync_on_startup
+    sync_on_startup()
+    app.run(host="0.0.0.0", port=int("5000"), debug=True)
@@ -0,0 +1,233 @@
+"""
+Micro-benchmarks for the BaseModel and RedisClient hot paths
+-------------------------------
+Measures ops/sec and p50 / p95 / p99 latency of BaseModel.insert, find_all,
+update and RedisClient.set, get, get_all across document sizes, batch sizes
+and collection sizes. Runs offline against local stand-ins:
+
+    mongo : mongomock (default) or a local mongod  (--mongo-uri mongodb://localhost:27017)
+    redis : fakeredis (default) or a local redis   (--redis-url redis://localhost:6379/15)
+
+Results are written as JSON so two runs can be compared:
+
+    python benchmarks/bench_hot_paths.py --output before.json
+    python benchmarks/bench_hot_paths.py --output after.json --baseline before.json --threshold 15
+
+With --baseline the run exits with status 1 when any case is slower than
+the baseline by more than --threshold percent (p50 latency or ops/sec).
+The databases used are dropped / flushed, never point this at real data.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('FLASK_ENV', 'development')
+
+from models.base_model import BaseModel
+from models.redis_client import RedisClient, get_serializer
+
+DOCUMENT_SIZES   = {'small': 100, 'medium': 1000, 'large': 10000}
+BATCH_SIZES      = [10, 100, 1000]
+COLLECTION_SIZES = [100, 1000, 10000]
+
+
+# ----- stand-ins --------------------------------------------------------
+
+def mongo_database(uri: str):
+    if uri:
+        from pymongo import MongoClient
+        return MongoClient(uri)['geeta-benchmark']
+    import mongomock
+    return mongomock.MongoClient()['geeta-benchmark']
+
+
+def redis_connection(url: str):
+    if url:
+        import redis
+        return redis.Redis.from_url(url)
+    import fakeredis
+    return fakeredis.FakeRedis()
+
+
+def make_model(database, name: str) -> BaseModel:
+    # BaseModel.__init__ connects through configs.database; point it at the stand-in instead
+    model            = BaseModel.__new__(BaseModel)
+    model.db         = database
+    model.collection = database[name]
+    model.cache      = None
+    model.collection.drop()
+    return model
+
+
+def make_redis(connection) -> RedisClient:
+    client              = RedisClient.__new__(RedisClient)
+    client.redis_client = connection
+    client.serializer   = get_serializer()
+    connection.flushdb()
+    return client
+
+
+def make_document(size: int, index: int = 0) -> dict:
+    return {'index': index, 'name': f'document-{index}', 'payload': 'x' * size}
+
+
+# ----- measurement ------------------------------------------------------
+
+def percentile(ordered: list, fraction: float) -> float:
+    position = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[position]
+
+
+def measure(operation, iterations: int, ops_per_call: int = 1, setup=None) -> dict:
+    """
+    Calls `operation()` `iterations` times and summarises the latencies.
+    `ops_per_call` scales ops/sec for calls that handle several documents.
+    """
+    if setup:
+        setup()
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - started)
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'iterations': iterations,
+        'ops_per_sec': (iterations * ops_per_call) / total if total else 0.0,
+        'p50_ms'    : percentile(latencies, 0.50) * 1000,
+        'p95_ms'    : percentile(latencies, 0.95) * 1000,
+        'p99_ms'    : percentile(latencies, 0.99) * 1000
+    }
+
+
+# ----- cases ------------------------------------------------------------
+
+def mongo_cases(database, iterations: int, quick: bool) -> dict:
+    results = {}
+    sizes   = COLLECTION_SIZES[:2] if quick else COLLECTION_SIZES
+
+    for label, size in DOCUMENT_SIZES.items():
+        model   = make_model(database, 'bench_insert')
+        counter = iter(range(10 ** 9))
+        results[f'mongo.insert.one.{label}'] = measure(
+            lambda: model.insert(make_document(size, next(counter))), iterations
+        )
+
+    for batch in BATCH_SIZES:
+        model = make_model(database, 'bench_insert_batch')
+        results[f'mongo.insert.batch.{batch}'] = measure(
+            lambda: model.insert([make_document(100, i) for i in range(batch)]),
+            max(5, iterations // batch), ops_per_call=batch
+        )
+
+    for count in sizes:
+        model = make_model(database, 'bench_find')
+        model.insert([make_document(100, i) for i in range(count)])
+        results[f'mongo.find_all.{count}'] = measure(
+            lambda: model.find_all(), max(3, iterations * 100 // count), ops_per_call=count
+        )
+        results[f'mongo.update.one.{count}'] = measure(
+            lambda: model.update({'index': count // 2}, {'touched': time.time()}, update_all=False), iterations
+        )
+
+    return results
+
+
+def redis_cases(connection, iterations: int, quick: bool) -> dict:
+    results = {}
+    sizes   = COLLECTION_SIZES[:2] if quick else COLLECTION_SIZES
+
+    for label, size in DOCUMENT_SIZES.items():
+        client   = make_redis(connection)
+        document = make_document(size)
+        results[f'redis.set.{label}'] = measure(lambda: client.set('bench:key', document, 60), iterations)
+        results[f'redis.get.{label}'] = measure(lambda: client.get('bench:key'), iterations)
+
+    for count in sizes:
+        client = make_redis(connection)
+        client.mset({f'bench:{i}': make_document(100, i) for i in range(count)})
+        results[f'redis.get_all.{count}'] = measure(
+            lambda: client.get_all(), max(3, iterations * 100 // count), ops_per_call=count
+        )
+
+    connection.flushdb()
+    return results
+
+
+# ----- comparison -------------------------------------------------------
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Returns one message per case that regressed by more than `threshold` percent.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        slower_p50 = (current['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100 if previous['p50_ms'] else 0.0
+        fewer_ops  = (previous['ops_per_sec'] - current['ops_per_sec']) / previous['ops_per_sec'] * 100 if previous['ops_per_sec'] else 0.0
+        if slower_p50 > threshold or fewer_ops > threshold:
+            regressions.append(
+                f"{name}: p50 {previous['p50_ms']:.3f} -> {current['p50_ms']:.3f} ms ({slower_p50:+.1f}%), "
+                f"ops/sec {previous['ops_per_sec']:.0f} -> {current['ops_per_sec']:.0f} ({-fewer_ops:+.1f}%)"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongo-uri', help='local mongod to use instead of mongomock')
+    parser.add_argument('--redis-url', help='local redis to use instead of fakeredis')
+    parser.add_argument('--iterations', type=int, default=500, help='calls per single-document case')
+    parser.add_argument('--quick', action='store_true', help='skip the largest collection size')
+    parser.add_argument('--only', choices=['mongo', 'redis'], help='run only one backend')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed slowdown in percent')
+    args = parser.parse_args()
+
+    results = {}
+    if args.only != 'redis':
+        results.update(mongo_cases(mongo_database(args.mongo_uri), args.iterations, args.quick))
+    if args.only != 'mongo':
+        results.update(redis_cases(redis_connection(args.redis_url), args.iterations, args.quick))
+
+    print(f"{'case':<28} {'ops/sec':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, result in results.items():
+        print(f"{name:<28} {result['ops_per_sec']:>12.0f} {result['p50_ms']:>9.3f} "
+              f"{result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'meta': {
+                    'created' : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                    'python'  : platform.python_version(),
+                    'platform': platform.platform(),
+                    'mongo'   : args.mongo_uri or 'mongomock',
+                    'redis'   : args.redis_url or 'fakeredis'
+                },
+                'results': results
+            }, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold}%:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold}% against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
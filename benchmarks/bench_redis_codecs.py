@@ -0,0 +1,75 @@
+"""
+Benchmark of the RedisClient value codecs
+-------------------------------
+Compares encode / decode time and stored payload size of every available
+codec and compression combination on documents shaped like the ones we
+cache (find_all output: string ids, nested dicts, lists, timestamps as
+strings). Runs offline, no Redis needed.
+
+    python benchmarks/bench_redis_codecs.py
+    python benchmarks/bench_redis_codecs.py --number 2000 --threshold 512
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.redis_codecs import ValueSerializer, msgpack, orjson, lz4_frame
+
+
+def make_documents() -> dict:
+    small = {
+        '_id'      : '665f1c2e9b1e8a3d4c2b1a09',
+        'name'     : 'Jhon',
+        'email'    : 'jhon@example.com',
+        'active'   : True,
+        'createdAt': '2024-06-06 09:11:50'
+    }
+    medium = {
+        **small,
+        'address': {'street': '221B Baker Street', 'city': 'London', 'zip': 'NW1 6XE'},
+        'roles'  : ['admin', 'editor', 'viewer'],
+        'scores' : [round(i * 1.37, 2) for i in range(50)],
+        'bio'    : 'lorem ipsum dolor sit amet ' * 20
+    }
+    wide = {
+        **small,
+        'orders': [
+            {'order_id': f'ORD-{i:06d}', 'amount': i * 10.5, 'status': 'delivered', 'items': list(range(5))}
+            for i in range(200)
+        ]
+    }
+    return {'small': small, 'medium': medium, 'wide': wide}
+
+
+def combinations(threshold: int) -> list:
+    codecs = ['pickle'] + (['msgpack'] if msgpack else []) + (['orjson'] if orjson else [])
+    compressions = [None, 'zlib'] + (['lz4'] if lz4_frame else [])
+    return [
+        (f"{codec}+{compression or 'none'}", ValueSerializer(codec, compression=compression, threshold=threshold))
+        for codec in codecs
+        for compression in compressions
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=5000, help='encode/decode calls per measurement')
+    parser.add_argument('--threshold', type=int, default=1024, help='compression threshold in bytes')
+    args = parser.parse_args()
+
+    print(f"{'document':<8} {'codec':<16} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for doc_name, document in make_documents().items():
+        for name, serializer in combinations(args.threshold):
+            data   = serializer.dumps('bench', document)
+            encode = timeit.timeit(lambda: serializer.dumps('bench', document), number=args.number)
+            decode = timeit.timeit(lambda: serializer.loads(data), number=args.number)
+            print(f"{doc_name:<8} {name:<16} {len(data):>8} "
+                  f"{encode / args.number * 1e6:>10.2f} {decode / args.number * 1e6:>10.2f}")
+        print()
+
+
+if __name__ == '__main__':
+    main()
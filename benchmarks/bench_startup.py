@@ -0,0 +1,106 @@
+"""
+Cold start and per-worker memory of `import app`
+-------------------------------
+Imports the app in a fresh interpreter with `python -X importtime` and
+reports the wall time, the peak RSS after the import, the slowest modules
+(cumulative and self time) and whether any connection was opened during
+the import (there should be none, see configs/connections.py):
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 5 --top 25 --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json --threshold 20
+
+With --baseline the run exits with status 1 when the import time or the
+peak RSS grew by more than --threshold percent.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs inside the child interpreter, after `-X importtime` has traced every import
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+from configs.connections import resources
+rss_kb  = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kb //= 1024
+print('@@' + json.dumps({'seconds': elapsed, 'rss_mb': rss_kb / 1024, 'connections': [repr(k) for k in resources()]}))
+"""
+
+
+def run_once() -> tuple:
+    """
+    Imports the app in a child interpreter. Returns (probe result, {module: (self us, cumulative us)}).
+    """
+    env = dict(os.environ)
+    env.setdefault('FLASK_ENV', 'development')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        sys.exit(f"import app failed:\n{completed.stderr}")
+
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(own), int(cumulative))
+
+    result = next(json.loads(line[2:]) for line in completed.stdout.splitlines() if line.startswith('@@'))
+    return result, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters to start, the fastest is reported')
+    parser.add_argument('--top', type=int, default=15, help='modules to list')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed growth in percent')
+    args = parser.parse_args()
+
+    runs            = [run_once() for _ in range(max(1, args.runs))]
+    result, modules = min(runs, key=lambda run: run[0]['seconds'])
+
+    print(f"import app: {result['seconds'] * 1000:.1f} ms, peak RSS {result['rss_mb']:.1f} MB "
+          f"(best of {len(runs)})")
+    if result['connections']:
+        print(f"WARNING: created during import: {', '.join(result['connections'])}")
+
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, (own, cumulative) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"{cumulative / 1000:>14.1f} {own / 1000:>9.1f}  {name}")
+
+    summary = {'seconds': result['seconds'], 'rss_mb': result['rss_mb'], 'modules': len(modules)}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'results': summary, 'slowest': dict(sorted(modules.items(), key=lambda item: -item[1][1])[:args.top])},
+                      output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = []
+        for name in ('seconds', 'rss_mb'):
+            growth = (summary[name] - baseline[name]) / baseline[name] * 100 if baseline[name] else 0.0
+            if growth > args.threshold:
+                regressions.append(f"{name}: {baseline[name]:.3f} -> {summary[name]:.3f} ({growth:+.1f}%)")
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold}%:")
+            for message in regressions:
+                print(f"  {message}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold}% against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark of the helper.py timezone conversions
+-------------------------------
+Converts the same timestamps (spread over three years, so DST transitions
+are crossed) with:
+
+    legacy        the previous convertTimezone: new ZoneInfo objects and
+                  strptime / strftime on every call
+    per item      helper.convertTimezone called once per value
+    batch         helper.convertTimezones on a list of strings
+    streaming     helper.iterConvertTimezones over a generator
+    datetime64    helper.convertTimezones on a NumPy array (if numpy is installed)
+
+and checks that every variant returns the legacy results. Runs offline.
+
+    python benchmarks/bench_timezones.py
+    python benchmarks/bench_timezones.py --count 200000 --from-tz Asia/Kolkata --to-tz America/New_York
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper import convertTimezone, convertTimezones, iterConvertTimezones
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def legacy_convert(date: str, FromTimeZone: str, ToTimeZone: str, dateFormat="%Y-%m-%d %H:%M:%S") -> str:
+    if dateFormat == "iso8601":
+        dateFormat = "%Y-%m-%dT%H:%M:%SZ"
+    datetime_obj = datetime.datetime.strptime(date, dateFormat)
+    datetime_obj = datetime_obj.replace(tzinfo=ZoneInfo(FromTimeZone))
+    return datetime_obj.astimezone(ZoneInfo(ToTimeZone)).strftime(dateFormat)
+
+
+def make_values(count: int, dateFormat: str) -> list:
+    random.seed(7)
+    start = datetime.datetime(2022, 1, 1)
+    span  = 3 * 365 * 86400
+    return [(start + datetime.timedelta(seconds=random.randrange(span))).strftime(dateFormat) for _ in range(count)]
+
+
+def measure(function, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result  = function()
+        elapsed = time.perf_counter() - started
+        best    = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000, help='timestamps per run')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per variant, the best one is reported')
+    parser.add_argument('--from-tz', default='UTC')
+    parser.add_argument('--to-tz', default='America/New_York')
+    parser.add_argument('--format', default='%Y-%m-%d %H:%M:%S', help='strftime format or "iso8601"')
+    args = parser.parse_args()
+
+    dateFormat = "%Y-%m-%dT%H:%M:%SZ" if args.format == "iso8601" else args.format
+    values     = make_values(args.count, dateFormat)
+    source, target = args.from_tz, args.to_tz
+
+    variants = [
+        ('legacy',     lambda: [legacy_convert(value, source, target, args.format) for value in values]),
+        ('per item',   lambda: [convertTimezone(value, source, target, args.format) for value in values]),
+        ('batch',      lambda: convertTimezones(values, source, target, args.format)),
+        ('streaming',  lambda: list(iterConvertTimezones((value for value in values), source, target, args.format))),
+    ]
+    if numpy is not None:
+        parse  = lambda value: datetime.datetime.strptime(value, dateFormat)
+        array  = numpy.array([parse(value) for value in values], dtype='datetime64[s]')
+        # compared as strings in the benchmark format, outside the timed part
+        render = lambda converted: [value.strftime(dateFormat) for value in converted.astype(datetime.datetime)]
+        variants.append(('datetime64', lambda: convertTimezones(array, source, target)))
+
+    print(f"{args.count} timestamps, {source} -> {target}, format {args.format!r}\n")
+    print(f"{'variant':<12} {'total ms':>10} {'ns/value':>10} {'speedup':>8}  same result")
+    expected, baseline = None, None
+    for name, function in variants:
+        elapsed, result = measure(function, args.repeat)
+        if name == 'datetime64':
+            result = render(result)
+        if expected is None:
+            expected, baseline = result, elapsed
+        print(f"{name:<12} {elapsed * 1e3:>10.1f} {elapsed / args.count * 1e9:>10.0f} "
+              f"{baseline / elapsed:>7.1f}x  {result == expected}")
+    if numpy is None:
+        print("\nnumpy is not installed, datetime64 skipped (pip install -r benchmarks/requirements.txt)")
+
+
+if __name__ == '__main__':
+    main()
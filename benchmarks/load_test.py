@@ -0,0 +1,199 @@
+"""
+Local load test: Flask development server vs gunicorn
+-------------------------------
+Starts the app under each server on a free local port, sends requests
+from keep-alive client connections for a fixed time, and prints
+requests/sec, p50 / p95 / p99 latency and errors side by side:
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --duration 20 --concurrency 64 --path /test/implementation \\
+        --body '{"method": "test_data_encode", "data": {"data": "abc"}}'
+    python benchmarks/load_test.py --url http://localhost:5000/      (a server that is already running)
+
+    dev      : flask run (threaded Werkzeug server, one process)
+    gunicorn : gunicorn -c gunicorn.conf.py (BaseConfig.SERVER, --workers / --threads override)
+
+The default path "/" needs neither Mongo nor Redis; other paths need the
+services from docker-compose.yml.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ----- servers ----------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind: str, port: int, workers: int = None, threads: int = None) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.setdefault('FLASK_ENV', 'development')
+    if kind == 'dev':
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--host', '127.0.0.1', '--port', str(port)]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}']
+        if workers:
+            command += ['--workers', str(workers)]
+        if threads:
+            command += ['--threads', str(threads)]
+        command.append('app:app')
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start within {timeout}s")
+
+
+# ----- client -----------------------------------------------------------
+
+def client_process(url: str, body: str, threads: int, duration: float, results) -> None:
+    """
+    Runs `threads` keep-alive connections until `duration` elapses and
+    puts (latencies, errors) on the results queue.
+    """
+    target    = urllib.parse.urlsplit(url)
+    path      = target.path or '/'
+    method    = 'POST' if body else 'GET'
+    headers   = {'Content-Type': 'application/json'} if body else {}
+    stop_at   = time.perf_counter() + duration
+    latencies = []
+    errors    = [0]
+    lock      = threading.Lock()
+
+    def run():
+        own, failed = [], 0
+        connection  = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+                else:
+                    own.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        connection.close()
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((latencies, errors[0]))
+
+
+def load(url: str, body: str, concurrency: int, duration: float) -> dict:
+    """
+    Spreads `concurrency` connections over a few client processes so the
+    client's GIL does not cap the measured throughput.
+    """
+    processes = max(1, min(concurrency, multiprocessing.cpu_count() // 2 or 1))
+    results   = multiprocessing.Queue()
+    clients   = [
+        multiprocessing.Process(
+            target=client_process,
+            args=(url, body, concurrency // processes + (1 if index < concurrency % processes else 0), duration, results)
+        )
+        for index in range(processes)
+    ]
+    for client in clients:
+        client.start()
+
+    latencies, errors = [], 0
+    for _ in clients:
+        own, failed = results.get()
+        latencies.extend(own)
+        errors += failed
+    for client in clients:
+        client.join()
+
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * (len(latencies) - 1)))] * 1000 if latencies else 0.0
+
+    return {
+        'requests'   : len(latencies),
+        'errors'     : errors,
+        'rps'        : len(latencies) / duration,
+        'p50_ms'     : percentile(0.50),
+        'p95_ms'     : percentile(0.95),
+        'p99_ms'     : percentile(0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='load an already running server instead of starting dev and gunicorn')
+    parser.add_argument('--servers', default='dev,gunicorn', help='servers to compare (dev, gunicorn)')
+    parser.add_argument('--path', default='/', help='path to request')
+    parser.add_argument('--body', help='JSON body, sends POST instead of GET')
+    parser.add_argument('--concurrency', type=int, default=32, help='keep-alive connections')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per server')
+    parser.add_argument('--warmup', type=float, default=2, help='seconds of load before measuring')
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: BaseConfig.SERVER)')
+    parser.add_argument('--threads', type=int, help='gunicorn threads per worker')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    if args.url:
+        load(args.url, args.body, args.concurrency, args.warmup)
+        results[args.url] = load(args.url, args.body, args.concurrency, args.duration)
+    else:
+        for kind in args.servers.split(','):
+            port    = free_port()
+            process = start_server(kind, port, args.workers, args.threads)
+            try:
+                wait_until_ready(port)
+                url = f"http://127.0.0.1:{port}{args.path}"
+                load(url, args.body, args.concurrency, args.warmup)
+                results[kind] = load(url, args.body, args.concurrency, args.duration)
+            finally:
+                process.terminate()
+                process.wait(timeout=60)
+
+    print(f"{'server':<10} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['rps']:>10.0f} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['errors']:>8}")
+    if 'dev' in results and 'gunicorn' in results and results['dev']['rps']:
+        print(f"\ngunicorn / dev throughput: {results['gunicorn']['rps'] / results['dev']['rps']:.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'path': args.path, 'concurrency': args.concurrency, 'duration': args.duration,
+                       'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,18 +11,42 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 class BaseConfig:
     SECRET_KEY = SECRET_KEY
     BASEDIR    = basedir
-    # REDIS      = {
-    #     "LOCAL":{
-    #         "HOST": "redis",
-    #         "PORT": "6379",
-    #         "SSL" : False
-    #     },
-    #     "PROD": {
-    #         "HOST": "proxy-app-extension-cache-pbx6uq.serverless.use1.cache.amazonaws.com",
-    #         "PORT": "6379",
-    #         "SSL" : True
-    #     }
-    # }
+    REDIS      = {
+        "LOCAL":{
+            "HOST": "redis",
+            "PORT": "6379",
+            "SSL" : False
+        },
+        "PROD": {
+            "HOST": "proxy-app-extension-cache-pbx6uq.serverless.use1.cache.amazonaws.com",
+            "PORT": "6379",
+            "SSL" : True
+        }
+    }
+    # Shared connection pools used by RedisClient, one per (host, port, db, ssl).
+    # A request waits up to POOL_TIMEOUT seconds for a free connection once
+    # MAX_CONNECTIONS are in use. Idle connections are PINGed before reuse
+    # when they have been idle longer than HEALTH_CHECK_INTERVAL seconds.
+    REDIS_POOL = {
+        "MAX_CONNECTIONS"      : 50,
+        "POOL_TIMEOUT"         : 5,
+        "HEALTH_CHECK_INTERVAL": 30,
+        "SOCKET_TIMEOUT"       : 5,
+        "CONNECT_TIMEOUT"      : 5
+    }
+    # How RedisClient encodes values. CODEC is one of "pickle", "msgpack",
+    # "orjson" or "raw" (msgpack / orjson need their packages installed).
+    # PREFIXES overrides the codec per key prefix, e.g. {"session:": "orjson"}.
+    # Payloads of at least COMPRESS_THRESHOLD bytes are compressed with
+    # COMPRESSION ("zlib", "lz4" or None). Set ALLOW_PICKLE to False when
+    # the Redis instance is shared with untrusted writers.
+    REDIS_CODEC = {
+        "CODEC"             : "pickle",
+        "COMPRESSION"       : "zlib",
+        "COMPRESS_THRESHOLD": 1024,
+        "PREFIXES"          : {},
+        "ALLOW_PICKLE"      : True
+    }
     DATABASE   = {
         "LOCAL":{
             "HOST"  : "mongodb",
@@ -41,4 +65,215 @@ class BaseConfig:
         #     "SUFFIX": "ssl=true&tlsCAFile=global-bundle.pem&replicaSet=rs0&readPreference=secondaryPreferred&retryWrites=false"
         # }
     }
-    
\ No newline at end of file
+
+    # Connection pool of every MongoClient (configs/database.py). A request
+    # waits up to WAIT_QUEUE_TIMEOUT_MS for a connection once MAX_POOL_SIZE
+    # are in use (None waits until SERVER_SELECTION_TIMEOUT_MS), and idle
+    # connections are closed after MAX_IDLE_TIME_MS.
+    MONGO_POOL = {
+        "MAX_POOL_SIZE"              : 100,
+        "MIN_POOL_SIZE"              : 0,
+        "MAX_IDLE_TIME_MS"           : 300000,
+        "WAIT_QUEUE_TIMEOUT_MS"      : 5000,
+        "MAX_CONNECTING"             : 2,
+        "CONNECT_TIMEOUT_MS"         : 5000,
+        "SERVER_SELECTION_TIMEOUT_MS": 10000
+    }
+    # Named MongoDB clients besides the default one (DB('analytics'),
+    # BaseModel.CONNECTION = {"CLIENT": "analytics"}). DATABASE overrides the
+    # DATABASE section per environment, POOL overrides MONGO_POOL. Reads and
+    # writes of the client use READ_PREFERENCE / READ_CONCERN / WRITE_CONCERN,
+    # see configs/database.py for their format.
+    MONGO_CLIENTS = {
+        "analytics": {
+            "DATABASE"       : {},
+            "POOL"           : {"MAX_POOL_SIZE": 10, "WAIT_QUEUE_TIMEOUT_MS": 30000},
+            "READ_PREFERENCE": "secondaryPreferred",
+            "READ_CONCERN"   : "local"
+        }
+    }
+
+    # Shared write-behind executor used by BaseModel.*_on_thread.
+    # ON_FULL decides what happens when QUEUE_SIZE operations are pending:
+    # "block" waits (up to BLOCK_TIMEOUT seconds, None = forever),
+    # "drop" discards the operation and "raise" raises WriteBehindFull.
+    WRITE_BEHIND = {
+        "WORKERS"         : 4,
+        "QUEUE_SIZE"      : 10000,
+        "BATCH_SIZE"      : 500,
+        "ON_FULL"         : "block",
+        "BLOCK_TIMEOUT"   : None,
+        "SHUTDOWN_TIMEOUT": 30
+    }
+
+    # BaseModel.bulk_upsert / bulk_update / bulk_delete split their operations
+    # into unordered bulk_write batches of BATCH_SIZE, run on WORKERS threads.
+    BULK = {
+        "BATCH_SIZE": 1000,
+        "WORKERS"   : 4
+    }
+
+    # Defaults of BaseModel.aggregate and the pipelines built on it (group,
+    # facet, top_n, iter_distinct). ALLOW_DISK_USE lets $group / $sort spill
+    # past the server's 100 MB stage memory limit; MAX_TIME_MS 0 means no limit.
+    AGGREGATE = {
+        "BATCH_SIZE"    : 1000,
+        "ALLOW_DISK_USE": False,
+        "MAX_TIME_MS"   : 0
+    }
+
+    # Batched /test/implementation requests: at most MAX_OPERATIONS per
+    # request, independent operations run on WORKERS threads.
+    DISPATCH = {
+        "WORKERS"       : 8,
+        "MAX_OPERATIONS": 100
+    }
+
+    # Request logging into request_logs (monitoring/request_logging.py).
+    # SAMPLE_RATE is the fraction of requests logged (5xx are always logged
+    # with ALWAYS_LOG_ERRORS). Entries are flushed with insert_many every
+    # FLUSH_INTERVAL seconds or per BATCH_SIZE; past MAX_BUFFERED pending
+    # entries new ones are dropped instead of slowing requests down.
+    # LAYOUT is "timeseries", "capped" or "regular" (TTL index).
+    REQUEST_LOGS = {
+        "ENABLED"          : True,
+        "SAMPLE_RATE"      : 1.0,
+        "ALWAYS_LOG_ERRORS": True,
+        "SKIP_PATHS"       : ["/metrics"],
+        "BATCH_SIZE"       : 500,
+        "FLUSH_INTERVAL"   : 2,
+        "MAX_BUFFERED"     : 10000,
+        "LAYOUT"           : "timeseries",
+        "TTL_DAYS"         : 30,
+        "CAPPED_SIZE_MB"   : 512,
+        "CREATE_COLLECTION": True
+    }
+
+    # Production server (gunicorn.conf.py). WORKERS = None uses
+    # $WEB_CONCURRENCY or 2 x CPUs + 1. Each worker serves THREADS requests
+    # at once and is replaced after MAX_REQUESTS (+ up to MAX_REQUESTS_JITTER)
+    # requests. On shutdown in-flight requests get GRACEFUL_TIMEOUT seconds,
+    # then queued background writes get DRAIN_TIMEOUT seconds to finish.
+    SERVER = {
+        "BIND"               : "0.0.0.0:5000",
+        "WORKERS"            : None,
+        "THREADS"            : 4,
+        "KEEPALIVE"          : 5,
+        "MAX_REQUESTS"       : 10000,
+        "MAX_REQUESTS_JITTER": 1000,
+        "TIMEOUT"            : 30,
+        "GRACEFUL_TIMEOUT"   : 30,
+        "DRAIN_TIMEOUT"      : 20,
+        "BACKLOG"            : 2048
+    }
+
+    # Declared model indexes (BaseModel.INDEXES, models/indexes.py).
+    # With SYNC_ON_STARTUP the missing ones are created when the server
+    # starts; otherwise run `flask --app app sync-indexes`.
+    INDEXES = {
+        "SYNC_ON_STARTUP": False
+    }
+
+    # Prints a warning when a BaseModel query shape is answered by a
+    # COLLSCAN over at least MIN_DOCUMENTS documents (monitoring/query_guard.py).
+    # Each shape is explained once per process, at most MAX_SHAPES of them.
+    QUERY_GUARD = {
+        "ENABLED"         : True,
+        "DEVELOPMENT_ONLY": True,
+        "MIN_DOCUMENTS"   : 1000,
+        "MAX_SHAPES"      : 10000
+    }
+
+    # Job queue on scheduler_data (models/job_queue.py), run with
+    # `flask --app app jobs-worker`. A claimed job is leased for LEASE_SECONDS
+    # and renewed every HEARTBEAT_SECONDS while it runs; failures are retried
+    # after BACKOFF_BASE * 2^(attempt-1) seconds (at most BACKOFF_MAX) until
+    # MAX_ATTEMPTS runs. Finished jobs are kept RETENTION_SECONDS.
+    # HANDLER_MODULES are imported by the worker to register @job handlers.
+    JOBS = {
+        "HANDLER_MODULES"     : [],
+        "CONCURRENCY"         : 4,
+        "MODE"                : "thread",
+        "PROCESS_START_METHOD": "spawn",
+        "LEASE_SECONDS"       : 60,
+        "HEARTBEAT_SECONDS"   : 15,
+        "RECOVER_INTERVAL"    : 30,
+        "POLL_INTERVAL"       : 1.0,
+        "MAX_POLL_INTERVAL"   : 5.0,
+        "MAX_ATTEMPTS"        : 5,
+        "BACKOFF_BASE"        : 5,
+        "BACKOFF_MAX"         : 3600,
+        "RETENTION_SECONDS"   : 604800,
+        "DRAIN_TIMEOUT"       : 30
+    }
+
+    # Identical concurrent BaseModel.find_all / find_one calls share one query
+    # (models/single_flight.py). With REDIS, workers coordinate through a lock
+    # held up to LOCK_TTL seconds; the others wait up to WAIT_TIMEOUT for the
+    # result, handed over for HANDOFF_TTL seconds when it has at most
+    # MAX_DOCUMENTS documents and someone is waiting for it.
+    SINGLE_FLIGHT = {
+        "ENABLED"      : True,
+        "REDIS"        : True,
+        "LOCK_TTL"     : 5,
+        "WAIT_TIMEOUT" : 5,
+        "HANDOFF_TTL"  : 2,
+        "MAX_DOCUMENTS": 1000,
+        "RETRY_SECONDS": 30
+    }
+
+    # Rate and concurrency limits of /test/implementation (models/rate_limiter.py).
+    # A rule is {"RATE": requests per second, "BURST": bucket size,
+    # "CONCURRENCY": requests in flight}. DEFAULT / TOKENS apply per auth
+    # token, METHODS and COLLECTIONS to all clients together. Over a limit
+    # the request gets a 429 with Retry-After. Without Redis the limits are
+    # enforced per process, and Redis is retried after RETRY_SECONDS.
+    ADMISSION = {
+        "ENABLED"      : True,
+        "KEY_PREFIX"   : "admission:",
+        "REDIS_DB"     : 0,
+        "DEFAULT"      : {"RATE": 100, "BURST": 200, "CONCURRENCY": 32},
+        "TOKENS"       : {},
+        "METHODS"      : {
+            "test_mongo_get_all": {"CONCURRENCY": 8},
+            "test_redis_flush"  : {"RATE": 0.1, "BURST": 1}
+        },
+        "COLLECTIONS"  : {},
+        "SLOT_TTL"     : 60,
+        "RETRY_SECONDS": 5
+    }
+
+    # In-memory mirrors of models declaring MIRROR (models/mirror.py), off
+    # unless ENABLED. Reads fall back to MongoDB when the last confirmed sync
+    # is older than MAX_STALENESS seconds. Without a replica set, documents
+    # with a newer UPDATED_FIELD (stamped by BaseModel writes) are polled
+    # every POLL_INTERVAL seconds (looking POLL_OVERLAP seconds back) and the
+    # collection is reloaded every RESYNC_SECONDS, which bounds how long
+    # deletes by other processes stay visible. Collections over MAX_DOCUMENTS
+    # are not mirrored.
+    MIRRORS = {
+        "ENABLED"        : False,
+        "LOAD_ON_STARTUP": True,
+        "MAX_STALENESS"  : 30,
+        "MAX_DOCUMENTS"  : 100000,
+        "MAX_AWAIT_MS"   : 1000,
+        "UPDATED_FIELD"  : "updatedAt",
+        "POLL_INTERVAL"  : 2,
+        "POLL_OVERLAP"   : 5,
+        "RESYNC_SECONDS" : 300,
+        "RETRY_SECONDS"  : 5
+    }
+
+    # helper.handle_errors. Errors are counted per fingerprint (exception type
+    # and raising line); a traceback is formatted for the first error of a
+    # fingerprint, then for SAMPLE_RATE of its errors and at most
+    # TRACEBACKS_PER_MINUTE times a minute. Clients get it only with
+    # INCLUDE_TRACEBACK, cut to MAX_PAYLOAD characters like the message.
+    ERRORS = {
+        "INCLUDE_TRACEBACK"    : True,
+        "SAMPLE_RATE"          : 0.1,
+        "TRACEBACKS_PER_MINUTE": 6,
+        "MAX_PAYLOAD"          : 4000,
+        "MAX_FINGERPRINTS"     : 1000,
+        "LOG_TRACEBACKS"       : True
+    }
@@ -0,0 +1,113 @@
+import os
+import threading
+from config import BaseConfig
+
+"""
+Per-process connection registry
+-------------------------------
+Every long-lived client (the MongoClient, Redis connection pools) and every
+background thread pool is created through `per_process`: lazily, on first
+use, and at most once per process. Nothing connects at import time.
+
+Clients and threads do not survive a fork, so the registry is emptied in a
+forked child (pre-fork servers such as gunicorn) and each worker builds its
+own on first use. Objects inherited from the parent are dropped, not closed:
+closing them would also close the parent's sockets.
+
+Settings come from the app passed to `init_app` (create_app does this), or
+from config.BaseConfig for scripts that never build an app:
+
+    from configs.connections import setting, env_verb
+    database = setting('DATABASE')[env_verb()]
+"""
+
+_settings  = None
+_resources = {}
+_pid       = os.getpid()
+_lock      = threading.RLock()
+
+
+def init_app(app) -> None:
+    """
+    Makes the registry read its settings from `app.config`.
+    Existing clients are kept; call this before the first query.
+    """
+    global _settings
+    _settings = app.config
+    app.extensions['connections'] = _resources
+
+
+def setting(name: str, default=None):
+    """
+    Returns a config value from the app given to init_app, or from
+    BaseConfig when no app was registered.
+    """
+    if _settings is not None:
+        return _settings.get(name, default)
+    return getattr(BaseConfig, name, default)
+
+
+def env_verb() -> str:
+    """
+    "LOCAL" when FLASK_ENV is development, "PROD" otherwise.
+    Picks the section of DATABASE / REDIS to connect to.
+    """
+    return "LOCAL" if os.environ.get('FLASK_ENV') == 'development' else "PROD"
+
+
+def per_process(key, factory):
+    """
+    Returns the resource registered under `key` for this process,
+    calling `factory()` to create it the first time.
+
+    Args:
+        key (hashable): Name of the resource, e.g. ('mongo', 'default') or ('redis', host, port, db, ssl).
+        factory (callable): Builds the resource. Called at most once per process.
+    """
+    _check_pid()
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = factory()
+                _resources[key] = resource
+    return resource
+
+
+def release(key):
+    """
+    Removes the resource registered under `key` from this process and
+    returns it (or None), so the next per_process call creates a new one.
+    """
+    _check_pid()
+    with _lock:
+        return _resources.pop(key, None)
+
+
+def resources(kind: str = None) -> dict:
+    """
+    Returns the resources created so far in this process. With `kind`,
+    only tuple keys starting with it, e.g. resources('redis').
+    """
+    _check_pid()
+    items = dict(_resources)
+    if kind is None:
+        return items
+    return {key: value for key, value in items.items() if isinstance(key, tuple) and key[0] == kind}
+
+
+def _check_pid() -> None:
+    # covers forks that bypass os.register_at_fork (e.g. multiprocessing with fork in C code)
+    if _pid != os.getpid():
+        _forget()
+
+
+def _forget() -> None:
+    global _pid, _lock
+    _lock      = threading.RLock()
+    _pid       = os.getpid()
+    _resources.clear()
+
+
+os.register_at_fork(after_in_child=_forget)
@@ -1,36 +1,193 @@
-from flask import Flask
-from flask_pymongo import PyMongo
-from os import environ
+import asyncio
+import os
+from pymongo import MongoClient, ReadPreference
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from pymongo.write_concern import WriteConcern
+from configs.connections import per_process, setting, env_verb
+from monitoring.metrics import MongoCommandMetrics, MongoPoolMetrics
 
-# Create a Flask application
-app = Flask(__name__)
+"""
+MongoDB clients
+-------------------------------
+The default client connects to BaseConfig.DATABASE. MONGO_CLIENTS declares
+more, by name, e.g. an analytics client reading from secondaries with its
+own, smaller pool so long reports cannot starve the request path:
 
-# Check if the environment is development or production
-# and load environment variables from a config file
-env_verb   = "LOCAL" if environ['FLASK_ENV'] == 'development' else "PROD"
-app.config.from_object('config.BaseConfig')
+    DB()                     default client's database
+    DB('analytics')          the analytics client's database
+    mongo_client('analytics')
 
-# Get the database name, host, port, username, and
-# password from environment variables
-database   = app.config['DATABASE'][env_verb]
-mongo_db   = database["NAME"]
-mongo_host = database["HOST"]
-mongo_port = database["PORT"]
-mongo_user = database["USER"]
-mongo_pass = database["PASS"]
-mongo_sfx  = database["SUFFIX"]
+Every client is created on first use, once per process, with the pool
+settings of MONGO_POOL (overridable per client) and a pool listener whose
+counters are returned by pool_stats().
 
-# Construct the MongoDB connection string
-mongo_url = f"mongodb://{mongo_user}:{mongo_pass}@{mongo_host}:{mongo_port}/{mongo_db}?{mongo_sfx}"
-print('MONGO_URL: ', mongo_url)
+Read preference, read concern and write concern can be set per client
+(MONGO_CLIENTS), per model (BaseModel.CONNECTION) or per call
+(BaseModel.using). Read preferences are a mode name ("secondaryPreferred")
+or {"MODE": ..., "TAGS": [{"dc": "east"}, {}], "MAX_STALENESS": 90}; write
+concerns a dict such as {"w": "majority", "wtimeout": 5000}.
+"""
 
-app.config["MONGO_URI"] = mongo_url
+DEFAULT_CLIENT = 'default'
 
-mongo = PyMongo(app)
-db    = mongo.db
+# a forked worker starts counting from zero, like its clients
+_pool_listeners = {}
+os.register_at_fork(after_in_child=_pool_listeners.clear)
 
-def DB():
-    return mongo.db
+
+def database_settings(client: str = None) -> dict:
+    """
+    Returns the DATABASE section for the current environment (LOCAL / PROD),
+    with the overrides of a named client from MONGO_CLIENTS.
+    """
+    database = setting('DATABASE')[env_verb()]
+    if client and client != DEFAULT_CLIENT:
+        overrides = client_settings(client).get("DATABASE", {}).get(env_verb(), {})
+        database  = {**database, **overrides}
+    return database
+
+
+def client_settings(client: str = None) -> dict:
+    """
+    Returns the MONGO_CLIENTS entry of a named client ({} for the default one).
+    Raises KeyError for a name that is not declared.
+    """
+    if not client or client == DEFAULT_CLIENT:
+        return {}
+    clients = setting('MONGO_CLIENTS', {})
+    if client not in clients:
+        raise KeyError(f"Unknown MongoDB client {client!r}, declare it in BaseConfig.MONGO_CLIENTS")
+    return clients[client]
+
+
+def mongo_url(client: str = None) -> str:
+    """
+    Builds the MongoDB connection string from the DATABASE settings.
+    Contains the password: never print or log it.
+    """
+    database = database_settings(client)
+    return (f"mongodb://{database['USER']}:{database['PASS']}@{database['HOST']}:{database['PORT']}"
+            f"/{database['NAME']}?{database['SUFFIX']}")
+
+
+def pool_options(client: str = None) -> dict:
+    """
+    MongoClient pool arguments from BaseConfig.MONGO_POOL and the client's
+    POOL overrides, shared by the sync and async clients.
+    """
+    pool = {**setting('MONGO_POOL', {}), **client_settings(client).get("POOL", {})}
+    return {
+        'maxPoolSize'             : pool.get('MAX_POOL_SIZE', 100),
+        'minPoolSize'             : pool.get('MIN_POOL_SIZE', 0),
+        'maxIdleTimeMS'           : pool.get('MAX_IDLE_TIME_MS'),
+        'waitQueueTimeoutMS'      : pool.get('WAIT_QUEUE_TIMEOUT_MS'),
+        'maxConnecting'           : pool.get('MAX_CONNECTING', 2),
+        'connectTimeoutMS'        : pool.get('CONNECT_TIMEOUT_MS', 20000),
+        'serverSelectionTimeoutMS': pool.get('SERVER_SELECTION_TIMEOUT_MS', 30000),
+    }
+
+
+def pool_listener(client: str = None) -> MongoPoolMetrics:
+    """
+    Returns the pool listener of a named client, shared by its sync and
+    async MongoClients.
+    """
+    client   = client or DEFAULT_CLIENT
+    listener = _pool_listeners.get(client)
+    if listener is None:
+        listener = _pool_listeners.setdefault(client, MongoPoolMetrics(client))
+    return listener
+
+
+def read_preference(value):
+    """
+    "secondaryPreferred" | {"MODE", "TAGS", "MAX_STALENESS"} | a pymongo
+    read preference -> a pymongo read preference. None stays None.
+    """
+    if not isinstance(value, (str, dict)):
+        return value
+    if isinstance(value, str):
+        value = {"MODE": value}
+    mode = read_pref_mode_from_name(value["MODE"])
+    if mode == ReadPreference.PRIMARY.mode:
+        return ReadPreference.PRIMARY
+    return make_read_preference(mode, value.get("TAGS"), value.get("MAX_STALENESS", -1))
+
+
+def collection_options(read_preference_value=None, read_concern=None, write_concern=None) -> dict:
+    """
+    Keyword arguments of get_database / with_options for the given read
+    preference, read concern ("majority", "local", ...) and write concern
+    ({"w": "majority"}, 1, ...). Unset ones are left out.
+    """
+    options = {}
+    if read_preference_value is not None:
+        options['read_preference'] = read_preference(read_preference_value)
+    if read_concern is not None:
+        options['read_concern'] = read_concern if isinstance(read_concern, ReadConcern) else ReadConcern(read_concern)
+    if write_concern is not None:
+        if isinstance(write_concern, WriteConcern):
+            options['write_concern'] = write_concern
+        elif isinstance(write_concern, dict):
+            options['write_concern'] = WriteConcern(**write_concern)
+        else:
+            options['write_concern'] = WriteConcern(w=write_concern)
+    return options
+
+
+def _database_options(client: str = None) -> dict:
+    entry = client_settings(client)
+    return collection_options(entry.get("READ_PREFERENCE"), entry.get("READ_CONCERN"), entry.get("WRITE_CONCERN"))
+
+
+def mongo_client(client: str = None) -> MongoClient:
+    """
+    Returns this process's MongoClient of a named client (the default one
+    without a name), created on first use. pymongo clients are not
+    fork-safe, so a forked worker gets its own.
+    """
+    client = client or DEFAULT_CLIENT
+    return per_process(('mongo', client), lambda: MongoClient(
+        mongo_url(client),
+        event_listeners=[MongoCommandMetrics(), pool_listener(client)],
+        **pool_options(client)
+    ))
+
+
+def DB(client: str = None):
+    """
+    Returns the database of a named client (the default one without a name),
+    with the client's read / write settings from MONGO_CLIENTS.
+    """
+    return mongo_client(client).get_database(database_settings(client)['NAME'], **_database_options(client))
+
+
+def pool_stats() -> dict:
+    """
+    Returns the pool counters of every client used so far in this process,
+    keyed by client name: connections open and in use, checkout waits and failures.
+    """
+    return {client: listener.stats() for client, listener in _pool_listeners.items()}
+
+def AsyncDB(client: str = None):
+    """
+    Returns the motor database handle of a named client (the default one
+    without a name) for the running event loop. Must be called from inside
+    a coroutine. Async views all run on the process's background loop
+    (configs/event_loop.py), so they share one motor client per name.
+    """
+    # motor is only needed by async views, keep it out of the startup imports
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from configs.event_loop import per_loop
+
+    client = client or DEFAULT_CLIENT
+    motor  = per_loop('motor', (client,), lambda: AsyncIOMotorClient(
+        mongo_url(client), io_loop=asyncio.get_running_loop(),
+        event_listeners=[MongoCommandMetrics(), pool_listener(client)],
+        **pool_options(client)
+    ), close=lambda motor: motor.close())
+    return motor.get_database(database_settings(client)['NAME'], **_database_options(client))
 
 def check_mongo_connection():
     """
@@ -38,7 +195,7 @@ def check_mongo_connection():
     """
     try:
         # Attempt to list all the collections in the database
-        collections = mongo.db.list_collection_names()
+        collections = DB().list_collection_names()
 
         return {
             'status'     : True,
@@ -49,4 +206,4 @@ def check_mongo_connection():
         return {
             'status': False,
             'message': str(e)
-        }
\ No newline at end of file
+        }
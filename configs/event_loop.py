@@ -0,0 +1,151 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import Future
+from configs.connections import per_process, release, resources
+
+"""
+One event loop per process for async views
+-------------------------------
+Flask runs an async view by creating a new event loop for every call
+(asgiref's AsyncToSync). Motor clients and redis.asyncio pools are bound to
+the loop they were created on, so every request would build its own.
+
+`init_app` makes Flask run async views on one long-lived loop instead,
+running forever on a daemon thread of this process. The calling thread waits
+for the result, with its context variables (request, g, app) copied into the
+task:
+
+    @bp.route("/users")
+    async def users():
+        return await AsyncBaseModel("users").find_all({})
+
+Loop-bound clients are registered with `per_loop`, next to the per-process
+ones, and closed by configs/lifecycle.close_connections. Clients of a loop
+that was closed meanwhile (a script's asyncio.run) are dropped on next use.
+"""
+
+
+class LoopThread:
+
+    def __init__(self, name: str = "async-loop"):
+        """
+        Initializes the LoopThread class and starts its thread.
+
+        Args:
+            name (str): Name of the thread running the loop.
+        """
+        self.loop   = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine) -> Future:
+        """
+        Schedules a coroutine on the loop, in a copy of the caller's context,
+        and returns a concurrent Future of its result.
+        """
+        context = contextvars.copy_context()
+        done    = Future()
+
+        def resolve(task: asyncio.Task) -> None:
+            if task.cancelled():
+                done.cancel()
+            elif task.exception() is not None:
+                done.set_exception(task.exception())
+            else:
+                done.set_result(task.result())
+
+        def start() -> None:
+            if not done.set_running_or_notify_cancel():
+                coroutine.close()
+                return
+            # created inside the copied context, the task runs in it
+            context.run(self.loop.create_task, coroutine).add_done_callback(resolve)
+
+        self.loop.call_soon_threadsafe(start)
+        return done
+
+    def run(self, coroutine, timeout: float = None):
+        """
+        Runs a coroutine on the loop and returns its result; blocks the calling thread.
+        """
+        return self.submit(coroutine).result(timeout)
+
+    def close(self, timeout: float = 5) -> None:
+        """
+        Cancels the remaining tasks, stops the loop and joins its thread.
+        """
+        async def cancel_all():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self.loop.is_closed():
+            return
+        try:
+            self.run(cancel_all(), timeout)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+        if not self.thread.is_alive():
+            self.loop.close()
+
+
+def background_loop() -> LoopThread:
+    """
+    Returns this process's loop thread, starting it on first use.
+    A forked worker starts its own, see configs.connections.
+    """
+    return per_process('event_loop', LoopThread)
+
+
+def init_app(app) -> None:
+    """
+    Makes `app` run async views (and dispatched async handlers) on the
+    background loop instead of a new loop per call.
+    """
+    def async_to_sync(func):
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            return background_loop().run(func(*args, **kwargs))
+        return run
+
+    app.async_to_sync = async_to_sync
+
+
+def per_loop(kind: str, key: tuple, factory, close=None):
+    """
+    Returns the resource registered under (kind, running loop, *key),
+    creating it with `factory()` the first time on this loop. Must be
+    called from inside a coroutine.
+
+    Args:
+        kind (str): First element of the registry key, e.g. 'motor'.
+        key (tuple): Rest of the key, e.g. the client name.
+        factory (callable): Builds the resource on the running loop.
+        close (callable, optional): Called with the resources of loops found
+            closed, which are dropped from the registry.
+    """
+    loop = asyncio.get_running_loop()
+    for registered in resources(kind):
+        if registered[1].is_closed():
+            resource = release(registered)
+            if close is not None and resource is not None:
+                close(resource)
+    return per_process((kind, loop) + tuple(key), factory)
+
+
+def close_loop(timeout: float = 5) -> None:
+    """
+    Stops this process's loop thread, if it was started.
+    """
+    loop_thread = release('event_loop')
+    if loop_thread is not None:
+        loop_thread.close(timeout)
@@ -0,0 +1,146 @@
+import base64
+import datetime
+import decimal
+import json
+import uuid
+from collections.abc import Mapping
+from bson import ObjectId, Decimal128
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+Flask JSON provider for Mongo / Redis results
+-------------------------------
+Installed by create_app (app.json = FastJSONProvider(app)), so jsonify and
+dict return values from views go through it. Encodes with orjson when it is
+installed, else with the stdlib json module, and handles the types found in
+query results without converting the documents first:
+
+    ObjectId   -> "65f0c0ffee..."             (str)
+    datetime   -> "2024-03-01T10:00:00+00:00" (ISO 8601, naive values are UTC as stored by Mongo)
+    date       -> "2024-03-01"
+    Decimal128 -> "12.50"                     (str, keeps the exact value)
+    Decimal    -> "12.50"
+    bytes      -> the text if it is valid UTF-8, else base64
+    UUID       -> "8c3d..."
+    set        -> list
+    RawBSONDocument / namedtuple rows -> object
+
+Keys keep their insertion order. NDJSON helpers for streamed responses:
+
+    return Response(ndjson_stream(documents), mimetype=NDJSON_MIMETYPE)
+"""
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# bytes per chunk handed to the server while streaming, so a large result is
+# not written one small line (one socket send) at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def default(value):
+    """
+    Converts the values json / orjson cannot encode natively.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return base64.b64encode(value).decode('ascii')
+    if isinstance(value, datetime.datetime):
+        # stdlib path only, orjson encodes datetimes itself
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, Mapping):
+        # RawBSONDocument (BaseModel reads with raw=True)
+        return dict(value.items())
+    if isinstance(value, tuple) and hasattr(value, '_asdict'):
+        # rows of BaseModel reads with as_rows=True (orjson only, json writes tuples as lists)
+        return value._asdict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj, indent: bool = False) -> bytes:
+        """
+        Encodes obj to UTF-8 JSON bytes.
+        """
+        return orjson.dumps(obj, default=default, option=(_OPTIONS | orjson.OPT_INDENT_2) if indent else _OPTIONS)
+
+    def _loads(data):
+        return orjson.loads(data)
+else:
+    def dumps_bytes(obj, indent: bool = False) -> bytes:
+        """
+        Encodes obj to UTF-8 JSON bytes.
+        """
+        if indent:
+            return json.dumps(obj, default=default, ensure_ascii=False, indent=2).encode('utf-8')
+        return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def _loads(data):
+        return json.loads(data)
+
+
+def ndjson_stream(rows, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Encodes an iterable of rows as newline-delimited JSON, one row per line,
+    yielding chunks of about chunk_size bytes.
+    """
+    chunk = bytearray()
+    for row in rows:
+        chunk += dumps_bytes(row)
+        chunk += b'\n'
+        if len(chunk) >= chunk_size:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    JSONProvider on orjson (or json) with the BSON type handling above.
+
+    compact: None indents responses in debug mode only, like Flask's default provider.
+    """
+
+    compact  = None
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            # sort_keys, cls, ... only the stdlib encoder understands these
+            kwargs.setdefault('default', default)
+            return json.dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return _loads(s)
+
+    def response(self, *args, **kwargs):
+        obj    = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(dumps_bytes(obj, indent=indent), mimetype=self.mimetype)
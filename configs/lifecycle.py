@@ -0,0 +1,146 @@
+import asyncio
+import time
+import traceback
+from configs.connections import release, resources
+
+"""
+Worker start-up and shutdown
+-------------------------------
+Called by the gunicorn hooks in gunicorn.conf.py:
+
+    open_connections() : post_fork, creates this worker's MongoClient and
+                         Redis pool so the first request does not pay for it,
+                         and loads the in-memory mirrors (MIRRORS["LOAD_ON_STARTUP"])
+    drain(timeout)     : worker_exit, after in-flight requests finished;
+                         writes buffered request logs and queued write-behind
+                         operations, then closes the clients (async ones
+                         too) and stops the event loop of async views
+    sync_on_startup()  : on_starting (master) and the dev server, creates the
+                         declared indexes when INDEXES["SYNC_ON_STARTUP"] is set
+
+All of them are best effort: a failure is printed and the server carries on.
+"""
+
+
+def open_connections(timeout: float = 2) -> dict:
+    """
+    Creates this process's Mongo and Redis clients and checks them with a
+    ping. Returns {'mongo': bool, 'redis': bool}.
+
+    Args:
+        timeout (float): Seconds to wait for the Mongo ping, so an unreachable
+            server delays a worker's start only briefly.
+    """
+    import pymongo
+    from configs.database import mongo_client
+    from models.redis_client import RedisClient
+
+    status = {}
+    try:
+        with pymongo.timeout(timeout):
+            mongo_client().admin.command('ping')
+        status['mongo'] = True
+    except Exception:
+        print(f"startup: MongoDB is not reachable yet\n{traceback.format_exc(limit=1)}")
+        status['mongo'] = False
+
+    status['redis'] = RedisClient().check_connection()['status']
+    if not status['redis']:
+        print("startup: Redis is not reachable yet")
+
+    from config import BaseConfig
+    if status['mongo'] and BaseConfig.MIRRORS.get("LOAD_ON_STARTUP", False):
+        try:
+            from models.mirror import open_mirrors
+            status['mirrors'] = open_mirrors()
+        except Exception:
+            print(f"startup: mirrors not loaded\n{traceback.format_exc(limit=1)}")
+    return status
+
+
+def drain(timeout: float = 20) -> bool:
+    """
+    Writes everything still buffered in this process and closes its
+    clients. Returns True if all background writes finished in time.
+
+    Args:
+        timeout (float): Maximum number of seconds for the request logs
+            and the write-behind queue together.
+    """
+    import pymongo
+
+    deadline = time.monotonic() + timeout
+    drained  = True
+
+    try:
+        from monitoring.request_logging import buffer
+        # an unreachable Mongo must not hold the worker past the deadline
+        with pymongo.timeout(timeout / 2):
+            buffer.flush()
+    except Exception:
+        print(traceback.format_exc())
+
+    # only touch what this process actually created
+    created  = resources()
+    executor = created.get('write_behind')
+    if executor is not None:
+        drained = executor.shutdown(max(0.0, deadline - time.monotonic()))
+        if not drained:
+            print(f"shutdown: write-behind queue not drained, {executor.queue_depth()} operations lost")
+
+    for name in ('bulk_executor', 'dispatch_executor'):
+        if created.get(name) is not None:
+            created[name].shutdown(wait=True)
+
+    for mirror in resources('mirror').values():
+        mirror.stop()
+
+    close_connections()
+    return drained
+
+
+def close_connections(timeout: float = 5) -> None:
+    """
+    Closes and forgets this process's Mongo clients and Redis pools, the
+    async ones of its event loop (configs/event_loop.py), then stops that
+    loop. They are created again on next use.
+
+    Args:
+        timeout (float): Seconds allowed for disconnecting the async Redis
+            pools and stopping the loop.
+    """
+    from configs.event_loop import close_loop
+
+    for key in resources('mongo'):
+        release(key).close()
+    for key in resources('redis'):
+        release(key).disconnect()
+
+    for key in resources('motor'):
+        release(key).close()
+    for key in resources('async_redis'):
+        loop, pool = key[1], release(key)
+        if loop.is_closed() or not loop.is_running():
+            continue
+        try:
+            # asyncio connections are closed on their own loop
+            asyncio.run_coroutine_threadsafe(pool.disconnect(), loop).result(timeout)
+        except Exception:
+            print(traceback.format_exc())
+    close_loop(timeout)
+
+
+def sync_on_startup() -> None:
+    """
+    Creates missing declared indexes when BaseConfig.INDEXES["SYNC_ON_STARTUP"]
+    is set, then closes the client again so nothing is inherited by forked workers.
+    """
+    from config import BaseConfig
+    if not BaseConfig.INDEXES.get("SYNC_ON_STARTUP", False):
+        return
+
+    from models.indexes import sync_indexes
+    for collection, report in sync_indexes().items():
+        if report.get('error') or report.get('conflicts') or report.get('created'):
+            print(f"indexes: {collection}: {report}")
+    close_connections()
@@ -0,0 +1,148 @@
+import traceback
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, Response
+from config import BaseConfig
+from configs.connections import per_process
+
+"""
+Operation dispatcher behind /test/implementation
+-------------------------------
+Every callable method is declared once in a handler table:
+
+    Handler(func, args, lane, batch, streams)
+
+    func  : the controller function
+    args  : parameters -> positional arguments for func
+    lane  : parameters -> key of the resource the operation touches
+            (a collection, a Redis db) or None for "independent"
+    batch : optional, list of parameters -> list of results, used instead of
+            calling func once per operation for a run of consecutive
+            operations of the same method in the same lane. An exception
+            in the returned list fails that operation only
+    streams : optional, parameters -> True when func would answer with a
+            streaming Response; such operations are refused in a batch,
+            a stream cannot be read outside its own request
+
+A batch of operations is split into lanes. Lanes run concurrently on a
+bounded thread pool; inside a lane operations run in request order, so
+a write followed by a read of the same collection stays consistent.
+Results come back in request order.
+"""
+
+Handler = namedtuple('Handler', ['func', 'args', 'lane', 'batch', 'streams'], defaults=[None, None])
+
+def _executor() -> ThreadPoolExecutor:
+    return per_process('dispatch_executor', lambda: ThreadPoolExecutor(
+        max_workers=BaseConfig.DISPATCH.get("WORKERS", 8),
+        thread_name_prefix="dispatch"
+    ))
+
+
+class OperationDispatcher:
+
+    def __init__(self, handlers: dict):
+        """
+        Initializes the OperationDispatcher class and validates the handler
+        table once, so a bad entry fails at import instead of per request.
+
+        Args:
+            handlers (dict): {method name: Handler}
+        """
+        for name, handler in handlers.items():
+            if not isinstance(handler, Handler):
+                raise TypeError(f"handler '{name}' must be a Handler")
+            for field in ('func', 'args', 'lane'):
+                if not callable(getattr(handler, field)):
+                    raise TypeError(f"handler '{name}'.{field} is not callable")
+            for field in ('batch', 'streams'):
+                if getattr(handler, field) is not None and not callable(getattr(handler, field)):
+                    raise TypeError(f"handler '{name}'.{field} is not callable")
+        self.handlers = dict(handlers)
+
+    def handler(self, method_name: str) -> Handler:
+        handler = self.handlers.get(method_name)
+        if handler is None:
+            raise ValueError(f"Unknown method '{method_name}'")
+        return handler
+
+    def call(self, method_name: str, parameters: dict):
+        """
+        Runs a single operation and returns the controller's result.
+        """
+        handler = self.handler(method_name)
+        return current_app.ensure_sync(handler.func)(*handler.args(parameters))
+
+    def run_batch(self, operations: list) -> list:
+        """
+        Runs a list of {'method': str, 'data': dict} operations and returns one
+        entry per operation, in order:
+            {'method': str, 'status': True, 'result': ...} or
+            {'method': str, 'status': False, 'message': str}
+        """
+        limit = BaseConfig.DISPATCH.get("MAX_OPERATIONS", 100)
+        if len(operations) > limit:
+            raise ValueError(f"Too many operations: {len(operations)} (max {limit})")
+
+        # validate everything before running anything
+        lanes   = {}
+        results = [None] * len(operations)
+        for index, operation in enumerate(operations):
+            method_name = operation.get('method')
+            parameters  = operation.get('data') or {}
+            handler     = self.handler(method_name)
+            if handler.streams is not None and handler.streams(parameters):
+                results[index] = {'method': method_name, 'status': False,
+                                  'message': f"Streaming '{method_name}' is not supported in batched operations"}
+                continue
+            lane = handler.lane(parameters)
+            key  = ('lane', lane) if lane is not None else ('single', index)
+            lanes.setdefault(key, []).append((index, method_name, parameters))
+
+        app   = current_app._get_current_object()
+        tasks   = [_executor().submit(self._run_lane, app, lane, results) for lane in lanes.values()]
+        for task in tasks:
+            task.result()
+        return results
+
+    def _run_lane(self, app, lane: list, results: list) -> None:
+        with app.app_context():
+            position = 0
+            while position < len(lane):
+                method_name = lane[position][1]
+                handler     = self.handlers[method_name]
+                run         = [lane[position]]
+                if handler.batch is not None:
+                    while position + len(run) < len(lane) and lane[position + len(run)][1] == method_name:
+                        run.append(lane[position + len(run)])
+                position += len(run)
+
+                if len(run) > 1:
+                    self._run_batched(handler, run, results)
+                else:
+                    index, _, parameters = run[0]
+                    results[index] = self._run_one(method_name, parameters)
+
+    def _run_batched(self, handler: Handler, run: list, results: list) -> None:
+        try:
+            values = handler.batch([parameters for _, _, parameters in run])
+        except Exception as e:
+            print(traceback.format_exc())
+            for index, method_name, _ in run:
+                results[index] = {'method': method_name, 'status': False, 'message': str(e)}
+            return
+        for (index, method_name, _), value in zip(run, values):
+            if isinstance(value, Exception):
+                results[index] = {'method': method_name, 'status': False, 'message': str(value)}
+            else:
+                results[index] = {'method': method_name, 'status': True, 'result': value}
+
+    def _run_one(self, method_name: str, parameters: dict) -> dict:
+        try:
+            value = self.call(method_name, parameters)
+        except Exception as e:
+            print(traceback.format_exc())
+            return {'method': method_name, 'status': False, 'message': str(e)}
+        if isinstance(value, Response):
+            return {'method': method_name, 'status': False, 'message': 'Streaming responses are not supported in batched operations'}
+        return {'method': method_name, 'status': True, 'result': value}
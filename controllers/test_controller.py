@@ -1,9 +1,19 @@
 # ----- IMPORTS STARTS -----------------
+import asyncio
 import traceback
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
+from pymongo.errors import BulkWriteError, WriteError
 from models.base_model import BaseModel
-# from models.redis_client import RedisClient
-from configs.database import check_mongo_connection
+from models.async_base_model import AsyncBaseModel
+from models.redis_client import RedisClient
+from models.async_redis_client import AsyncRedisClient
+from configs.database import check_mongo_connection, pool_stats as mongo_pool_stats
+from configs.json_provider import dumps_bytes, ndjson_stream, NDJSON_MIMETYPE
+from models.job_queue import get_job_queue
+from models.rate_limiter import get_rate_limiter, retry_after_header, RateLimited
+from controllers.dispatch import OperationDispatcher, Handler
+from models.mirror import mirror_stats
+from helper import errorStats
 # ----- IMPORTS ENDS  -----------------
 
 
@@ -40,8 +50,52 @@ def test_mongo_get(collection:str, data:dict):
     }
 
 # mongo get all from specific collection
-def test_mongo_get_all(collection:str):
-    data = TestMongo(collection).find_all()
+# options (all optional):
+#   stream       -> stream the whole collection as one JSON body, or with
+#                   "ndjson" as application/x-ndjson, one document per line
+#   batch_size   -> documents per Mongo round trip while streaming
+#   page_size    -> return a single keyset page instead of everything
+#   resume_token -> `next_token` from the previous page
+#   projection   -> only these fields, e.g. ["name", "plan.tier"]
+#   raw          -> decode lazily (RawBSONDocument), for pass-through reads
+def test_mongo_get_all(collection:str, options:dict=None):
+    options = options or {}
+    model   = TestMongo(collection)
+
+    if options.get('page_size'):
+        page = model.find_page(
+            options.get('filter', {}),
+            page_size    = int(options['page_size']),
+            resume_token = options.get('resume_token'),
+            projection   = options.get('projection')
+        )
+        return {
+            "status"    : "Success",
+            "collection": collection,
+            "data"      : page['data'],
+            "next_token": page['next_token']
+        }
+
+    if options.get('stream'):
+        documents = model.iter_all(
+            options.get('filter', {}),
+            batch_size = int(options.get('batch_size', 1000)),
+            projection = options.get('projection'),
+            raw        = bool(options.get('raw'))
+        )
+
+        if options['stream'] == 'ndjson':
+            return Response(stream_with_context(ndjson_stream(documents)), mimetype=NDJSON_MIMETYPE)
+
+        def generate():
+            yield b'{"status":"Success","collection":' + dumps_bytes(collection) + b',"data":['
+            for index, document in enumerate(documents):
+                yield (b',' if index else b'') + dumps_bytes(document)
+            yield b']}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+    data = model.find_all(options.get('filter', {}), projection=options.get('projection'), raw=bool(options.get('raw')))
     return {
         "status"    : "Success",
         "collection": collection,
@@ -127,8 +181,33 @@ def test_redis_get(key:str):
     }
 
 # redis get all keys
-def test_redis_get_all():
-    check = RedisClient().get_all()
+# options (all optional):
+#   pattern -> only keys matching this pattern
+#   count   -> keys per SCAN page / MGET batch
+#   stream  -> stream the pairs as one JSON body instead of building it in memory,
+#              or with "ndjson" as application/x-ndjson, one {"key", "value"} per line
+def test_redis_get_all(options:dict=None):
+    options = options or {}
+    client  = RedisClient()
+    pattern = options.get('pattern', '*')
+    count   = int(options.get('count', 1000))
+
+    if options.get('stream'):
+        items = client.scan_items(pattern, count=count)
+
+        if options['stream'] == 'ndjson':
+            rows = ({"key": key, "value": value} for key, value in items)
+            return Response(stream_with_context(ndjson_stream(rows)), mimetype=NDJSON_MIMETYPE)
+
+        def generate():
+            yield b'{"status":"Success","data":{'
+            for index, (key, value) in enumerate(items):
+                yield (b',' if index else b'') + dumps_bytes(key) + b':' + dumps_bytes(value)
+            yield b'}}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+    check = dict(client.scan_items(pattern, count=count))
     return {
         "status": "Success",
         "data": check
@@ -151,64 +230,243 @@ def test_redis_flush():
         "message": str(check)
     }
 
+# ======================================
+#     ASYNC TEST ROUTES
+# ======================================
+# mongo and redis connection checked concurrently
+async def test_async_connections():
+    async def mongo_check():
+        try:
+            collections = await AsyncBaseModel('test').db.list_collection_names()
+            return {'status': True, 'collections': collections}
+        except Exception as e:
+            return {'status': False, 'message': str(e)}
+
+    mongo, redis = await asyncio.gather(mongo_check(), AsyncRedisClient().check_connection())
+    return {
+        "status": "Success" if mongo['status'] and redis['status'] else "Error",
+        "mongo" : mongo,
+        "redis" : redis
+    }
+
+# mongo documents and their total count fetched concurrently
+async def test_async_mongo_get(collection:str, data:dict):
+    model            = AsyncBaseModel(collection)
+    documents, total = await asyncio.gather(model.find_all(data), model.count(data))
+    return {
+        "status"    : "Success",
+        "collection": collection,
+        "total"     : total,
+        "data"      : documents
+    }
+
 # data encode using frowzy and secret
 def test_data_encode(cdc:str, secret:str, key:str):
     return {
         'tangled': data_tangle(cdc, secret, key)
     }
 
-def test_implementation():
-    try:
-        token = request.headers.get('auth-token')
-        if token == "jkeehitf9922496ec864c9b1jjkk78725d22f29bae753da6b52e17gghyu67545kk":
-            request_data = request.json
-            method_name  = request_data['method']
-            parameters   = request_data['data'] if 'data' in request_data else {}
-            collection   = parameters['collection'] if 'collection' in parameters else None
-            func         = globals()[method_name]
-
-            if 'data' in parameters and len(parameters['data']) != 0:
-
-                if method_name in ["test_mongo_insert","test_mongo_get","test_mongo_get_all","test_mongo_delete"]:
-                    result = func(*(collection, parameters['data']))
-
-                elif method_name in ["test_mongo_update", "test_mongo_upsert"]:
-                    search = parameters['data']['filter']
-                    update = parameters['data']['update']
-                    result = func(*(collection, search, update))
-
-                else:
-                    result = func(*parameters)
-            else:
-                if collection:
-                    result = func(collection)
-
-                else:
-                    if method_name in ["test_redis_store"]:
-                        key    = parameters['key']
-                        value  = parameters['value']
-                        expire = parameters['expire'] if parameters['expire'] else 0
-                        result = func(*(key, value, expire))
+# ======================================
+#     JOB QUEUE TEST ROUTES
+# ======================================
+# add a job to scheduler_data; options: priority, delay, max_attempts, key
+def test_jobs_enqueue(name:str, payload:dict=None, options:dict=None):
+    options = options or {}
+    job_id  = get_job_queue().enqueue(
+        name,
+        payload,
+        priority     = int(options.get('priority', 0)),
+        delay        = float(options.get('delay', 0)),
+        max_attempts = options.get('max_attempts'),
+        key          = options.get('key')
+    )
+    return {
+        "status": "Success",
+        "job_id": job_id
+    }
 
-                    elif method_name in ["test_redis_get", "test_redis_delete"]:
-                        key    = parameters['key']
-                        result = func(key)
+# job counts per status, queue lag and this process's claim / run counters
+def test_jobs_stats():
+    return {
+        "status": "Success",
+        "data"  : get_job_queue().stats()
+    }
 
-                    elif method_name in ["test_data_encode"]:
-                        cdc    = parameters['cdc']
-                        key    = parameters['key']
-                        secret = parameters['secret']
-                        result = func(cdc, secret, key)
+# connection pools of this worker's MongoDB clients
+def test_mongo_pool_stats():
+    return {
+        "status": "Success",
+        "data"  : mongo_pool_stats()
+    }
 
-                    elif method_name in ["test_bmg_order_data_api"]:
-                        token     = parameters['token']
-                        order_ids = parameters['order_ids']
-                        result    = func(token, order_ids)
+# in-memory mirrors of this worker: size, sync mode, staleness
+def test_mirror_stats():
+    return {
+        "status": "Success",
+        "data"  : mirror_stats()
+    }
 
-                    else:
-                        result = func()
+# errors caught by helper.handle_errors in this worker, by fingerprint
+def test_error_stats():
+    return {
+        "status": "Success",
+        "data"  : errorStats()
+    }
 
+# ======================================
+#     DISPATCH TABLE
+# ======================================
+def _collection_args(parameters:dict) -> tuple:
+    collection = parameters.get('collection')
+    data       = parameters.get('data')
+    return (collection, data) if data else (collection,)
+
+def _filter_update_args(parameters:dict) -> tuple:
+    data = parameters['data']
+    return (parameters['collection'], data['filter'], data['update'])
+
+def _mongo_lane(parameters:dict):
+    return ('mongo', parameters.get('collection'))
+
+def _redis_lane(parameters:dict):
+    return ('redis',)
+
+def _no_args(parameters:dict) -> tuple:
+    return ()
+
+def _no_lane(parameters:dict):
+    return None
+
+# the get_all methods stream with {"stream": true | "ndjson"} in their options
+def _streams_data(parameters:dict) -> bool:
+    return bool((parameters.get('data') or {}).get('stream'))
+
+def _streams(parameters:dict) -> bool:
+    return bool(parameters.get('stream'))
+
+# consecutive inserts into one collection -> one insert_many. The insert is
+# ordered: when a document fails, the operations before it succeeded, its
+# own operation fails and the ones after it are inserted again, as if each
+# operation had been sent alone.
+def _batch_mongo_insert(operations:list) -> list:
+    collection = operations[0]['collection']
+    documents  = []
+    starts     = []
+    for parameters in operations:
+        data = parameters['data']
+        if not data:
+            raise ValueError("test_mongo_insert needs data")
+        starts.append(len(documents))
+        documents.extend(data if type(data) == list else [data])
+    ends = starts[1:] + [len(documents)]
+
+    model   = TestMongo(collection)
+    results = []
+    while len(results) < len(operations):
+        first = starts[len(results)]
+        try:
+            model.insert(documents[first:])
+            failed, error = len(documents), None
+        except BulkWriteError as e:
+            error  = e.details['writeErrors'][0]
+            failed = first + error['index']
+
+        for number in range(len(results), len(operations)):
+            if ends[number] <= failed:
+                results.append({"status": "Success", "collection": collection, "data": str(documents[starts[number]]['_id'])})
+            elif error is not None:
+                results.append(WriteError(error.get('errmsg'), error.get('code'), error))
+                break
+    return results
+
+# consecutive redis gets -> one MGET
+def _batch_redis_get(operations:list) -> list:
+    keys   = [parameters['key'] for parameters in operations]
+    values = RedisClient().mget(keys)
+    return [{"key": key, "status": "Executed", "data": value} for key, value in zip(keys, values)]
+
+# consecutive redis stores -> one MSET / pipeline
+def _batch_redis_store(operations:list) -> list:
+    mapping = {}
+    expires = {}
+    for parameters in operations:
+        mapping[parameters['key']] = parameters['value']
+        if int(parameters.get('expire') or 0) != 0:
+            expires[parameters['key']] = int(parameters['expire'])
+        else:
+            expires.pop(parameters['key'], None)
+
+    RedisClient().mset(mapping, expires if expires else None)
+    return [{"status": "Executed", "data": None} for _ in operations]
+
+# consecutive redis deletes -> one DEL
+def _batch_redis_delete(operations:list) -> list:
+    keys = [parameters['key'] for parameters in operations]
+    RedisClient().delete_many(keys)
+    return [{"key": key, "status": "Executed", "data": None} for key in keys]
+
+dispatcher = OperationDispatcher({
+    "test_mongo_connection"  : Handler(test_mongo_connection, _no_args, _no_lane),
+    "test_mongo_insert"      : Handler(test_mongo_insert, _collection_args, _mongo_lane, _batch_mongo_insert),
+    "test_mongo_get"         : Handler(test_mongo_get, _collection_args, _mongo_lane),
+    "test_mongo_get_all"     : Handler(test_mongo_get_all, _collection_args, _mongo_lane, streams=_streams_data),
+    "test_mongo_delete"      : Handler(test_mongo_delete, _collection_args, _mongo_lane),
+    "test_mongo_update"      : Handler(test_mongo_update, _filter_update_args, _mongo_lane),
+    "test_mongo_upsert"      : Handler(test_mongo_upsert, _filter_update_args, _mongo_lane),
+    "test_redis_connection"  : Handler(test_redis_connection, _no_args, _redis_lane),
+    "test_redis_store"       : Handler(test_redis_store, lambda p: (p['key'], p['value'], p.get('expire') or 0), _redis_lane, _batch_redis_store),
+    "test_redis_get_all_keys": Handler(test_redis_get_all_keys, _no_args, _redis_lane),
+    "test_redis_get"         : Handler(test_redis_get, lambda p: (p['key'],), _redis_lane, _batch_redis_get),
+    "test_redis_get_all"     : Handler(test_redis_get_all, lambda p: (p,), _redis_lane, streams=_streams),
+    "test_redis_delete"      : Handler(test_redis_delete, lambda p: (p['key'],), _redis_lane, _batch_redis_delete),
+    "test_redis_flush"       : Handler(test_redis_flush, _no_args, _redis_lane),
+    "test_async_connections" : Handler(test_async_connections, _no_args, _no_lane),
+    "test_async_mongo_get"   : Handler(test_async_mongo_get, _collection_args, _mongo_lane),
+    "test_jobs_enqueue"      : Handler(test_jobs_enqueue, lambda p: (p['name'], p.get('payload'), p.get('options')), lambda p: ('mongo', 'scheduler_data')),
+    "test_jobs_stats"        : Handler(test_jobs_stats, _no_args, lambda p: ('mongo', 'scheduler_data')),
+    "test_mongo_pool_stats"  : Handler(test_mongo_pool_stats, _no_args, _no_lane),
+    "test_mirror_stats"      : Handler(test_mirror_stats, _no_args, _no_lane),
+    "test_error_stats"       : Handler(test_error_stats, _no_args, _no_lane),
+    "test_data_encode"       : Handler(test_data_encode, lambda p: (p['cdc'], p['secret'], p['key']), _no_lane),
+})
+
+# Request body, either one operation:
+#   {"method": "test_mongo_get", "data": {"collection": "accounts", "data": {...}}}
+# or a batch, answered in order:
+#   {"operations": [{"method": ..., "data": {...}}, ...]}
+# Requests over the limits of BaseConfig.ADMISSION get a 429 with Retry-After.
+def test_implementation():
+    try:
+        token = request.headers.get('auth-token')
+        if token == "jkeehitf9922496ec864c9b1jjkk78725d22f29bae753da6b52e17gghyu67545kk":
+            request_data = request.json
 
+            if 'operations' in request_data:
+                operations = [(operation.get('method'), operation.get('data') or {}) for operation in request_data['operations']]
+                ticket     = get_rate_limiter().acquire(token, operations)
+                try:
+                    return jsonify({
+                        'status' : 'Success',
+                        'results': dispatcher.run_batch(request_data['operations'])
+                    }), 200
+                finally:
+                    ticket.release()
+
+            method_name = request_data['method']
+            parameters  = request_data['data'] if 'data' in request_data else {}
+            ticket      = get_rate_limiter().acquire(token, [(method_name, parameters)])
+            try:
+                result = dispatcher.call(method_name, parameters)
+            except BaseException:
+                ticket.release()
+                raise
+
+            if isinstance(result, Response):
+                # a streamed body is still being produced after we return
+                result.call_on_close(ticket.release)
+                return result, 200
+
+            ticket.release()
             return jsonify(result), 200
 
         else:
@@ -216,9 +474,20 @@ def test_implementation():
                 'status': 'false',
                 'message': 'Authentication failed'
             }), 401
+    except RateLimited as e:
+        return jsonify({
+            'status'     : 'false',
+            'message'    : str(e),
+            'retry_after': e.retry_after,
+        }), 429, {'Retry-After': retry_after_header(e.retry_after)}
+    except ValueError as e:
+        return jsonify({
+            'status'   : 'false',
+            'message'  : str(e),
+        }), 400
     except Exception as e:
         print(traceback.format_exc())
         return jsonify({
             'status'   : 'false',
-            'message'  : e,
-        }), 500
\ No newline at end of file
+            'message'  : str(e),
+        }), 500
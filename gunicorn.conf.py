@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import shutil
+from config import BaseConfig
+
+"""
+Production server: gunicorn with threaded workers
+-------------------------------
+    gunicorn -c gunicorn.conf.py app:app
+
+Settings come from BaseConfig.SERVER. The app is imported once in the
+master (preload_app) and shared copy-on-write by the workers; it opens no
+connections at import, each worker opens its own in post_fork.
+
+Shutdown (SIGTERM / SIGINT, or a worker reaching max_requests): the worker
+stops accepting, finishes in-flight requests for up to graceful_timeout
+seconds, then drains request logs and write-behind operations
+(configs/lifecycle.py) before exiting.
+
+Set PROMETHEUS_MULTIPROC_DIR so /metrics aggregates all workers; the
+directory is emptied when the master starts.
+"""
+
+settings = BaseConfig.SERVER
+
+bind                = os.environ.get('BIND', settings.get("BIND", "0.0.0.0:5000"))
+workers             = int(settings.get("WORKERS") or os.environ.get('WEB_CONCURRENCY') or multiprocessing.cpu_count() * 2 + 1)
+worker_class        = 'gthread'
+threads             = settings.get("THREADS", 4)
+keepalive           = settings.get("KEEPALIVE", 5)
+max_requests        = settings.get("MAX_REQUESTS", 10000)
+max_requests_jitter = settings.get("MAX_REQUESTS_JITTER", 1000)
+timeout             = settings.get("TIMEOUT", 30)
+graceful_timeout    = settings.get("GRACEFUL_TIMEOUT", 30)
+backlog             = settings.get("BACKLOG", 2048)
+preload_app         = True
+accesslog           = None
+errorlog            = '-'
+
+
+def on_starting(server):
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        # samples of a previous run would be added to the new totals
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+    from configs.lifecycle import sync_on_startup
+    sync_on_startup()
+
+
+def post_fork(server, worker):
+    from configs.lifecycle import open_connections
+    status = open_connections()
+    server.log.info("worker %s connections: %s", worker.pid, status)
+
+
+def worker_exit(server, worker):
+    from configs.lifecycle import drain
+    drain(settings.get("DRAIN_TIMEOUT", 20))
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,86 +1,246 @@
-import traceback
 import datetime
+import functools
+import random
+import threading
+import time
+import traceback
+import zlib
 from zoneinfo import ZoneInfo
-# def handle_errors(cls):
-#     """
-#     Class decorator to handle all errors in a class.
-#     """
-#     def wrap_methods(method):
-#         """
-#         Decorator function to wrap each method in the class with error handling.
-#         """
-#         def wrapped(*args, **kwargs):
-#             try:
-#                 return {
-#                     'status' : True,
-#                     'message': "Success",
-#                     'data'   : method(*args, **kwargs)
-#                 }
-#             except Exception as e:
-#                 return {
-#                     'status' : False,
-#                     'message': f"Error in {cls.__name__}.{method.__name__}: {e}",
-#                     'data'   : traceback.format_exc()
-#                 }
-#         return wrapped
-
-#     for name, method in vars(cls).items():
-#         if callable(method):
-#             setattr(cls, name, wrap_methods(method))
-
-#     return cls
 
+# handle_errors wraps a function, or every method of a class, so that it
+# returns {'status', 'message', 'data'} instead of raising. The success path
+# is a plain call. Failures are counted per fingerprint (exception type and
+# the line that raised, see errorStats) and a traceback is only formatted
+# for the first failure of a fingerprint, then for a sample of them, rate
+# limited per fingerprint. Settings live in BaseConfig.ERRORS.
+# ---------------------------------------
+class _ErrorAggregator:
+
+    def __init__(self, settings: dict):
+        """
+        Initializes the _ErrorAggregator class.
+
+        Args:
+            settings (dict): BaseConfig.ERRORS
+        """
+        self.include_traceback = settings.get("INCLUDE_TRACEBACK", True)
+        self.sample_rate       = settings.get("SAMPLE_RATE", 0.1)
+        self.per_minute        = settings.get("TRACEBACKS_PER_MINUTE", 6)
+        self.max_payload       = settings.get("MAX_PAYLOAD", 4000)
+        self.max_fingerprints  = settings.get("MAX_FINGERPRINTS", 1000)
+        self.log_tracebacks    = settings.get("LOG_TRACEBACKS", True)
+        self._entries          = {}
+        self._lock             = threading.Lock()
+
+    def record(self, where: str, error: Exception) -> dict:
+        """
+        Counts `error` raised in `where` and returns its response envelope.
+        """
+        fingerprint = _fingerprint(where, error)
+        now         = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                if len(self._entries) >= self.max_fingerprints:
+                    # past the cap, new fingerprints are only counted together
+                    fingerprint = 'other'
+                    entry       = self._entries.get(fingerprint)
+                if entry is None:
+                    entry = self._entries[fingerprint] = {
+                        'where'     : where,
+                        'type'      : type(error).__name__,
+                        'count'     : 0,
+                        'first_seen': time.time(),
+                        'traceback' : None,
+                        '_window'   : now,
+                        '_traced'   : 0,
+                    }
+            entry['count']      += 1
+            entry['last_seen']   = time.time()
+            entry['message']     = str(error)[:self.max_payload]
+            count                = entry['count']
+            trace                = self._take(entry, now)
+
+        formatted = None
+        if trace:
+            # formatted outside the lock, only for the sampled errors
+            formatted = ''.join(traceback.format_exception(error))[-self.max_payload:]
+            entry['traceback'] = formatted
+            if self.log_tracebacks:
+                print(f"Error {fingerprint} in {where} (seen {count} times)\n{formatted}")
+
+        return {
+            'status'     : False,
+            'message'    : f"Error in {where}: {error}"[:self.max_payload],
+            'data'       : formatted if self.include_traceback else None,
+            'fingerprint': fingerprint,
+            'count'      : count,
+        }
+
+    def _take(self, entry: dict, now: float) -> bool:
+        if entry['count'] > 1 and random.random() >= self.sample_rate:
+            return False
+        if now - entry['_window'] >= 60:
+            entry['_window'], entry['_traced'] = now, 0
+        if entry['_traced'] >= self.per_minute:
+            return False
+        entry['_traced'] += 1
+        return True
+
+    def stats(self) -> list:
+        """
+        Returns one entry per fingerprint, most frequent first.
+        """
+        with self._lock:
+            entries = [
+                {'fingerprint': fingerprint, **{key: value for key, value in entry.items() if not key.startswith('_')}}
+                for fingerprint, entry in self._entries.items()
+            ]
+        return sorted(entries, key=lambda entry: entry['count'], reverse=True)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def _fingerprint(where: str, error: Exception) -> str:
+    # walking the traceback links is cheap, formatting them is not
+    tb = error.__traceback__
+    while tb is not None and tb.tb_next is not None:
+        tb = tb.tb_next
+    line = f"{tb.tb_frame.f_code.co_filename}:{tb.tb_lineno}" if tb is not None else ''
+    return format(zlib.crc32(f"{where}|{type(error).__qualname__}|{line}".encode()), '08x')
+
+
+_errors = None
+
+
+def _errorAggregator() -> _ErrorAggregator:
+    global _errors
+    if _errors is None:
+        from config import BaseConfig
+        _errors = _ErrorAggregator(getattr(BaseConfig, 'ERRORS', {}))
+    return _errors
+
+
+def errorStats() -> list:
+    """
+    Returns the errors caught by handle_errors in this process, aggregated
+    by fingerprint: where, type, count, first / last seen, the last message
+    and the last sampled traceback.
+    """
+    return _errorAggregator().stats()
+
+
+def _wrapErrors(function, where: str):
+    @functools.wraps(function)
+    def wrapped(*args, **kwargs):
+        try:
+            data = function(*args, **kwargs)
+        except Exception as e:
+            return _errorAggregator().record(where, e)
+        return {'status': True, 'message': "Success", 'data': data}
+    return wrapped
 
-import traceback
 
 def handle_errors(obj):
     """
     Decorator to handle all errors in a function or class.
+
+    On a class, every function defined on it is wrapped, except dunder
+    methods (__init__ must keep returning None). Static and class methods
+    are wrapped inside their descriptor.
+    """
+    if not isinstance(obj, type):
+        return _wrapErrors(obj, obj.__name__)
+
+    for name, member in list(vars(obj).items()):
+        if name.startswith('__') and name.endswith('__'):
+            continue
+        where = f"{obj.__name__}.{name}"
+        if isinstance(member, (staticmethod, classmethod)):
+            setattr(obj, name, type(member)(_wrapErrors(member.__func__, where)))
+        elif callable(member) and not isinstance(member, type):
+            setattr(obj, name, _wrapErrors(member, where))
+    return obj
+
+
+# Zone and format helpers shared by the timestamp functions below.
+# ZoneInfo objects and per-format parse / format functions are built
+# once and cached, the functions are called per document on exports.
+# ---------------------------------------
+ISO8601_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+DEFAULT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+@functools.lru_cache(maxsize=None)
+def getZone(timezone: str) -> ZoneInfo:
+    """
+    Returns the (cached) ZoneInfo of a timezone name, e.g. "Asia/Kolkata".
+    """
+    return ZoneInfo(timezone)
+
+
+def _resolveFormat(dateFormat: str) -> str:
+    return ISO8601_FORMAT if dateFormat == "iso8601" else dateFormat
+
+
+@functools.lru_cache(maxsize=256)
+def _parser(dateFormat: str):
     """
-    if isinstance(obj, type):
-        # Handle class
-        def wrap_methods(method):
-            """
-            Decorator function to wrap each method in the class with error handling.
-            """
-            def wrapped(*args, **kwargs):
+    Returns a function parsing a string in `dateFormat` into a naive datetime.
+    The two formats used across the app skip strptime: fromisoformat is
+    several times faster and strptime is still used for anything unusual.
+    """
+    def parse(value: str) -> datetime.datetime:
+        return datetime.datetime.strptime(value, dateFormat)
+
+    if dateFormat == DEFAULT_FORMAT:
+        def parse_default(value: str) -> datetime.datetime:
+            if len(value) == 19 and value[10] == ' ':
                 try:
-                    return {
-                        'status' : True,
-                        'message': "Success",
-                        'data'   : method(*args, **kwargs)
-                    }
-                except Exception as e:
-                    return {
-                        'status' : False,
-                        'message': f"Error in {obj.__name__}.{method.__name__}: {e}",
-                        'data'   : traceback.format_exc()
-                    }
-            return wrapped
-
-        for name, method in vars(obj).items():
-            if callable(method):
-                setattr(obj, name, wrap_methods(method))
-
-        return obj
-
-    else:
-        print("HERE")
-        # Handle function
-        def wrapped(*args, **kwargs):
-            try:
-                return {
-                    'status' : True,
-                    'message': "Success",
-                    'data'   : obj(*args, **kwargs)
-                }
-            except Exception as e:
-                return {
-                    'status' : False,
-                    'message': f"Error in {obj.__name__}: {e}",
-                    'data'   : traceback.format_exc()
-                }
-        return wrapped
+                    return datetime.datetime.fromisoformat(value)
+                except ValueError:
+                    pass
+            return parse(value)
+        return parse_default
+
+    if dateFormat == ISO8601_FORMAT:
+        def parse_iso(value: str) -> datetime.datetime:
+            if len(value) == 20 and value[10] == 'T' and value[19] == 'Z':
+                try:
+                    return datetime.datetime.fromisoformat(value[:19])
+                except ValueError:
+                    pass
+            return parse(value)
+        return parse_iso
+
+    return parse
+
+
+@functools.lru_cache(maxsize=256)
+def _formatter(dateFormat: str):
+    """
+    Returns a function formatting a datetime in `dateFormat`, with the same
+    shortcut as _parser for the two common formats.
+    """
+    def format(value: datetime.datetime) -> str:
+        return value.strftime(dateFormat)
+
+    if dateFormat in (DEFAULT_FORMAT, ISO8601_FORMAT):
+        separator = ' ' if dateFormat == DEFAULT_FORMAT else 'T'
+        suffix    = '' if dateFormat == DEFAULT_FORMAT else 'Z'
+
+        def format_iso(value: datetime.datetime) -> str:
+            # %Y is not zero padded below year 1000, isoformat is
+            if value.year < 1000:
+                return format(value)
+            # [:19] drops the UTC offset isoformat adds for aware datetimes
+            return value.isoformat(separator, 'seconds')[:19] + suffix
+        return format_iso
+
+    return format
+
 
 # This code defines a function called getFreshTimeStamp that returns
 # the current time in a specified timezone and format.
@@ -107,14 +267,10 @@ def getFreshTimeStamp(dateFormat: str = "%Y-%m-%d %H:%M:%S", timezone: str ="UTC
 
     # Get the current time in the specified timezone
     # now = datetime.datetime.now(pytz.timezone(timezone))
-    now = datetime.datetime.now(ZoneInfo(timezone))
+    now = datetime.datetime.now(getZone(timezone))
 
-    # If the format is set to 'iso8601', change it to the appropriate format for ISO 8601
-    if dateFormat == "iso8601":
-        dateFormat = "%Y-%m-%dT%H:%M:%SZ"
-
-    # Return the current time in the specified format
-    return now.strftime(dateFormat)
+    # Return the current time in the specified format ('iso8601' is an alias)
+    return _formatter(_resolveFormat(dateFormat))(now)
 
 # Convert a given date from one timezone to another timezone and format it.
 # The function returns the converted date in the specified format.
@@ -141,19 +297,168 @@ def convertTimezone(date: str, FromTimeZone: str, ToTimeZone: str, dateFormat="%
     """
 
     # If the format is set to 'iso8601', change it to the appropriate format for ISO 8601
-    if dateFormat == "iso8601":
-        dateFormat = "%Y-%m-%dT%H:%M:%SZ"
+    dateFormat         = _resolveFormat(dateFormat)
 
     #  create a datetime object using the given date string and date format
-    datetime_obj       = datetime.datetime.strptime(date, dateFormat)
+    datetime_obj       = _parser(dateFormat)(date)
 
     # replace the timezone information with the specified FromTimeZone.
-    datetime_obj       = datetime_obj.replace(tzinfo=ZoneInfo(FromTimeZone))
+    datetime_obj       = datetime_obj.replace(tzinfo=getZone(FromTimeZone))
 
     # convert the date to the specified time zone.
-    converted_datetime = datetime_obj.astimezone(ZoneInfo(ToTimeZone))
+    converted_datetime = datetime_obj.astimezone(getZone(ToTimeZone))
 
     # format the result uing specified format
-    formatted_datetime = converted_datetime.strftime(dateFormat)
+    formatted_datetime = _formatter(dateFormat)(converted_datetime)
+
+    return formatted_datetime
+
+# Shift from wall clock time in one timezone to wall clock time in another.
+# Offsets only change at DST / rule transitions, at most once a day, so the
+# shift is looked up once per day of input and reused for every value of
+# that day; a day containing a transition is converted value by value.
+# ---------------------------------------------
+class _ShiftTable:
+
+    LAST_SECOND = datetime.timedelta(days=1, seconds=-1)
+
+    def __init__(self, FromTimeZone: str, ToTimeZone: str):
+        self.fromZone = getZone(FromTimeZone)
+        self.toZone   = getZone(ToTimeZone)
+        self.days     = {}
+
+    def exact(self, wall: datetime.datetime) -> datetime.timedelta:
+        # the same steps as convertTimezone, for one value
+        converted = wall.replace(tzinfo=self.fromZone).astimezone(self.toZone)
+        return converted.replace(tzinfo=None) - wall
+
+    def dayShift(self, day: datetime.datetime):
+        """
+        Returns the shift shared by every wall time of the day starting at
+        `day` (midnight), or None when the day contains a transition.
+        """
+        shift = self.days.get(day, False)
+        if shift is False:
+            first = self.exact(day)
+            shift = first if first == self.exact(day + self.LAST_SECOND) else None
+            self.days[day] = shift
+        return shift
+
+    def shift(self, wall: datetime.datetime) -> datetime.timedelta:
+        shift = self.dayShift(datetime.datetime(wall.year, wall.month, wall.day))
+        return self.exact(wall) if shift is None else shift
+
+
+# Convert many dates from one timezone to another in a single pass.
+# Lists (or any iterable) of strings or datetimes, and NumPy datetime64 arrays.
+# ---------------------------------------------
+def convertTimezones(values, FromTimeZone: str, ToTimeZone: str, dateFormat=DEFAULT_FORMAT):
+    """
+    Convert many dates from one timezone to another, like convertTimezone
+    applied to each of them, but with the zones, the format handling and
+    the UTC offsets computed once for the whole batch.
+
+    Args:
+        values (list | numpy.ndarray): Date strings in `dateFormat`, naive
+            datetimes (wall clock time in FromTimeZone) or aware datetimes,
+            or a NumPy datetime64 array of wall clock times in FromTimeZone.
+        FromTimeZone (str): The timezone of the given dates.
+        ToTimeZone (str): The timezone to which the dates should be converted.
+        dateFormat (str, optional): Format of string values, and of the
+            results for them. Defaults to "%Y-%m-%d %H:%M:%S".
+
+    Returns:
+        list | numpy.ndarray: strings for strings, aware datetimes in ToTimeZone
+        for datetimes, and a datetime64 array of the same unit for an array
+        (NaT stays NaT). None stays None.
+
+    Usage:
+        ```
+        convertTimezones(["2024-06-06 09:11:50", "2024-12-06 09:11:50"], "UTC", "America/New_York")
+        convertTimezones(numpy.array(["2024-06-06T09:11:50"], dtype="datetime64[s]"), "UTC", "Asia/Kolkata")
+        ```
+    """
+    if getattr(values, 'dtype', None) is not None and values.dtype.kind == 'M':
+        return _convertDatetime64(values, _ShiftTable(FromTimeZone, ToTimeZone))
+    return list(iterConvertTimezones(values, FromTimeZone, ToTimeZone, dateFormat))
+
+
+# Streaming variant of convertTimezones for generators and cursors.
+# ---------------------------------------------
+def iterConvertTimezones(values, FromTimeZone: str, ToTimeZone: str, dateFormat=DEFAULT_FORMAT):
+    """
+    Yields the converted value of every item of `values` as it is consumed,
+    see convertTimezones for the accepted values. Use it on generators and
+    cursors so the input is never held in memory as a whole.
+
+    Usage:
+        ```
+        for createdAt in iterConvertTimezones((d['createdAt'] for d in cursor), "UTC", "Asia/Kolkata"):
+            ...
+        ```
+    """
+    dateFormat = _resolveFormat(dateFormat)
+    parse      = _parser(dateFormat)
+    format     = _formatter(dateFormat)
+    table      = _ShiftTable(FromTimeZone, ToTimeZone)
+    fromZone   = table.fromZone
+    toZone     = table.toZone
+
+    # in the two common formats the first 10 characters are the day ("2024-06-06"),
+    # so the shift is found without building the day's datetime
+    dayPrefix  = dateFormat in (DEFAULT_FORMAT, ISO8601_FORMAT)
+    byPrefix   = {}
+
+    for value in values:
+        if value is None:
+            yield None
+        elif isinstance(value, str):
+            wall  = parse(value)
+            shift = byPrefix.get(value[:10]) if dayPrefix else None
+            if shift is None:
+                shift = table.shift(wall)
+                if dayPrefix and table.days.get(datetime.datetime(wall.year, wall.month, wall.day)) is not None:
+                    byPrefix[value[:10]] = shift
+            yield format(wall + shift)
+        elif value.tzinfo is not None:
+            yield value.astimezone(toZone)
+        else:
+            # astimezone also sets `fold` for times that occur twice in ToTimeZone
+            yield value.replace(tzinfo=fromZone).astimezone(toZone)
+
+
+def _convertDatetime64(values, table: _ShiftTable):
+    """
+    Vectorized conversion of a datetime64 array: one shift per distinct day
+    of input, applied to the whole array at once.
+    """
+    import numpy
+
+    unit = numpy.datetime_data(values.dtype)[0]
+    if unit in ('Y', 'M', 'W', 'D'):
+        # dates without a time of day: convert at second precision
+        values, unit = values.astype('datetime64[s]'), 's'
+
+    missing = numpy.isnat(values)
+    days    = values.astype('datetime64[D]')
+    unique, inverse = numpy.unique(days[~missing], return_inverse=True)
+
+    shifts = numpy.zeros(len(unique), dtype='timedelta64[s]')
+    mixed  = numpy.zeros(len(unique), dtype=bool)
+    for index, day in enumerate(unique.astype(datetime.datetime)):
+        shift = table.dayShift(datetime.datetime(day.year, day.month, day.day))
+        if shift is None:
+            mixed[index] = True
+        else:
+            shifts[index] = numpy.timedelta64(int(shift.total_seconds()), 's')
 
-    return formatted_datetime
\ No newline at end of file
+    present = values[~missing]
+    result  = values.copy()
+    shifted = present + shifts[inverse].astype(f'timedelta64[{unit}]')
+    if mixed.any():
+        # days with a transition, value by value
+        for position in numpy.flatnonzero(mixed[inverse]):
+            wall = present[position].astype('datetime64[us]').astype(datetime.datetime)
+            shifted[position] = present[position] + numpy.timedelta64(int(table.exact(wall).total_seconds()), 's')
+    result[~missing] = shifted
+    return result
\ No newline at end of file
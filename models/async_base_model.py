@@ -0,0 +1,343 @@
+import asyncio
+import copy
+from configs.database import AsyncDB, collection_options
+from bson.objectid import ObjectId
+from bson.raw_bson import DEFAULT_RAW_BSON_OPTIONS
+from typing import Union, AsyncIterator
+from concurrent.futures import Future
+from pymongo import UpdateOne, UpdateMany, DeleteMany
+from pymongo.errors import BulkWriteError
+from config import BaseConfig
+from models.base_model import (
+    BaseModel, _keyset_query, _keyset_page, _page_projection, _batch_counts, _merge_batches, _aggregate_options
+)
+from models import pipelines
+from models.rows import projection_fields, row_type, to_row
+from models.document_cache import find_document_cache
+
+"""
+Async counterpart of BaseModel (motor)
+-------------------------------
+Same method surface as BaseModel, every method is a coroutine and iter_all /
+find_pages are async generators. Use it from async views to overlap Mongo
+round trips with other I/O:
+
+    from models.async_base_model import AsyncBaseModel
+    accounts = AsyncBaseModel('accounts')
+    account, total = await asyncio.gather(
+        accounts.find_by_id(_id),
+        accounts.count({"active": True})
+    )
+
+The read-through cache of BaseModel (CACHE) is not applied here, but writes
+still invalidate it so sync readers never see stale data. The *_on_thread
+methods hand off to the same write-behind executor as BaseModel and return
+immediately.
+"""
+
+class AsyncBaseModel:
+    db = ''
+    collection = ''
+
+    # client and read / write settings, see BaseModel.CONNECTION
+    CONNECTION = None
+
+    def __init__(self, collection_name):
+        connection = self.CONNECTION or {}
+        self.collection_name = collection_name
+        self.db = AsyncDB(connection.get("CLIENT"))
+        self.collection = self.db.get_collection(collection_name, **collection_options(
+            connection.get("READ_PREFERENCE"), connection.get("READ_CONCERN"), connection.get("WRITE_CONCERN")
+        ))
+
+    def using(self, client: str = None, read_preference=None, read_concern=None, write_concern=None):
+        """
+        Returns a copy of this model with another client and / or other read
+        and write settings, see BaseModel.using. Must be called from inside a coroutine.
+        """
+        routed = copy.copy(self)
+        if client is not None:
+            connection        = self.CONNECTION or {}
+            routed.db         = AsyncDB(client)
+            routed.collection = routed.db.get_collection(self.collection_name, **collection_options(
+                connection.get("READ_PREFERENCE"), connection.get("READ_CONCERN"), connection.get("WRITE_CONCERN")
+            ))
+        options = collection_options(read_preference, read_concern, write_concern)
+        if options:
+            routed.collection = routed.collection.with_options(**options)
+        return routed
+
+    async def _invalidate(self, ids: list = None) -> None:
+        # keep the sync read-through cache (if any) coherent with async writes;
+        # invalidation talks to Redis synchronously, so keep it off the loop
+        cache = find_document_cache(self.collection_name)
+        if cache is None:
+            return
+        if ids is None:
+            await asyncio.to_thread(cache.invalidate_all)
+        else:
+            await asyncio.to_thread(cache.invalidate_ids, ids)
+
+    def _reader(self, raw: bool):
+        return self.collection.with_options(codec_options=DEFAULT_RAW_BSON_OPTIONS) if raw else self.collection
+
+    def _sync_model(self) -> BaseModel:
+        model       = BaseModel(self.collection_name)
+        model.cache = find_document_cache(self.collection_name)
+        return model
+
+    async def count(self, filter: dict = {}) -> int:
+        """
+        Count the number of documents in the collection that match the given
+        filter; estimated from metadata without a filter, see BaseModel.count.
+        """
+        if not filter:
+            return await self.collection.estimated_document_count()
+        return await self.collection.count_documents(filter)
+
+    async def distinct(self, field: str, filter: dict = None) -> list:
+        """
+        Get distinct values of a specified field in the collection, see BaseModel.distinct.
+        """
+        return [value async for value in self.iter_distinct(field, filter)]
+
+    async def iter_distinct(self, field: str, filter: dict = None, batch_size: int = None) -> AsyncIterator:
+        """
+        Streams the distinct values of a field, see BaseModel.iter_distinct.
+        """
+        async for document in self.aggregate(pipelines.distinct(field, filter), batch_size=batch_size,
+                                             allow_disk_use=True):
+            yield document['_id']
+
+    async def aggregate(self, pipeline: list, batch_size: int = None, allow_disk_use: bool = None,
+                        max_time_ms: int = None, raw: bool = False) -> AsyncIterator[dict]:
+        """
+        Runs an aggregation pipeline and streams its results, see BaseModel.aggregate.
+        """
+        cursor = self._reader(raw).aggregate(pipeline, **_aggregate_options(batch_size, allow_disk_use, max_time_ms))
+        try:
+            async for document in cursor:
+                yield document
+        finally:
+            await cursor.close()
+
+    async def group(self, by, accumulators: dict = None, filter: dict = None, sort: list = None,
+                    limit: int = 0, **options) -> list:
+        """
+        Groups on the server, see BaseModel.group.
+        """
+        return [document async for document in self.aggregate(
+            pipelines.group(by, accumulators, filter, sort, limit), **options
+        )]
+
+    async def top_n(self, n: int, sort_key: str, direction: int = -1, filter: dict = None, by=None,
+                    projection=None, **options) -> list:
+        """
+        The n first documents by sort_key, overall or per group, see BaseModel.top_n.
+        """
+        return [document async for document in self.aggregate(
+            pipelines.top_n(n, sort_key, direction, filter, by, projection), **options
+        )]
+
+    async def facet(self, facets: dict, filter: dict = None, **options) -> dict:
+        """
+        Runs several pipelines in one pass, see BaseModel.facet.
+        """
+        async for document in self.aggregate(pipelines.facet(facets, filter), **options):
+            return document
+        return {name: [] for name in facets}
+
+    async def find_by_id(self, _id: str, projection=None, raw: bool = False):
+        """
+        Find a document in the collection by its ID, see BaseModel.find_by_id.
+        """
+        return await self._reader(raw).find_one({"_id": ObjectId(_id)}, projection)
+
+    async def update_by_id(self, _id: str, update_data: dict) -> int:
+        """
+        Updates a document in the collection by its ID and returns the number of documents modified.
+        """
+        result = await self.collection.update_one({"_id": ObjectId(_id)}, {'$set': update_data})
+        await self._invalidate([_id])
+        return result.modified_count
+
+    async def delete_by_id(self, _id: str) -> int:
+        """
+        Deletes a document from the collection by its ID and returns the number of documents deleted.
+        """
+        result = await self.collection.delete_one({"_id": ObjectId(_id)})
+        await self._invalidate([_id])
+        return result.deleted_count
+
+    async def insert(self, data: Union[dict, list]) -> Union[list, None]:
+        """
+        Inserts a dictionary or a list of dictionaries and returns the list of
+        inserted IDs, or None if data is neither.
+        """
+        if type(data) == dict:
+            inserted_ids = [(await self.collection.insert_one(data)).inserted_id]
+        elif type(data) == list:
+            inserted_ids = (await self.collection.insert_many(data)).inserted_ids
+        else:
+            return None
+
+        await self._invalidate(inserted_ids)
+        return inserted_ids
+
+    async def update(self, filter: dict, update_data: dict, update_all: bool = True) -> int:
+        """
+        Applies a `$set` update to the documents matching the filter (or only
+        the first one if update_all is False) and returns the number modified.
+        """
+        if update_all:
+            result = await self.collection.update_many(filter, {'$set': update_data})
+        else:
+            result = await self.collection.update_one(filter, {'$set': update_data})
+
+        await self._invalidate()
+        return result.modified_count
+
+    async def delete(self, filter: dict) -> int:
+        """
+        Deletes all matching documents and returns the number deleted.
+        """
+        result = await self.collection.delete_many(filter)
+        await self._invalidate()
+        return result.deleted_count
+
+    async def insert_or_update(self, filter: dict, update_data: dict) -> dict:
+        """
+        Atomic single-round-trip upsert, see BaseModel.insert_or_update.
+        """
+        result = await self.collection.update_one(filter, {'$set': update_data}, upsert=True)
+        await self._invalidate()
+        return {
+            'matched'    : result.matched_count,
+            'modified'   : result.modified_count,
+            'upserted_id': result.upserted_id
+        }
+
+    async def bulk_upsert(self, operations: list, batch_size: int = None) -> dict:
+        """
+        See BaseModel.bulk_upsert.
+        """
+        return await self._bulk(
+            [UpdateOne(op['filter'], {'$set': op['update']}, upsert=True) for op in operations],
+            batch_size
+        )
+
+    async def bulk_update(self, operations: list, batch_size: int = None) -> dict:
+        """
+        See BaseModel.bulk_update.
+        """
+        return await self._bulk(
+            [
+                (UpdateMany if op.get('update_all', True) else UpdateOne)(op['filter'], {'$set': op['update']})
+                for op in operations
+            ],
+            batch_size
+        )
+
+    async def bulk_delete(self, filters: list, batch_size: int = None) -> dict:
+        """
+        See BaseModel.bulk_delete.
+        """
+        return await self._bulk([DeleteMany(filter) for filter in filters], batch_size)
+
+    async def _bulk(self, operations: list, batch_size: int = None) -> dict:
+        """
+        Sends the batches concurrently with asyncio.gather, see BaseModel._bulk.
+        """
+        async def write(batch):
+            try:
+                return _batch_counts((await self.collection.bulk_write(batch, ordered=False)).bulk_api_result)
+            except BulkWriteError as e:
+                return _batch_counts(e.details)
+
+        batch_size = batch_size or BaseConfig.BULK.get("BATCH_SIZE", 1000)
+        batches    = [operations[i:i + batch_size] for i in range(0, len(operations), batch_size)]
+        totals     = _merge_batches(await asyncio.gather(*(write(batch) for batch in batches)), batch_size)
+        if operations:
+            await self._invalidate()
+        return totals
+
+    async def find_one(self, filter: dict, projection=None, raw: bool = False):
+        """
+        Finds a single document in the collection that matches the given filter,
+        see BaseModel.find_one.
+        """
+        return await self._reader(raw).find_one(filter, projection)
+
+    async def find_all(self, filter: dict={}, skip: int=0, limit: int=0, projection=None,
+                       raw: bool = False, as_rows: bool = False) -> list:
+        """
+        Retrieves all documents that match the filter, see BaseModel.find_all.
+        """
+        return [document async for document in self.iter_all(
+            filter, skip=skip, limit=limit, projection=projection, raw=raw, as_rows=as_rows
+        )]
+
+    async def iter_all(self, filter: dict={}, batch_size: int=1000, skip: int=0, limit: int=0, projection=None,
+                       raw: bool = False, as_rows: bool = False) -> AsyncIterator[dict]:
+        """
+        Streams the documents that match the filter, `batch_size` per round trip,
+        see BaseModel.iter_all.
+        """
+        fields = projection_fields(projection) if as_rows else None
+        if as_rows and not projection:
+            raise ValueError("as_rows needs a projection")
+
+        cursor = self._reader(raw).find(filter, projection).batch_size(batch_size)
+        if skip > 0:
+            cursor = cursor.skip(skip)
+        if limit > 0:
+            cursor = cursor.limit(limit)
+
+        row = row_type(fields) if fields else None
+        try:
+            async for document in cursor:
+                yield document if row is None else to_row(document, fields, row)
+        finally:
+            await cursor.close()
+
+    async def find_page(self, filter: dict={}, page_size: int=100, resume_token: str=None,
+                        sort_key: str='_id', direction: int=1, projection=None) -> dict:
+        """
+        Fetches one keyset page, see BaseModel.find_page.
+        """
+        query, sort = _keyset_query(filter, resume_token, sort_key, direction)
+        cursor      = self.collection.find(query, _page_projection(projection, sort_key))
+        data        = await cursor.sort(sort).limit(page_size).to_list(length=page_size)
+        return _keyset_page(data, page_size, sort_key)
+
+    async def find_pages(self, filter: dict={}, page_size: int=100, resume_token: str=None,
+                         sort_key: str='_id', direction: int=1, projection=None) -> AsyncIterator[dict]:
+        """
+        Yields consecutive keyset pages until the result is exhausted, see BaseModel.find_pages.
+        """
+        while True:
+            page = await self.find_page(filter, page_size, resume_token, sort_key, direction, projection)
+            if page['data']:
+                yield page
+            resume_token = page['next_token']
+            if resume_token is None:
+                return
+
+    def insert_on_thread(self, insert_data: Union[dict, list], return_future: bool = False) -> Union[Future, None]:
+        """
+        Queues an insert on the shared write-behind executor, see BaseModel.insert_on_thread.
+        """
+        return self._sync_model().insert_on_thread(insert_data, return_future)
+
+    def update_on_thread(self, filter: dict, update_data: dict, update_all: bool = True,
+                         return_future: bool = False) -> Union[Future, None]:
+        """
+        Queues an update on the shared write-behind executor, see BaseModel.update_on_thread.
+        """
+        return self._sync_model().update_on_thread(filter, update_data, update_all, return_future)
+
+    def delete_on_thread(self, filter: dict, return_future: bool = False) -> Union[Future, None]:
+        """
+        Queues a delete on the shared write-behind executor, see BaseModel.delete_on_thread.
+        """
+        return self._sync_model().delete_on_thread(filter, return_future)
@@ -0,0 +1,198 @@
+import redis.asyncio as aioredis
+from configs.event_loop import per_loop
+from models.redis_client import RedisClient, redis_settings, pool_options, get_serializer, expires_now
+
+"""
+Async counterpart of RedisClient (redis.asyncio)
+-------------------------------
+Same method surface as RedisClient, every method is a coroutine and
+iter_keys / scan_items are async generators. Values use the same codecs,
+so sync and async clients can read each other's keys.
+
+    from models.async_redis_client import AsyncRedisClient
+    client = AsyncRedisClient()
+    value  = await client.get("user:1")
+
+Connection pools are shared per (event loop, host, port, db, ssl): asyncio
+connections cannot move between loops. Async views all run on the process's
+background loop (configs/event_loop.py), so they share one pool per server.
+"""
+
+
+def get_async_pool(host, port, db=0, ssl=False) -> aioredis.BlockingConnectionPool:
+    """
+    Returns the pool for (host, port, db, ssl) on the running event loop,
+    creating it from BaseConfig.REDIS_POOL on first use.
+    """
+    def create():
+        options = pool_options(host, port, db)
+        if ssl:
+            options['connection_class'] = aioredis.SSLConnection
+            options['ssl_cert_reqs']    = None
+        return aioredis.BlockingConnectionPool(**options)
+
+    # the pool of a closed loop cannot be disconnected any more, it is only dropped
+    return per_loop('async_redis', (host, int(port), int(db), bool(ssl)), create)
+
+
+class AsyncRedisClient:
+
+    ENCODING = RedisClient.ENCODING
+
+    def __init__(self, host=None, port=None, ssl=None, db=0, codec=None):
+        """
+        Initializes the AsyncRedisClient class. Must be created inside a
+        coroutine. Arguments are the same as RedisClient.
+        """
+        redis_config      = redis_settings()
+        self.host         = redis_config['HOST'] if host is None else host
+        self.port         = redis_config['PORT'] if port is None else port
+        self.db           = db
+        self.ssl          = redis_config['SSL'] if ssl is None else ssl
+        self.pool         = get_async_pool(self.host, self.port, self.db, self.ssl)
+        self.redis_client = aioredis.Redis(connection_pool=self.pool)
+        self.serializer   = get_serializer(codec)
+
+    async def check_connection(self):
+        try:
+            if await self.redis_client.ping():
+                return {
+                    'status': True,
+                    'message': 'Redis connection successful'
+                }
+            return {
+                'status': False,
+                'message': 'Redis connection failed'
+            }
+        except Exception as e:
+            return {
+                'status': False,
+                'message': str(e)
+            }
+
+    async def set(self, key, value, expire_seconds=None):
+        """
+        Stores the value at the key with an optional TTL, see RedisClient.set.
+        """
+        if expires_now(expire_seconds):
+            await self.redis_client.delete(key)
+            return
+        await self.redis_client.set(key, self.serializer.dumps(key, value), ex=expire_seconds)
+
+    async def get(self, key):
+        """
+        Retrieves the value stored at the key, or None, see RedisClient.get.
+        """
+        value = await self.redis_client.get(key)
+        return None if value is None else self.serializer.loads(value)
+
+    async def delete(self, key):
+        await self.redis_client.delete(key)
+
+    async def exists(self, key):
+        return await self.redis_client.exists(key) == 1
+
+    async def mget(self, keys: list) -> list:
+        """
+        Retrieves several values with one MGET, see RedisClient.mget.
+        """
+        if not keys:
+            return []
+        values = await self.redis_client.mget(keys)
+        return [None if value is None else self.serializer.loads(value) for value in values]
+
+    async def mset(self, mapping: dict, expire_seconds=None):
+        """
+        Stores several values in one round trip, see RedisClient.mset.
+        """
+        if not mapping:
+            return
+
+        if expire_seconds is None:
+            await self.redis_client.mset({key: self.serializer.dumps(key, value) for key, value in mapping.items()})
+            return
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            ttl = expire_seconds.get(key) if isinstance(expire_seconds, dict) else expire_seconds
+            if expires_now(ttl):
+                pipeline.delete(key)
+            else:
+                pipeline.set(key, self.serializer.dumps(key, value), ex=ttl)
+        await pipeline.execute()
+
+    async def delete_many(self, keys, chunk_size: int = 1000) -> int:
+        """
+        Deletes many keys with one DEL per chunk, see RedisClient.delete_many.
+        `keys` may be a list or an async iterator such as iter_keys().
+        """
+        deleted = 0
+        chunk   = []
+
+        async def flush():
+            nonlocal deleted, chunk
+            if chunk:
+                deleted += await self.redis_client.delete(*chunk)
+                chunk = []
+
+        if hasattr(keys, '__aiter__'):
+            async for key in keys:
+                chunk.append(key)
+                if len(chunk) >= chunk_size:
+                    await flush()
+        else:
+            for key in keys:
+                chunk.append(key)
+                if len(chunk) >= chunk_size:
+                    await flush()
+        await flush()
+        return deleted
+
+    async def iter_keys(self, pattern='*', count: int = 1000):
+        """
+        Yields the keys matching the pattern, one SCAN page at a time.
+        """
+        async for key in self.redis_client.scan_iter(pattern, count=count):
+            yield key.decode(self.ENCODING)
+
+    async def scan_items(self, pattern='*', count: int = 1000):
+        """
+        Yields (key, value) pairs with one MGET per SCAN page, see RedisClient.scan_items.
+        """
+        cursor = 0
+        while True:
+            cursor, keys = await self.redis_client.scan(cursor, match=pattern, count=count)
+            if keys:
+                values = await self.redis_client.mget(keys)
+                for key, value in zip(keys, values):
+                    if value is None:
+                        continue
+                    try:
+                        decoded = self.serializer.loads(value)
+                    except Exception:
+                        # counters (INCR) and values written by other tools
+                        continue
+                    yield key.decode(self.ENCODING), decoded
+            if cursor == 0:
+                return
+
+    async def keys(self, pattern='*'):
+        return [key async for key in self.iter_keys(pattern)]
+
+    async def get_all(self, pattern='*'):
+        return {key: value async for key, value in self.scan_items(pattern)}
+
+    def pool_stats(self) -> dict:
+        """
+        Returns in-use and idle connection counts of this client's pool.
+        """
+        in_use = len(getattr(self.pool, '_in_use_connections', ()))
+        idle   = len(getattr(self.pool, '_available_connections', ()))
+        return {
+            'max_connections': self.pool.max_connections,
+            'in_use'         : in_use,
+            'idle'           : idle
+        }
+
+    async def flushdb(self):
+        await self.redis_client.flushdb()
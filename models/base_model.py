@@ -1,7 +1,25 @@
-from configs.database import DB
+from configs.database import DB, collection_options
+from configs.connections import per_process
+import base64
+import copy
+import datetime
+import traceback
+import bson
 from bson.objectid import ObjectId
-from typing import Union
-from threading import Thread
+from bson.raw_bson import DEFAULT_RAW_BSON_OPTIONS
+from typing import Union, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from pymongo import UpdateOne, UpdateMany, DeleteMany, ReadPreference
+from pymongo.errors import BulkWriteError
+from config import BaseConfig
+from models.write_behind import get_write_behind
+from models.document_cache import get_document_cache
+from models.single_flight import get_single_flight
+from models.mirror import get_mirror, NOT_MIRRORED
+from models.rows import projection_fields, row_type, to_row
+from models import pipelines
+from monitoring.metrics import instrument_model
+from monitoring.query_guard import query_guard
 
 """
 How to use the DB object directly
@@ -17,13 +35,320 @@ Process e:
     data = DB.collection.find({"name":"Jhon"})
 """
 
+
+def _encode_resume_token(document: dict, sort_key: str) -> str:
+    """
+    Builds the opaque resume token for keyset pagination from the
+    last document of a page: its sort key value and its _id.
+    """
+    payload = {'k': _sort_value(document, sort_key), 'i': document['_id']}
+    return base64.urlsafe_b64encode(bson.encode(payload)).decode('ascii')
+
+
+def _sort_value(document: dict, sort_key: str):
+    """
+    The value of a (dotted) sort key in a document, None when missing:
+    MongoDB sorts a missing field as null.
+    """
+    value = document
+    for part in sort_key.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _decode_resume_token(token: str) -> dict:
+    """
+    Reverses _encode_resume_token. Raises ValueError on a malformed token.
+    """
+    try:
+        return bson.decode(base64.urlsafe_b64decode(token.encode('ascii')))
+    except Exception as e:
+        raise ValueError(f"Invalid resume token: {e}")
+
+
+def _bulk_executor() -> ThreadPoolExecutor:
+    """
+    Returns this process's thread pool that runs bulk_* batches in
+    parallel, sized from BaseConfig.BULK["WORKERS"].
+    """
+    return per_process('bulk_executor', lambda: ThreadPoolExecutor(
+        max_workers=BaseConfig.BULK.get("WORKERS", 4),
+        thread_name_prefix="bulk-write"
+    ))
+
+
+def _write_batch(collection, operations: list) -> dict:
+    """
+    Sends one unordered bulk_write and returns its counts. Failed operations
+    are counted instead of raised, so the other batches are unaffected.
+    """
+    try:
+        return _batch_counts(collection.bulk_write(operations, ordered=False).bulk_api_result)
+    except BulkWriteError as e:
+        return _batch_counts(e.details)
+
+
+def _batch_counts(result: dict) -> dict:
+    """
+    Extracts the counts and write errors of a bulk_write result document.
+    """
+    return {
+        'matched' : result.get('nMatched', 0),
+        'modified': result.get('nModified', 0),
+        'upserted': result.get('nUpserted', 0),
+        'deleted' : result.get('nRemoved', 0),
+        'errors'  : [
+            {'index': error['index'], 'code': error.get('code'), 'message': error.get('errmsg')}
+            for error in result.get('writeErrors', [])
+        ]
+    }
+
+
+def _merge_batches(results, batch_size: int) -> dict:
+    """
+    Sums the per-batch counts of a split bulk operation and maps each
+    error index back to the position in the original operation list.
+    """
+    totals = {'matched': 0, 'modified': 0, 'upserted': 0, 'deleted': 0, 'errors': []}
+    for number, result in enumerate(results):
+        for key in ('matched', 'modified', 'upserted', 'deleted'):
+            totals[key] += result[key]
+        for error in result['errors']:
+            totals['errors'].append({**error, 'index': error['index'] + number * batch_size})
+    return totals
+
+
+def _keyset_query(filter: dict, resume_token: str, sort_key: str, direction: int) -> tuple:
+    """
+    Builds the (query, sort) pair of a keyset page: the filter restricted to
+    documents after the resume token position, sorted on sort_key then _id.
+
+    Null and missing sort keys sort first ascending and last descending, but
+    $gt / $lt only compare within a type, so they get conditions of their own.
+    Other mixed types in one sort key are not supported.
+    """
+    query = filter
+    if resume_token:
+        position = _decode_resume_token(resume_token)
+        operator = '$gt' if direction == 1 else '$lt'
+        if sort_key == '_id':
+            after = {'_id': {operator: position['i']}}
+        elif position['k'] is None:
+            # the remaining nulls, then (ascending) every non-null value
+            after = {'$or': [{sort_key: None, '_id': {operator: position['i']}}]}
+            if direction == 1:
+                after['$or'].append({sort_key: {'$ne': None}})
+        else:
+            after = {'$or': [
+                {sort_key: {operator: position['k']}},
+                {sort_key: position['k'], '_id': {operator: position['i']}}
+            ]}
+            if direction == -1:
+                # nulls come after every value when descending
+                after['$or'].append({sort_key: None})
+        query = {'$and': [filter, after]} if filter else after
+
+    sort = [('_id', direction)] if sort_key == '_id' else [(sort_key, direction), ('_id', direction)]
+    return query, sort
+
+
+def _page_projection(projection, sort_key: str):
+    """
+    Adds the sort key to an inclusion projection: the resume token is built
+    from it. Exclusion projections are returned unchanged.
+    """
+    if not projection or sort_key == '_id':
+        return projection
+    if isinstance(projection, dict):
+        if any(value for field, value in projection.items() if field != '_id'):
+            return {**projection, sort_key: 1}
+        return projection
+    return list(projection) + [sort_key] if sort_key not in projection else projection
+
+
+def _keyset_page(data: list, page_size: int, sort_key: str) -> dict:
+    """
+    Turns the documents of a keyset page into the find_page result.
+    """
+    next_token = None
+    if len(data) == page_size:
+        next_token = _encode_resume_token(data[-1], sort_key)
+
+    return {
+        'data'      : data,
+        'next_token': next_token
+    }
+
+
+def _aggregate_options(batch_size: int, allow_disk_use: bool, max_time_ms: int) -> dict:
+    """
+    The aggregate() keyword arguments, unset ones from BaseConfig.AGGREGATE.
+    """
+    settings = BaseConfig.AGGREGATE
+    options  = {
+        'batchSize'   : batch_size or settings.get("BATCH_SIZE", 1000),
+        'allowDiskUse': settings.get("ALLOW_DISK_USE", False) if allow_disk_use is None else allow_disk_use,
+    }
+    max_time_ms = settings.get("MAX_TIME_MS", 0) if max_time_ms is None else max_time_ms
+    if max_time_ms:
+        options['maxTimeMS'] = max_time_ms
+    return options
+
+
+@instrument_model
 class BaseModel:
     db = ''
     collection = ''
 
+    # Opt-in read-through cache for find_by_id / find_one / count / distinct.
+    # Set to a dict in a subclass, e.g. {"TTL": 300, "LOCAL_TTL": 10, "MAX_ENTRIES": 5000, "REDIS": True}
+    # See models/document_cache.py.
+    CACHE = None
+
+    # Indexes this model's queries rely on, created by `flask --app app sync-indexes`.
+    # See models/indexes.py for the format, e.g. [{"KEYS": [("email", 1)], "UNIQUE": True}]
+    INDEXES = []
+
+    # Opt-in in-memory copy of the whole collection serving find_by_id / find_one /
+    # find_all / count, e.g. {"INDEXES": ["email"]}. See models/mirror.py.
+    MIRROR = None
+
+    # The MongoDB client this model uses and how it reads and writes, e.g.
+    # {"CLIENT": "analytics", "READ_PREFERENCE": "secondaryPreferred",
+    #  "READ_CONCERN": "majority", "WRITE_CONCERN": {"w": "majority"}}.
+    # Per call see using(); formats in configs/database.py.
+    CONNECTION = None
+
+    # set on the copies returned by using(), keeps their reads out of other flights
+    _route = ''
+
     def __init__(self, collection_name):
-        self.db = DB()
-        self.collection = self.db[collection_name]
+        connection = self.CONNECTION or {}
+        self.db = DB(connection.get("CLIENT"))
+        self.collection = self.db.get_collection(collection_name, **collection_options(
+            connection.get("READ_PREFERENCE"), connection.get("READ_CONCERN"), connection.get("WRITE_CONCERN")
+        ))
+        self.cache = get_document_cache(collection_name, self.CACHE) if self.CACHE else None
+        self.mirror = get_mirror(self) if self.MIRROR and BaseConfig.MIRRORS.get("ENABLED", False) else None
+
+    def using(self, client: str = None, read_preference=None, read_concern=None, write_concern=None):
+        """
+        Returns a copy of this model whose calls use another client and / or
+        other read and write settings; unset ones stay as they are, e.g.
+
+            Account().using(read_preference="secondaryPreferred").find_all({"active": True})
+            Account().using(client="analytics").group("plan.tier")
+            Account().using(write_concern={"w": "majority"}).update_by_id(_id, data)
+
+        Args:
+            client (str, optional): A client of BaseConfig.MONGO_CLIENTS.
+            read_preference, read_concern, write_concern: see configs/database.py.
+
+        Note:
+            Reads of the copy skip the cache and the mirror, which may not hold
+            what this read preference or read concern would return. Its writes
+            still refresh them.
+        """
+        routed = copy.copy(self)
+        if client is not None:
+            connection        = self.CONNECTION or {}
+            routed.db         = DB(client)
+            routed.collection = routed.db.get_collection(self.collection.name, **collection_options(
+                connection.get("READ_PREFERENCE"), connection.get("READ_CONCERN"), connection.get("WRITE_CONCERN")
+            ))
+        options = collection_options(read_preference, read_concern, write_concern)
+        if options:
+            routed.collection = routed.collection.with_options(**options)
+
+        routed.cache    = None
+        routed._written = self._written
+        routed._route   = f":{client}:{read_preference}:{read_concern}"
+        return routed
+
+    def ensure_collection(self) -> None:
+        """
+        Creates the collection with special options (time series, capped, ...)
+        before its indexes are synced. Regular collections need nothing:
+        create_indexes creates them.
+        """
+        pass
+
+    def _reader(self, raw: bool):
+        # same collection, decoding into RawBSONDocument instead of dict
+        return self.collection.with_options(codec_options=DEFAULT_RAW_BSON_OPTIONS) if raw else self.collection
+
+    def _check_plan(self, filter: dict, operation: str, sort: list = None) -> None:
+        # development guard, see monitoring/query_guard.py
+        if query_guard.enabled:
+            query_guard.check(self.collection, filter, operation, sort)
+
+    def _mirrored(self, read):
+        # the mirror's answer, or NOT_MIRRORED when it is stale or cannot answer;
+        # copies from using() read elsewhere
+        if self.mirror is None or self._route or not self.mirror.fresh():
+            return NOT_MIRRORED
+        return read(self.mirror)
+
+    def _written(self, ids: list = None, matched: list = None) -> None:
+        # after a write: later reads must not be served from before it.
+        # ids: the documents written, None for a filter write (the whole cache goes);
+        # matched: the _ids a filter write touched, refreshed in the mirror
+        get_single_flight().invalidate(self.collection.name)
+        if self.mirror is not None:
+            self._refresh_mirror(ids if ids is not None else matched)
+        if self.cache:
+            if ids is None:
+                self.cache.invalidate_all()
+            else:
+                self.cache.invalidate_ids(ids)
+
+    def _set(self, update_data: dict) -> dict:
+        # the update of the $set writes. Mirrored models also stamp UPDATED_FIELD
+        # with the server's time: a mirror without change streams polls it
+        update = {'$set': update_data}
+        field  = self._stamp_field()
+        if field is not None and field not in update_data:
+            update['$currentDate'] = {field: True}
+        return update
+
+    def _stamped(self, documents: list) -> list:
+        # inserted documents of mirrored models get UPDATED_FIELD, see _set
+        field = self._stamp_field()
+        if field is not None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+            for document in documents:
+                document.setdefault(field, now)
+        return documents
+
+    def _stamp_field(self) -> Union[str, None]:
+        # stamped whenever the model declares MIRROR: mirrors of other processes poll it
+        return BaseConfig.MIRRORS.get("UPDATED_FIELD", "updatedAt") if self.MIRROR else None
+
+    def _matched_ids(self, filter: dict) -> Union[list, None]:
+        # the _ids a filter write is about to touch, so only they are refreshed in
+        # the mirror; None without a mirror. Read on the primary, like the write.
+        if self.mirror is None:
+            return None
+        primary = self.collection.with_options(read_preference=ReadPreference.PRIMARY)
+        return [document['_id'] for document in primary.find(filter, {'_id': 1})]
+
+    def _coalesced(self, kind: str, args: tuple, loader, share: bool = True):
+        # identical concurrent reads share one query, see models/single_flight.py
+        flights = get_single_flight()
+        name    = self.collection.name
+        return flights.do(name, flights.key(name, kind + self._route, *args), loader, share)
+
+    def _refresh_mirror(self, ids: list = None) -> None:
+        try:
+            if ids is None:
+                self.mirror.resync()
+            else:
+                self.mirror.refresh(ids)
+        except Exception:
+            # the sync thread catches up; the write itself succeeded
+            print(traceback.format_exc())
 
     def count(self, filter: dict = {}) -> int:
         """
@@ -36,32 +361,143 @@ class BaseModel:
 
         Returns:
             int: The number of documents that match the filter.
+
+        Note:
+            Without a filter the count comes from the collection metadata
+            (estimated_document_count) instead of a scan. It can be off after
+            an unclean shutdown, or by orphaned documents on a sharded cluster;
+            pass a filter such as {"_id": {"$exists": True}} for an exact count.
         """
+        counted = self._mirrored(lambda mirror: mirror.count(filter))
+        if counted is not NOT_MIRRORED:
+            return counted
+        if not filter:
+            return self.collection.estimated_document_count()
+        self._check_plan(filter, 'count')
+        if self.cache:
+            return self.cache.get_or_load(
+                self.cache.query_key('count', filter),
+                lambda: self.collection.count_documents(filter)
+            )
         return self.collection.count_documents(filter)
 
-    def distinct(self, field: str) -> list:
+    def distinct(self, field: str, filter: dict = None) -> list:
         """
         Get distinct values of a specified field in the collection.
 
         Parameters:
             field (str): The field to get distinct values of.
+            filter (dict, optional): Only look at the documents matching it.
 
         Returns:
             list: A list of distinct values of the specified field.
+
+        Note:
+            Collected from iter_distinct, so it is not bound by the 16 MB limit
+            of the distinct command; for many values prefer iterating iter_distinct.
+        """
+        loader = lambda: list(self.iter_distinct(field, filter))
+        if self.cache:
+            args = (field, filter) if filter else (field,)
+            return self.cache.get_or_load(self.cache.query_key('distinct', *args), loader)
+        return loader()
+
+    def iter_distinct(self, field: str, filter: dict = None, batch_size: int = None) -> Iterator:
+        """
+        Streams the distinct values of a field, grouped on the server by an
+        aggregation and fetched `batch_size` at a time. Same values as the
+        distinct command: array values count each element, null counts,
+        documents without the field are skipped (see pipelines.distinct).
+        Always allowed to use disk, high-cardinality fields need it.
+
+        Yields:
+            Each distinct value once, in no particular order.
+        """
+        for document in self.aggregate(pipelines.distinct(field, filter), batch_size=batch_size, allow_disk_use=True):
+            yield document['_id']
+
+    def aggregate(self, pipeline: list, batch_size: int = None, allow_disk_use: bool = None,
+                  max_time_ms: int = None, raw: bool = False) -> Iterator[dict]:
+        """
+        Runs an aggregation pipeline and streams its results, `batch_size`
+        documents per server round trip. See models/pipelines.py for builders.
+
+        Args:
+            pipeline (list): The stages, e.g. pipelines.group("country").
+            batch_size (int, optional): Documents per round trip.
+                Defaults to BaseConfig.AGGREGATE["BATCH_SIZE"].
+            allow_disk_use (bool, optional): Let blocking stages spill to disk.
+                Defaults to BaseConfig.AGGREGATE["ALLOW_DISK_USE"].
+            max_time_ms (int, optional): Server-side time limit, 0 for none.
+                Defaults to BaseConfig.AGGREGATE["MAX_TIME_MS"].
+            raw (bool, optional): Yield RawBSONDocuments, see find_all.
+
+        Yields:
+            dict: Each result document.
         """
-        return self.collection.distinct(field)
+        options = _aggregate_options(batch_size, allow_disk_use, max_time_ms)
+        if pipeline and '$match' in pipeline[0]:
+            self._check_plan(pipeline[0]['$match'], 'aggregate')
+        with self._reader(raw).aggregate(pipeline, **options) as cursor:
+            yield from cursor
+
+    def group(self, by, accumulators: dict = None, filter: dict = None, sort: list = None,
+              limit: int = 0, **options) -> list:
+        """
+        Groups on the server, see pipelines.group, e.g.
+        group("plan.tier", {"accounts": "count", "mrr": ("sum", "amount")}, {"active": True}).
+        `options` are passed to aggregate.
+
+        Returns:
+            list: One document per group, its key in '_id'.
+        """
+        return list(self.aggregate(pipelines.group(by, accumulators, filter, sort, limit), **options))
 
-    def find_by_id(self, _id: str):
+    def top_n(self, n: int, sort_key: str, direction: int = -1, filter: dict = None, by=None,
+              projection=None, **options) -> list:
+        """
+        The n first documents by sort_key, overall or per group, see pipelines.top_n.
+        """
+        return list(self.aggregate(pipelines.top_n(n, sort_key, direction, filter, by, projection), **options))
+
+    def facet(self, facets: dict, filter: dict = None, **options) -> dict:
+        """
+        Runs several pipelines over the documents matching filter in one
+        pass, see pipelines.facet, e.g.
+        facet({"by_tier": pipelines.group("plan.tier"), "total": pipelines.count()}).
+
+        Returns:
+            dict: {facet name: [its results]}
+        """
+        for document in self.aggregate(pipelines.facet(facets, filter), **options):
+            return document
+        return {name: [] for name in facets}
+
+    def find_by_id(self, _id: str, projection=None, raw: bool = False):
         """
         Find a document in the collection by its ID.
 
         Parameters:
             _id (str): The ID of the document to find.
+            projection (list | dict, optional): Fields to return, see find_all.
+            raw (bool, optional): Return a RawBSONDocument, see find_all.
 
         Returns:
             dict or None: The document with the given ID, or None if no document is found.
         """
-        return self.collection.find_one({"_id": ObjectId(_id)})
+        if raw:
+            return self._reader(raw).find_one({"_id": ObjectId(_id)}, projection)
+        document = self._mirrored(lambda mirror: mirror.get(ObjectId(_id), projection))
+        if document is not NOT_MIRRORED:
+            return document
+        if self.cache:
+            # projected reads are cached as query results, dropped on every write
+            key = self.cache.query_key('find_by_id', _id, projection) if projection else self.cache.id_key(_id)
+            return self.cache.get_or_load(
+                key,
+                lambda: self.collection.find_one({"_id": ObjectId(_id)}, projection)
+            )
+        return self.collection.find_one({"_id": ObjectId(_id)}, projection)
 
     def update_by_id(self, _id: str, update_data: dict) -> int:
         """
@@ -74,7 +510,9 @@ class BaseModel:
         Returns:
             int: The number of documents modified.
         """
-        return self.collection.update_one({"_id": ObjectId(_id)}, {'$set': update_data}).modified_count
+        modified = self.collection.update_one({"_id": ObjectId(_id)}, self._set(update_data)).modified_count
+        self._written([_id])
+        return modified
 
     def delete_by_id(self, _id: str) -> int:
         """
@@ -86,7 +524,9 @@ class BaseModel:
         Returns:
             int: The number of documents deleted.
         """
-        return self.collection.delete_one({"_id": ObjectId(_id)}).deleted_count
+        deleted = self.collection.delete_one({"_id": ObjectId(_id)}).deleted_count
+        self._written([_id])
+        return deleted
 
     def insert(self, data: Union[dict, list]) -> Union[list,None]:
         """
@@ -106,15 +546,23 @@ class BaseModel:
         if type(data) == dict:
             # Check if the data is a single dictionary
             # Insert the dictionary into the collection and return the inserted ID
-            return [self.collection.insert_one(data).inserted_id]
+            inserted_ids = [self.collection.insert_one(self._stamped([data])[0]).inserted_id]
         elif type(data) == list:
             # Check if the data is a list of dictionaries
             # Insert the list of dictionaries into the collection and return the inserted IDs
-            return self.collection.insert_many(data).inserted_ids
+            try:
+                inserted_ids = self.collection.insert_many(self._stamped(data)).inserted_ids
+            except BulkWriteError as e:
+                # ordered insert: the documents before the failing one were written
+                self._written([document['_id'] for document in data[:e.details.get('nInserted', 0)]])
+                raise
         else:
             # If the data is neither a dictionary nor a list of dictionaries, return None
             return None
 
+        self._written(inserted_ids)
+        return inserted_ids
+
     def update(self, filter: dict, update_data: dict, update_all: bool = True) -> int:
         """
         Updates a document in the collection based on the filter.
@@ -129,17 +577,23 @@ class BaseModel:
         Returns:
             int: The number of documents modified.
         """
+        self._check_plan(filter, 'update')
+        # all the matches even for update_one: which one it picks is up to the server
+        matched = self._matched_ids(filter)
         if update_all:
             # If 'update_all' is True, use 'update_many' to update all documents
             # matching the filter. The '$set' operator is used to update the
             # fields specified in 'update_data'.
-            return self.collection.update_many(filter, {'$set': update_data}).modified_count
+            modified = self.collection.update_many(filter, self._set(update_data)).modified_count
         else:
             # If 'update_all' is False, use 'update_one' to update only the first
             # document matching the filter. The '$set' operator is used to update
             # the fields specified in 'update_data'. It follows the default sorting
             # order of Mongo, i.e. latest first.
-            return self.collection.update_one(filter, {'$set': update_data}).modified_count
+            modified = self.collection.update_one(filter, self._set(update_data)).modified_count
+
+        self._written(matched=matched)
+        return modified
 
     def delete(self, filter: dict) -> int:
         """
@@ -151,21 +605,139 @@ class BaseModel:
         Returns:
             int: The number of documents deleted.
         """
-        return self.collection.delete_many(filter).deleted_count
+        self._check_plan(filter, 'delete')
+        matched = self._matched_ids(filter)
+        deleted = self.collection.delete_many(filter).deleted_count
+        self._written(matched=matched)
+        return deleted
+
+    def insert_or_update(self, filter: dict, update_data: dict) -> dict:
+        """
+        Updates the first document matching the filter, or inserts it if none
+        matches, in a single atomic round trip (`update_one` with upsert).
+
+        Parameters:
+            filter (dict): The filter to select the document. On insert, its
+                equality fields become part of the new document.
+            update_data (dict): The fields to `$set`.
+
+        Returns:
+            dict: {'matched': int, 'modified': int, 'upserted_id': ObjectId or None}
+        """
+        self._check_plan(filter, 'insert_or_update')
+        matched = self._matched_ids(filter)
+        result  = self.collection.update_one(filter, self._set(update_data), upsert=True)
+        if matched is not None and result.upserted_id is not None:
+            matched.append(result.upserted_id)
+        self._written(matched=matched)
+        return {
+            'matched'    : result.matched_count,
+            'modified'   : result.modified_count,
+            'upserted_id': result.upserted_id
+        }
+
+    def bulk_upsert(self, operations: list, batch_size: int = None) -> dict:
+        """
+        Upserts many documents: each operation is {'filter': dict, 'update': dict}
+        and behaves like insert_or_update. See _bulk for batching.
+
+        Returns:
+            dict: aggregated 'matched', 'modified', 'upserted', 'deleted' counts
+            and 'errors' (index into `operations`, code, message).
+        """
+        return self._bulk(
+            [UpdateOne(op['filter'], self._set(op['update']), upsert=True) for op in operations],
+            batch_size,
+            [op['filter'] for op in operations],
+            upsert=True
+        )
+
+    def bulk_update(self, operations: list, batch_size: int = None) -> dict:
+        """
+        Applies many `$set` updates: each operation is
+        {'filter': dict, 'update': dict, 'update_all': bool (optional, default True)}.
+        See _bulk for batching.
+
+        Returns:
+            dict: aggregated counts, see bulk_upsert.
+        """
+        return self._bulk(
+            [
+                (UpdateMany if op.get('update_all', True) else UpdateOne)(op['filter'], self._set(op['update']))
+                for op in operations
+            ],
+            batch_size,
+            [op['filter'] for op in operations]
+        )
+
+    def bulk_delete(self, filters: list, batch_size: int = None) -> dict:
+        """
+        Deletes all documents matching each of the given filters.
+        See _bulk for batching.
+
+        Returns:
+            dict: aggregated counts, see bulk_upsert.
+        """
+        return self._bulk([DeleteMany(filter) for filter in filters], batch_size, filters)
 
-    def find_one(self, filter: dict):
+    def _bulk(self, operations: list, batch_size: int = None, filters: list = None,
+              upsert: bool = False) -> dict:
+        """
+        Splits the operations into batches of `batch_size` (default
+        BaseConfig.BULK["BATCH_SIZE"]), sends each as an unordered bulk_write
+        on the shared bulk thread pool and aggregates the results.
+
+        Batches run in parallel, so there is no ordering between operations;
+        do not send several operations for the same document in one call.
+
+        `filters` are the operations' filters: with a mirror, the documents
+        they match are refreshed after the write (matched again afterwards for
+        `upsert`, which creates documents).
+        """
+        everything = {'$or': filters} if filters else None
+        matched    = self._matched_ids(everything) if everything and operations else None
+        batch_size = batch_size or BaseConfig.BULK.get("BATCH_SIZE", 1000)
+        batches    = [operations[i:i + batch_size] for i in range(0, len(operations), batch_size)]
+
+        if len(batches) == 1:
+            results = [_write_batch(self.collection, batches[0])]
+        else:
+            results = _bulk_executor().map(lambda batch: _write_batch(self.collection, batch), batches)
+        totals = _merge_batches(results, batch_size)
+
+        if operations:
+            if matched is not None and upsert:
+                matched = list(dict.fromkeys(matched + self._matched_ids(everything)))
+            self._written(matched=matched)
+        return totals
+
+    def find_one(self, filter: dict, projection=None, raw: bool = False):
         """
         Finds a single document in the collection that matches the given filter.
 
         Args:
             filter (dict): A dictionary specifying the query criteria for the document.
+            projection (list | dict, optional): Fields to return, see find_all.
+            raw (bool, optional): Return a RawBSONDocument, see find_all.
 
         Returns:
             Optional[dict]: The first document that matches the filter, or None if no document is found.
         """
-        return self.collection.find_one(filter)
-
-    def find_all(self, filter: dict={}, skip: int=0, limit: int=0) -> list:
+        if not raw:
+            found = self._mirrored(lambda mirror: mirror.find(filter, projection, limit=1))
+            if found is not NOT_MIRRORED:
+                return found[0] if found else None
+        self._check_plan(filter, 'find_one')
+        if raw:
+            return self._reader(raw).find_one(filter, projection)
+        args   = (filter, projection) if projection else (filter,)
+        loader = lambda: self._coalesced('find_one', args, lambda: self.collection.find_one(filter, projection))
+        if self.cache:
+            return self.cache.get_or_load(self.cache.query_key('find_one', *args), loader)
+        return loader()
+
+    def find_all(self, filter: dict={}, skip: int=0, limit: int=0, projection=None,
+                 raw: bool = False, as_rows: bool = False) -> list:
         """
         Retrieves all documents from the collection that match the given filter.
 
@@ -178,37 +750,170 @@ class BaseModel:
             limit (int, optional): The maximum number of documents to return.
             Defaults to 0.
 
+            projection (list | dict, optional): Only fetch these fields, e.g.
+            ["name", "plan.tier"] or {"payload": 0}. Less data on the wire and
+            less to decode. Defaults to None (whole documents).
+
+            raw (bool, optional): Return RawBSONDocuments: the BSON bytes are kept
+            as received and only decoded when a field is first read. Read-only;
+            the fastest choice when most documents are passed on untouched.
+            Defaults to False.
+
+            as_rows (bool, optional): Return compact namedtuples of the projected
+            fields instead of dicts (needs an inclusion projection, see models/rows.py).
+            Defaults to False.
+
         Returns:
             list: A list of dictionaries representing the documents that match
-            the filter. Each dictionary contains the document data with an
-            additional '_id' field containing the document's ObjectId as a string.
+            the filter, as returned by pymongo ('_id' stays an ObjectId; the
+            app's JSON provider renders it as a string).
+
+        Note:
+            This materializes the whole result. For large collections use
+            iter_all (streaming) or find_pages (keyset pagination) instead.
+            Identical concurrent calls share one query (models/single_flight.py),
+            except raw ones. Models with a MIRROR answer from memory when they can
+            (models/mirror.py).
         """
-        data = self.collection.find(filter)
-        if limit > 0:
-            data = data.limit(limit)
-        if skip > 0:
-            data = data.skip(skip)
+        loader = lambda: list(self.iter_all(filter, skip=skip, limit=limit, projection=projection,
+                                            raw=raw, as_rows=as_rows))
+        if raw:
+            return loader()
+        if not as_rows:
+            found = self._mirrored(lambda mirror: mirror.find(filter, projection, skip, limit))
+            if found is not NOT_MIRRORED:
+                return found
+        # rows are generated classes: shared in-process only
+        return self._coalesced('find_all', (filter, projection, skip, limit, as_rows), loader, share=not as_rows)
+
+    def iter_all(self, filter: dict={}, batch_size: int=1000, skip: int=0, limit: int=0, projection=None,
+                 raw: bool = False, as_rows: bool = False) -> Iterator[dict]:
+        """
+        Streams the documents that match the given filter, fetching them from
+        the server `batch_size` documents at a time, so only one batch is held
+        in memory.
+
+        Args:
+            filter (dict, optional): A dictionary representing the query filter.
+            Defaults to an empty dictionary.
+
+            batch_size (int, optional): Number of documents per server round trip.
+            Defaults to 1000.
+
+            skip (int, optional): The number of documents to skip. Defaults to 0.
+
+            limit (int, optional): The maximum number of documents to return.
+            Defaults to 0 (no limit).
+
+            projection, raw, as_rows: see find_all.
 
-        return [{**field, '_id': str(field['_id'])} for field in data]
+        Yields:
+            dict: Each matching document, as returned by pymongo
+            (a RawBSONDocument with raw, a row with as_rows).
+        """
+        fields = projection_fields(projection) if as_rows else None
+        if as_rows and not projection:
+            raise ValueError("as_rows needs a projection")
 
-    def insert_on_thread(self, insert_data: dict) -> None:
+        self._check_plan(filter, 'find')
+        cursor = self._reader(raw).find(filter, projection).batch_size(batch_size)
+        if skip > 0:
+            cursor = cursor.skip(skip)
+        if limit > 0:
+            cursor = cursor.limit(limit)
+
+        with cursor:
+            if fields is None:
+                yield from cursor
+            else:
+                row = row_type(fields)
+                for document in cursor:
+                    yield to_row(document, fields, row)
+
+    def find_page(self, filter: dict={}, page_size: int=100, resume_token: str=None,
+                  sort_key: str='_id', direction: int=1, projection=None) -> dict:
         """
-        Insert the given data into the collection on a separate thread
-        without blocking the main thread and without waiting for the result.
+        Fetches one page of documents using keyset pagination: instead of
+        `skip`, the page starts right after the last document of the previous
+        page, so deep pages cost the same as the first one.
 
         Args:
-            insert_data (dict): The data to be inserted into the collection.
+            filter (dict, optional): A dictionary representing the query filter.
+            Defaults to an empty dictionary.
+
+            page_size (int, optional): The maximum number of documents in the page.
+            Defaults to 100.
+
+            resume_token (str, optional): The `next_token` of the previous page.
+            None starts from the beginning.
+
+            sort_key (str, optional): The field to paginate on, dotted paths
+            included. It should be indexed (together with _id, which is used as
+            a tie-breaker) and hold one type of value; null and missing values
+            are paged too. Defaults to '_id'.
+
+            direction (int, optional): 1 for ascending, -1 for descending. Defaults to 1.
+
+            projection (list | dict, optional): Fields to return, see find_all.
+            The sort key is always included.
 
         Returns:
-            None
+            dict: {'data': [documents],
+                   'next_token': opaque token for the next page, or None on the last page}
+        """
+        query, sort = _keyset_query(filter, resume_token, sort_key, direction)
+        self._check_plan(filter, 'find_page', sort)
+        data        = list(self.collection.find(query, _page_projection(projection, sort_key)).sort(sort).limit(page_size))
+        return _keyset_page(data, page_size, sort_key)
+
+    def find_pages(self, filter: dict={}, page_size: int=100, resume_token: str=None,
+                   sort_key: str='_id', direction: int=1, projection=None) -> Iterator[dict]:
         """
-        thread = Thread(target=self.insert, args=(insert_data,))
-        thread.start()
+        Yields consecutive pages from find_page until the result is exhausted.
+        Each page carries the `next_token` that can be stored to resume later.
 
-    def update_on_thread(self, filter: dict, update_data: dict, update_all: bool = True) -> None:
+        Args:
+            Same as find_page.
+
+        Yields:
+            dict: {'data': [...], 'next_token': str or None}
+        """
+        while True:
+            page = self.find_page(filter, page_size, resume_token, sort_key, direction, projection)
+            if page['data']:
+                yield page
+            resume_token = page['next_token']
+            if resume_token is None:
+                return
+
+    def insert_on_thread(self, insert_data: Union[dict, list], return_future: bool = False) -> Union[Future, None]:
         """
-        Update the documents in the collection that match the given filter on a separate thread
-        without blocking the main thread and without waiting for the result.
+        Queue the given data for insertion into the collection on the shared
+        write-behind executor without blocking the main thread.
+
+        Args:
+            insert_data (Union[dict, list]): The document or list of documents to insert.
+
+            return_future (bool, optional): If True, return a Future that resolves
+            once the write has reached the database. For a list, once every
+            document has, failing if any of them failed. Defaults to False.
+
+        Returns:
+            Future or None
+        """
+        self._stamped(insert_data if type(insert_data) == list else [insert_data])
+        future = get_write_behind().insert(self.collection, insert_data, return_future or self._refreshed_after_write())
+        if self._refreshed_after_write() and future is not None:
+            documents = insert_data if type(insert_data) == list else [insert_data]
+            # the _ids are set on the documents once they are written
+            future    = self._invalidate_after(future, lambda: self._written([d.get('_id') for d in documents]))
+        return future if return_future else None
+
+    def update_on_thread(self, filter: dict, update_data: dict, update_all: bool = True,
+                         return_future: bool = False) -> Union[Future, None]:
+        """
+        Queue an update of the documents in the collection that match the given filter
+        on the shared write-behind executor without blocking the main thread.
 
         Args:
             filter (dict): A dictionary representing the query filter.
@@ -218,22 +923,73 @@ class BaseModel:
             update_all (bool, optional): If True, update all matching documents. If False, update only the first matching document.
             Defaults to True.
 
+            return_future (bool, optional): If True, return a Future that resolves
+            once the write has reached the database. Defaults to False.
+
         Returns:
-            None
+            Future or None
         """
-        thread = Thread(target=self.update, args=(filter, update_data, update_all,))
-        thread.start()
-
-    def delete_on_thread(self, filter: dict) -> None:
+        matched = self._queued_matches(filter)
+        future  = get_write_behind().update(self.collection, filter, update_data, update_all,
+                                            return_future or self._refreshed_after_write(), self._stamp_field())
+        if self._refreshed_after_write():
+            future = self._invalidate_after(future, lambda: self._written(matched=matched))
+        return future if return_future else None
+
+    def delete_on_thread(self, filter: dict, return_future: bool = False) -> Union[Future, None]:
         """
-        Delete the documents in the collection that match the given filter on a separate thread
-        without blocking the main thread and without waiting for the result.
+        Queue a delete of the documents in the collection that match the given filter
+        on the shared write-behind executor without blocking the main thread.
 
         Args:
             filter (dict): A dictionary representing the query filter.
 
+            return_future (bool, optional): If True, return a Future that resolves
+            once the write has reached the database. Defaults to False.
+
         Returns:
-            None
+            Future or None
+        """
+        matched = self._queued_matches(filter)
+        future  = get_write_behind().delete(self.collection, filter, return_future or self._refreshed_after_write())
+        if self._refreshed_after_write():
+            future = self._invalidate_after(future, lambda: self._written(matched=matched))
+        return future if return_future else None
+
+    def _refreshed_after_write(self) -> bool:
+        # write-behind writes wait for their future when a cache or mirror must follow them
+        return bool(self.cache) or self.mirror is not None
+
+    def _queued_matches(self, filter: dict) -> Union[list, None]:
+        # the _ids a queued filter write will touch, taken from the mirror without a
+        # round trip; None (reload) when there is no mirror or it cannot answer
+        if self.mirror is None:
+            return None
+        ids = self.mirror.ids(filter)
+        return None if ids is NOT_MIRRORED else ids
+
+    @staticmethod
+    def _invalidate_after(future: Future, invalidate) -> Future:
+        """
+        Runs the cache invalidation and mirror refresh once a write-behind
+        operation has been written and returns a future that completes only
+        after it, so a caller waiting on the future never reads the pre-write
+        value from the cache or the mirror.
         """
-        thread = Thread(target=self.delete, args=(filter,))
-        thread.start()
+        done = Future()
+
+        def callback(inner: Future):
+            try:
+                invalidate()
+            except Exception as e:
+                # the caller must not wait forever; a write error takes precedence
+                print(traceback.format_exc())
+                done.set_exception(inner.exception() or e)
+                return
+            if inner.exception() is not None:
+                done.set_exception(inner.exception())
+            else:
+                done.set_result(inner.result())
+
+        future.add_done_callback(callback)
+        return done
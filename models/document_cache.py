@@ -0,0 +1,312 @@
+import copy
+import hashlib
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from bson import json_util
+from configs.connections import per_process, resources
+
+"""
+Read-through cache used by BaseModel finders
+-------------------------------
+Opt in per model by setting a CACHE dict on the class:
+
+    class Account(BaseModel):
+        CACHE = {"TTL": 300, "LOCAL_TTL": 10, "MAX_ENTRIES": 5000, "REDIS": True}
+
+Lookups check the in-process LRU first, then Redis (shared by all workers),
+and only then MongoDB. Writes made through BaseModel on the same collection
+invalidate both tiers:
+    - id writes (update_by_id / delete_by_id / inserts) drop that id and every
+      cached query result,
+    - filter writes (update / delete) drop everything cached for the collection.
+
+In Redis, keys embed counters instead of being deleted one by one: a write
+increments a counter (INCR) and every key built on its old value becomes
+unreachable, left to expire after TTL. Every key uses the namespace's
+`cache:<namespace>:generation`; query keys add `...:generation:q`, id keys
+the id's own `cache:<namespace>:version:<id>`. Lookups read the counters and
+the value in a single round trip, and a miss is filled under the counters it
+read, so a fill that raced a write in any process lands on a dead key.
+Id versions expire 2 x TTL after their last write, once every key built on
+them is gone. Invalidations made while Redis is down are kept as one
+pending full invalidation, applied as soon as Redis answers again.
+
+The local tier is not told about writes made by other processes, which is
+why LOCAL_TTL is kept short.
+"""
+
+_MISSING = object()
+
+# how long the Redis tier is skipped after an error
+REDIS_RETRY_SECONDS = 30
+
+
+class DocumentCache:
+
+    def __init__(self, namespace: str, ttl: int = 300, local_ttl: int = 10,
+                 max_entries: int = 5000, use_redis: bool = True):
+        """
+        Initializes the DocumentCache class.
+
+        Args:
+            namespace (str): Prefix of every key, normally the collection name.
+            ttl (int): Seconds an entry lives in Redis. Defaults to 300.
+            local_ttl (int): Seconds an entry lives in the in-process LRU. Defaults to 10.
+            max_entries (int): Size of the in-process LRU; the least recently
+                used entry is evicted beyond it. Defaults to 5000.
+            use_redis (bool): Whether to use Redis as a second tier. Defaults to True.
+        """
+        self.namespace   = namespace
+        self.ttl         = ttl
+        self.local_ttl   = local_ttl
+        self.max_entries = max_entries
+        self.use_redis   = use_redis
+        self._entries    = OrderedDict()
+        self._lock       = threading.Lock()
+        self._redis      = None
+        self._redis_down = 0.0
+        self._pending    = False
+        self._version    = 0
+        self._counters   = {
+            'hits_local'   : 0,
+            'hits_redis'   : 0,
+            'misses'       : 0,
+            'evictions'    : 0,
+            'expirations'  : 0,
+            'invalidations': 0,
+            'redis_errors' : 0,
+        }
+
+    # ----- keys ---------------------------------------------------------
+
+    def id_key(self, _id) -> str:
+        return f"cache:{self.namespace}:id:{_id}"
+
+    def query_key(self, kind: str, *args) -> str:
+        """
+        Builds a key for a query result from the method name and its arguments.
+        The arguments are serialized with canonical (sorted) key order.
+        """
+        raw    = json_util.dumps(args, sort_keys=True)
+        digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return f"cache:{self.namespace}:q:{kind}:{digest}"
+
+    # ----- read-through -------------------------------------------------
+
+    def get_or_load(self, key: str, loader):
+        """
+        Returns the cached value for the key, calling `loader()` and caching
+        its result on a miss. None results are cached as well.
+
+        Args:
+            key (str): The cache key (see id_key / query_key).
+            loader (callable): Function that reads the value from MongoDB.
+
+        Returns:
+            The cached or freshly loaded value.
+        """
+        value = self._local_get(key)
+        if value is not _MISSING:
+            self._count('hits_local')
+            return copy.deepcopy(value)
+
+        value, stored_at = self._redis_get(key)
+        if value is not _MISSING:
+            self._count('hits_redis')
+            self._local_set(key, value)
+            return copy.deepcopy(value)
+
+        self._count('misses')
+        version = self._version
+        value   = loader()
+        # skip the fill if a write invalidated the namespace while loading,
+        # otherwise the pre-write value would be cached again. In Redis the fill
+        # goes under the counters read before loading, dead after such a write.
+        if version == self._version:
+            self._local_set(key, value)
+            self._redis_set(stored_at, value)
+        return copy.deepcopy(value)
+
+    # ----- invalidation -------------------------------------------------
+
+    def invalidate_ids(self, ids: list) -> None:
+        """
+        Drops the given ids and every cached query result of the namespace.
+        """
+        keys = [self.id_key(_id) for _id in ids]
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+            self._drop_local_prefix(f"cache:{self.namespace}:q:")
+            self._counters['invalidations'] += 1
+            self._version += 1
+
+        self._redis_invalidate(ids)
+
+    def invalidate_all(self) -> None:
+        """
+        Drops everything cached for the namespace in both tiers.
+        """
+        with self._lock:
+            self._drop_local_prefix(f"cache:{self.namespace}:")
+            self._counters['invalidations'] += 1
+            self._version += 1
+
+        self._redis_invalidate(None)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit / miss / eviction counters and the current LRU size.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+
+        lookups            = stats['hits_local'] + stats['hits_redis'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits_local'] + stats['hits_redis']) / lookups if lookups else 0.0
+        return stats
+
+    # ----- local tier ---------------------------------------------------
+
+    def _local_get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._counters['expirations'] += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def _local_set(self, key: str, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.local_ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _drop_local_prefix(self, prefix: str) -> None:
+        # caller holds the lock
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    # ----- redis tier ---------------------------------------------------
+
+    def _redis_client(self):
+        if self._redis is None:
+            from models.redis_client import RedisClient
+            self._redis = RedisClient()
+        return self._redis
+
+    def _redis_available(self) -> bool:
+        if not self.use_redis or self._redis_down >= time.monotonic():
+            return False
+        if self._pending:
+            # writes were missed while Redis was down: nothing cached before can be trusted
+            try:
+                self._redis_client().incr(self._generation_key())
+                self._pending = False
+            except Exception:
+                self._redis_failed()
+                return False
+        return True
+
+    def _generation_key(self, queries: bool = False) -> str:
+        return f"cache:{self.namespace}:generation" + (":q" if queries else "")
+
+    def _version_key(self, _id) -> str:
+        return f"cache:{self.namespace}:version:{_id}"
+
+    def _redis_get(self, key: str) -> tuple:
+        # (value or _MISSING, the Redis key to fill on a miss or None)
+        if not self._redis_available():
+            return _MISSING, None
+        # "cache:<ns>:id:<id>" is stored at "cache:<ns>:<generation>.<version>:id:<id>"
+        prefix = f"cache:{self.namespace}:"
+        suffix = key[len(prefix) - 1:]
+        generations = [self._generation_key()]
+        if suffix.startswith(':q:'):
+            generations.append(self._generation_key(queries=True))
+        else:
+            generations.append(self._version_key(suffix[len(':id:'):]))
+        try:
+            # values are stored wrapped, so a cached None is told apart
+            # from a missing key
+            stored_at, entry = self._redis_client().get_generational(generations, prefix, suffix)
+        except Exception:
+            self._redis_failed()
+            return _MISSING, None
+        return (_MISSING if entry is None else entry['v']), stored_at
+
+    def _redis_set(self, stored_at: str, value) -> None:
+        if stored_at is None or not self._redis_available():
+            return
+        try:
+            self._redis_client().set(stored_at, {'v': value}, self.ttl)
+        except Exception:
+            self._redis_failed()
+
+    def _redis_invalidate(self, ids: list = None) -> None:
+        # ids: drop them and every query result; None: drop everything
+        if not self.use_redis:
+            return
+        if not self._redis_available():
+            self._pending = True
+            return
+        try:
+            client = self._redis_client()
+            if ids is None:
+                client.incr(self._generation_key())
+                return
+            client.incr_many([self._version_key(_id) for _id in ids], 2 * self.ttl)
+            client.incr(self._generation_key(queries=True))
+        except Exception:
+            self._pending = True
+            self._redis_failed()
+
+    def _redis_failed(self) -> None:
+        # a Redis outage must never break reads: skip the tier for a while
+        # and serve from the local LRU and Mongo
+        self._count('redis_errors')
+        if self._redis_down == 0.0:
+            print(f"document cache [{self.namespace}]: redis tier unavailable\n{traceback.format_exc()}")
+        self._redis_down = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+
+def get_document_cache(namespace: str, settings: dict) -> DocumentCache:
+    """
+    Returns this process's cache of a namespace, creating it from
+    a model's CACHE settings on first use. A forked worker starts
+    with empty caches, see configs.connections.
+    """
+    return per_process(('document_cache', namespace), lambda: DocumentCache(
+        namespace,
+        ttl         = settings.get("TTL", 300),
+        local_ttl   = settings.get("LOCAL_TTL", 10),
+        max_entries = settings.get("MAX_ENTRIES", 5000),
+        use_redis   = settings.get("REDIS", True)
+    ))
+
+
+def find_document_cache(namespace: str):
+    """
+    Returns the cache of a namespace if one was created in this process, else None.
+    """
+    return resources('document_cache').get(('document_cache', namespace))
+
+
+def cache_stats() -> dict:
+    """
+    Returns the stats of every cache created in this process, keyed by namespace.
+    """
+    return {key[1]: cache.stats() for key, cache in resources('document_cache').items()}
@@ -0,0 +1,198 @@
+import traceback
+import click
+from pymongo import IndexModel
+
+"""
+Declared indexes and their reconciliation with the server
+-------------------------------
+A model lists its indexes in INDEXES, one dict per index:
+
+    class Account(BaseModel):
+        INDEXES = [
+            {"KEYS": [("email", 1)], "UNIQUE": True, "PARTIAL": {"email": {"$type": "string"}}},
+            {"KEYS": [("owner_id", 1), ("createdAt", -1)]},
+            {"KEYS": [("expiresAt", 1)], "TTL": 0},
+        ]
+
+    KEYS    : [(field, 1 | -1 | "text" | "2dsphere" | "hashed"), ...]   required
+    NAME    : index name, defaults to the pymongo generated one ("email_1")
+    UNIQUE  : bool
+    TTL     : expireAfterSeconds
+    PARTIAL : partialFilterExpression
+    SPARSE  : bool
+    OPTIONS : any other createIndexes option, e.g. {"collation": {...}}
+
+sync_indexes() compares the declarations with index_information() and
+creates the missing ones with one create_indexes call per collection.
+It never drops anything unless asked to:
+
+    flask --app app sync-indexes              create missing indexes
+    flask --app app sync-indexes --dry-run    only report
+    flask --app app sync-indexes --rebuild    drop and recreate indexes whose options changed
+    flask --app app sync-indexes --drop-extra also drop indexes that are not declared
+
+or at startup with BaseConfig.INDEXES["SYNC_ON_STARTUP"].
+"""
+
+# options compared between a declaration and the server, as named by the server
+_COMPARED = ('unique', 'expireAfterSeconds', 'partialFilterExpression', 'sparse', 'collation')
+
+
+def index_model(spec: dict) -> IndexModel:
+    """
+    Builds the pymongo IndexModel of one INDEXES entry.
+    """
+    options = dict(spec.get("OPTIONS", {}))
+    if spec.get("NAME"):
+        options['name'] = spec["NAME"]
+    if spec.get("UNIQUE"):
+        options['unique'] = True
+    if spec.get("TTL") is not None:
+        options['expireAfterSeconds'] = int(spec["TTL"])
+    if spec.get("PARTIAL"):
+        options['partialFilterExpression'] = spec["PARTIAL"]
+    if spec.get("SPARSE"):
+        options['sparse'] = True
+    return IndexModel(list(spec["KEYS"]), **options)
+
+
+def _key_of(document: dict) -> tuple:
+    return tuple((field, direction) for field, direction in dict(document['key']).items())
+
+
+def _options_of(document: dict) -> dict:
+    return {name: document[name] for name in _COMPARED if document.get(name) not in (None, False)}
+
+
+def _without_ttl(options: dict) -> dict:
+    return {name: value for name, value in options.items() if name != 'expireAfterSeconds'}
+
+
+def reconcile(collection, specs: list, dry_run: bool = False, rebuild: bool = False,
+              drop_extra: bool = False) -> dict:
+    """
+    Brings the indexes of one collection in line with its declarations.
+
+    Args:
+        collection: pymongo Collection.
+        specs (list): The model's INDEXES.
+        dry_run (bool): Only report what would change.
+        rebuild (bool): Drop and recreate indexes whose options differ. Without it
+            they are reported as conflicts; a changed TTL alone is applied in place.
+        drop_extra (bool): Drop indexes that are not declared (never _id_).
+
+    Returns:
+        dict: lists of index names: 'created', 'unchanged', 'updated',
+        'rebuilt', 'conflicts', 'extra', 'dropped'.
+    """
+    report   = {'created': [], 'unchanged': [], 'updated': [], 'rebuilt': [], 'conflicts': [], 'extra': [], 'dropped': []}
+    existing = collection.index_information()
+    by_key   = {_key_of(info): name for name, info in existing.items()}
+    missing  = []
+    declared = set()
+
+    for spec in specs:
+        model   = index_model(spec)
+        wanted  = model.document
+        name    = wanted['name']
+        key     = _key_of(wanted)
+        # the server refuses a second index on the same keys under another name
+        current = name if name in existing else by_key.get(key)
+        if current is None:
+            missing.append(model)
+            report['created'].append(name)
+            continue
+
+        declared.add(current)
+        on_server = _options_of(existing[current])
+        options   = _options_of(wanted)
+        same_keys = _key_of(existing[current]) == key
+        if same_keys and on_server == options:
+            report['unchanged'].append(current)
+        elif same_keys and 'expireAfterSeconds' in on_server and 'expireAfterSeconds' in options \
+                and _without_ttl(on_server) == _without_ttl(options):
+            # only the TTL changed: collMod applies it without rebuilding the index
+            report['updated'].append(current)
+            if not dry_run:
+                collection.database.command(
+                    'collMod', collection.name,
+                    index={'name': current, 'expireAfterSeconds': wanted['expireAfterSeconds']}
+                )
+        elif rebuild:
+            report['rebuilt'].append(name)
+            if not dry_run:
+                collection.drop_index(current)
+                missing.append(model)
+        else:
+            report['conflicts'].append(f"{current}: server {_key_of(existing[current])} {on_server}, declared {key} {options}")
+
+    if missing and not dry_run:
+        collection.create_indexes(missing)
+
+    for name in existing:
+        if name == '_id_' or name in declared:
+            continue
+        report['extra'].append(name)
+        if drop_extra and not dry_run:
+            collection.drop_index(name)
+            report['dropped'].append(name)
+    return report
+
+
+def declared_models() -> list:
+    """
+    Returns every BaseModel subclass that declares INDEXES.
+    """
+    import models.models  # registers the application models
+    from models.base_model import BaseModel
+
+    found, pending = [], list(BaseModel.__subclasses__())
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        if cls.__dict__.get('INDEXES'):
+            found.append(cls)
+    return found
+
+
+def sync_indexes(dry_run: bool = False, rebuild: bool = False, drop_extra: bool = False) -> dict:
+    """
+    Reconciles the indexes of every declared model. A failing collection is
+    reported and does not stop the others.
+
+    Returns:
+        dict: {collection name: reconcile report, or {'error': str}}
+    """
+    reports = {}
+    for cls in declared_models():
+        try:
+            model = cls()
+        except TypeError:
+            # needs constructor arguments (e.g. a collection name), not a fixed model
+            continue
+        try:
+            model.ensure_collection()
+            reports[model.collection.name] = reconcile(model.collection, cls.INDEXES, dry_run, rebuild, drop_extra)
+        except Exception as e:
+            print(traceback.format_exc())
+            reports[model.collection.name] = {'error': str(e)}
+    return reports
+
+
+@click.command('sync-indexes')
+@click.option('--dry-run', is_flag=True, help='Only report what would change.')
+@click.option('--rebuild', is_flag=True, help='Drop and recreate indexes whose options changed.')
+@click.option('--drop-extra', is_flag=True, help='Drop indexes that are not declared.')
+def sync_indexes_command(dry_run, rebuild, drop_extra):
+    """Create the indexes declared in the models' INDEXES."""
+    failed = False
+    for collection, report in sync_indexes(dry_run, rebuild, drop_extra).items():
+        if 'error' in report:
+            failed = True
+            click.echo(f"{collection}: ERROR {report['error']}")
+            continue
+        changes = ', '.join(f"{kind} {names}" for kind, names in report.items() if names and kind != 'unchanged')
+        click.echo(f"{collection}: {changes or 'up to date'}")
+        failed = failed or bool(report['conflicts'])
+    if failed:
+        raise SystemExit(1)
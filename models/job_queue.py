@@ -0,0 +1,822 @@
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import click
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import BaseConfig
+from configs.connections import per_process
+from models.indexes import reconcile
+
+"""
+Durable job queue on the scheduler_data collection
+-------------------------------
+Jobs are documents in scheduler_data. Any number of worker processes claim
+them with one atomic find_one_and_update each, so a job runs on one worker
+at a time; scaling out is starting more workers against the same database:
+
+    flask --app app jobs-worker --concurrency 8
+    flask --app app jobs-worker --mode process --names reports.build
+
+Handlers are plain functions registered by name, taking the payload:
+
+    from models.job_queue import job, get_job_queue
+
+    @job('emails.welcome', max_attempts=5)
+    def send_welcome(payload):
+        ...
+
+    queue = get_job_queue()
+    queue.enqueue('emails.welcome', {"user_id": "..."}, priority=10)
+    queue.enqueue('emails.welcome', {...}, delay=600)                 run in 10 minutes
+    queue.enqueue('emails.welcome', {...}, key="welcome:42")          at most one pending per key
+    queue.schedule('reports.daily', "30 2 * * *")                      recurring, cron syntax, UTC
+
+Deduplication relies on a unique partial index on `key` (KEY_INDEX), which
+the queue creates the first time a process enqueues or schedules with a key.
+
+The worker imports the modules listed in JOBS["HANDLER_MODULES"] so their
+@job functions are registered. In process mode handlers must be module-level
+functions (they are pickled by name; the pool starts with JOBS["PROCESS_START_METHOD"]).
+
+A claimed job holds a lease of LEASE_SECONDS. The worker renews the leases
+of its running jobs every HEARTBEAT_SECONDS; a job whose lease expired (its
+worker died) is put back in the queue by the next worker's recovery sweep.
+Delivery is at least once: handlers should be idempotent.
+
+A failed job is retried after BACKOFF_BASE * 2^(attempt-1) seconds (capped
+at BACKOFF_MAX, with jitter) until it has run max_attempts times, then it is
+marked failed. Finished jobs are deleted RETENTION_SECONDS later by a TTL index.
+
+Job document:
+    name, payload, status ("queued" | "running" | "done" | "failed"),
+    priority (higher first), runAt, attempts, maxAttempts, key, cron,
+    workerId, leaseUntil, createdAt, startedAt, finishedAt, expiresAt,
+    lastError, result
+"""
+
+QUEUED  = "queued"
+RUNNING = "running"
+DONE    = "done"
+FAILED  = "failed"
+
+# one pending job per deduplication key; finished jobs $unset their key
+KEY_INDEX = {"KEYS": [("key", 1)], "UNIQUE": True, "PARTIAL": {"key": {"$type": "string"}}}
+
+# handler name -> (function, max_attempts or None)
+_handlers = {}
+
+
+def job(name: str = None, max_attempts: int = None):
+    """
+    Decorator registering a function as the handler of the jobs called
+    `name` (defaults to module.function). The function is returned unchanged.
+    """
+    def register(func):
+        _handlers[name or f"{func.__module__}.{func.__name__}"] = (func, max_attempts)
+        return func
+    return register
+
+
+def handlers() -> dict:
+    """
+    Returns {name: function} of the registered handlers.
+    """
+    return {name: entry[0] for name, entry in _handlers.items()}
+
+
+def _now() -> datetime:
+    # pymongo returns naive UTC datetimes, keep everything comparable with them
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ======================================
+#     CRON
+# ======================================
+class CronSchedule:
+    """
+    Five field cron expression: minute hour day-of-month month day-of-week,
+    each "*", "5", "1-5", "1,15", "*/10" or "0-30/5". Day of week 0 or 7 is
+    Sunday. As in cron, when both day fields are restricted a day matching
+    either one runs. Times are UTC.
+    """
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields, got {expression!r}")
+
+        self.expression = expression
+        parsed = [self._parse(field, low, high) for field, (low, high) in zip(fields, self._RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays     = {day % 7 for day in weekdays}
+        self.any_day      = fields[2] == '*'
+        self.any_weekday  = fields[4] == '*'
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step = part.split('/')
+                step = int(step)
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(value) for value in part.split('-'))
+            else:
+                start = end = int(part)
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f"cron field {field!r} is out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_month = moment.day in self.days
+        in_week  = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        Returns the first matching minute strictly after `moment`.
+        """
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit  = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"cron expression {self.expression!r} never matches")
+
+
+# ======================================
+#     QUEUE
+# ======================================
+class JobQueue:
+
+    def __init__(self, collection, settings: dict):
+        """
+        Initializes the JobQueue class.
+
+        Args:
+            collection (Collection): The pymongo collection holding the jobs (scheduler_data).
+            settings (dict): BaseConfig.JOBS
+        """
+        self.collection   = collection
+        self.lease        = settings.get("LEASE_SECONDS", 60)
+        self.max_attempts = settings.get("MAX_ATTEMPTS", 5)
+        self.backoff_base = settings.get("BACKOFF_BASE", 5)
+        self.backoff_max  = settings.get("BACKOFF_MAX", 3600)
+        self.retention    = settings.get("RETENTION_SECONDS", 7 * 24 * 3600)
+        self._lock        = threading.Lock()
+        self._counters    = {
+            'enqueued'          : 0,
+            'claimed'           : 0,
+            'empty_claims'      : 0,
+            'completed'         : 0,
+            'retried'           : 0,
+            'failed'            : 0,
+            'released'          : 0,
+            'recovered'         : 0,
+            'lease_lost'        : 0,
+            'claim_seconds'     : 0.0,
+            'claim_seconds_max' : 0.0,
+            'claim_seconds_last': 0.0,
+            'lag_seconds'       : 0.0,
+            'lag_seconds_max'   : 0.0,
+            'lag_seconds_last'  : 0.0,
+            'run_seconds'       : 0.0,
+            'run_seconds_max'   : 0.0,
+        }
+        self._started     = time.monotonic()
+        self._key_index   = False
+        self._index_lock  = threading.Lock()
+
+    # ----- producing --------------------------------
+    def _ensure_key_index(self) -> None:
+        """
+        Creates the unique index on `key` the first time this process uses a
+        key, so deduplication does not depend on `flask sync-indexes` having
+        run. Raises RuntimeError, refusing the key, when a conflicting index
+        on `key` is in the way.
+        """
+        if self._key_index:
+            return
+        with self._index_lock:
+            if self._key_index:
+                return
+            report = reconcile(self.collection, [KEY_INDEX])
+            if report['conflicts']:
+                raise RuntimeError(
+                    f"{self.collection.name}: cannot deduplicate jobs by key, {report['conflicts'][0]}"
+                )
+            self._key_index = True
+
+    def enqueue(self, name: str, payload: dict = None, priority: int = 0, delay: float = 0,
+                run_at: datetime = None, max_attempts: int = None, key: str = None) -> str:
+        """
+        Adds a job to the queue.
+
+        Args:
+            name (str): Name of the registered handler.
+            payload (dict, optional): Argument passed to the handler.
+            priority (int): Higher priorities are claimed first. Defaults to 0.
+            delay (float): Seconds to wait before the job may run.
+            run_at (datetime, optional): UTC time the job may run, instead of delay.
+            max_attempts (int, optional): Runs before the job is marked failed.
+                Defaults to the handler's, then JOBS["MAX_ATTEMPTS"].
+            key (str, optional): Deduplication key. While a job with this key is
+                queued or running, enqueue returns its id instead of adding another.
+
+        Returns:
+            str: The job id.
+        """
+        now      = _now()
+        document = {
+            'name'       : name,
+            'payload'    : payload or {},
+            'status'     : QUEUED,
+            'priority'   : int(priority),
+            'runAt'      : run_at or now + timedelta(seconds=delay),
+            'attempts'   : 0,
+            'maxAttempts': max_attempts or self._max_attempts_of(name),
+            'createdAt'  : now,
+        }
+        if key is not None:
+            self._ensure_key_index()
+            document['key'] = key
+        try:
+            _id = self.collection.insert_one(document).inserted_id
+        except DuplicateKeyError:
+            if key is None:
+                raise
+            existing = self.collection.find_one({'key': key}, {'_id': 1})
+            if existing is None:
+                # finished between the insert and the lookup, try once more
+                return self.enqueue(name, payload, priority, delay, run_at, max_attempts, key)
+            return str(existing['_id'])
+        self._count('enqueued')
+        return str(_id)
+
+    def schedule(self, name: str, cron: str, payload: dict = None, priority: int = 0,
+                 max_attempts: int = None, key: str = None) -> str:
+        """
+        Creates or updates a recurring job. One document per key: after each
+        run, successful or not, it is queued again for the next cron time.
+
+        Args:
+            name (str): Name of the registered handler.
+            cron (str): Five field cron expression in UTC, see CronSchedule.
+            key (str, optional): Identifies the schedule. Defaults to "cron:<name>".
+
+        Returns:
+            str: The job id.
+        """
+        schedule = CronSchedule(cron)
+        key      = key or f"cron:{name}"
+        self._ensure_key_index()
+        now      = _now()
+        before   = self.collection.find_one_and_update(
+            {'key': key},
+            {
+                '$set'        : {
+                    'name'       : name,
+                    'cron'       : cron,
+                    'payload'    : payload or {},
+                    'priority'   : int(priority),
+                    'maxAttempts': max_attempts or self._max_attempts_of(name),
+                },
+                '$setOnInsert': {
+                    'status'   : QUEUED,
+                    'runAt'    : schedule.next_after(now),
+                    'attempts' : 0,
+                    'createdAt': now,
+                },
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return str(self.collection.find_one({'key': key}, {'_id': 1})['_id'])
+
+        if before.get('cron') != cron:
+            # a pending run of the old schedule moves to the new one
+            self.collection.update_one(
+                {'_id': before['_id'], 'status': QUEUED},
+                {'$set': {'runAt': schedule.next_after(now)}}
+            )
+        return str(before['_id'])
+
+    def cancel(self, _id: str) -> bool:
+        """
+        Deletes a job that is not running. Returns True if it was removed.
+        """
+        return self.collection.delete_one({'_id': ObjectId(_id), 'status': {'$ne': RUNNING}}).deleted_count == 1
+
+    # ----- consuming --------------------------------
+    def claim(self, worker_id: str, names: list = None):
+        """
+        Atomically takes the most urgent due job and leases it to `worker_id`.
+
+        Returns:
+            dict or None: The job document after the claim, or None if nothing is due.
+        """
+        now    = _now()
+        filter = {'status': QUEUED, 'runAt': {'$lte': now}}
+        if names:
+            filter['name'] = {'$in': list(names)}
+
+        started = time.perf_counter()
+        claimed = self.collection.find_one_and_update(
+            filter,
+            {
+                '$set': {
+                    'status'    : RUNNING,
+                    'workerId'  : worker_id,
+                    'leaseUntil': now + timedelta(seconds=self.lease),
+                    'startedAt' : now,
+                },
+                '$inc': {'attempts': 1},
+            },
+            sort=[('priority', -1), ('runAt', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        elapsed = time.perf_counter() - started
+
+        if claimed is None:
+            self._count('empty_claims')
+            return None
+
+        lag = max(0.0, (now - claimed['runAt']).total_seconds())
+        with self._lock:
+            counters = self._counters
+            counters['claimed']           += 1
+            counters['claim_seconds']     += elapsed
+            counters['claim_seconds_last'] = elapsed
+            counters['claim_seconds_max']  = max(counters['claim_seconds_max'], elapsed)
+            counters['lag_seconds']       += lag
+            counters['lag_seconds_last']   = lag
+            counters['lag_seconds_max']    = max(counters['lag_seconds_max'], lag)
+        _observe_claim(claimed['name'], elapsed, lag)
+        return claimed
+
+    def heartbeat(self, worker_id: str, ids: list) -> int:
+        """
+        Extends the leases of the given running jobs of `worker_id`.
+        Returns how many were extended; fewer than len(ids) means some
+        leases were lost to the recovery sweep.
+        """
+        if not ids:
+            return 0
+        extended = self.collection.update_many(
+            {'_id': {'$in': list(ids)}, 'workerId': worker_id, 'status': RUNNING},
+            {'$set': {'leaseUntil': _now() + timedelta(seconds=self.lease)}}
+        ).modified_count
+        if extended < len(ids):
+            self._count('lease_lost', len(ids) - extended)
+        return extended
+
+    def complete(self, job: dict, worker_id: str, result=None, seconds: float = 0.0) -> bool:
+        """
+        Marks a claimed job done, or queues the next run of a recurring job.
+        Returns False when the lease was lost and another worker owns the job.
+        """
+        now = _now()
+        if job.get('cron'):
+            update = {
+                '$set'  : {'status': QUEUED, 'attempts': 0, 'finishedAt': now,
+                           'runAt': CronSchedule(job['cron']).next_after(now)},
+                '$unset': {'workerId': '', 'leaseUntil': '', 'lastError': ''},
+            }
+        else:
+            update = {
+                '$set'  : {'status': DONE, 'finishedAt': now,
+                           'expiresAt': now + timedelta(seconds=self.retention)},
+                '$unset': {'workerId': '', 'leaseUntil': '', 'key': ''},
+            }
+            if result is not None:
+                update['$set']['result'] = result
+
+        owned = self._finish(job, worker_id, update)
+        self._record_run(job['name'], 'completed' if owned else 'lease_lost', seconds)
+        return owned
+
+    def fail(self, job: dict, worker_id: str, error: str, seconds: float = 0.0,
+             expired_before: datetime = None) -> str:
+        """
+        Records a failed run: the job is retried with backoff until it ran
+        maxAttempts times, then marked failed (recurring jobs wait for their
+        next cron time instead).
+
+        Args:
+            expired_before (datetime, optional): Only if the lease ended before
+                this time (used by recover_expired).
+
+        Returns:
+            str: "retried", "failed", "rescheduled" or "lease_lost".
+        """
+        now      = _now()
+        attempts = job.get('attempts', 1)
+        if attempts < job.get('maxAttempts', self.max_attempts):
+            outcome = 'retried'
+            update  = {
+                '$set'  : {'status': QUEUED, 'runAt': now + timedelta(seconds=self.backoff(attempts)),
+                           'lastError': error},
+                '$unset': {'workerId': '', 'leaseUntil': ''},
+            }
+        elif job.get('cron'):
+            outcome = 'rescheduled'
+            update  = {
+                '$set'  : {'status': QUEUED, 'attempts': 0, 'finishedAt': now, 'lastError': error,
+                           'runAt': CronSchedule(job['cron']).next_after(now)},
+                '$unset': {'workerId': '', 'leaseUntil': ''},
+            }
+        else:
+            outcome = 'failed'
+            update  = {
+                '$set'  : {'status': FAILED, 'finishedAt': now, 'lastError': error,
+                           'expiresAt': now + timedelta(seconds=self.retention)},
+                '$unset': {'workerId': '', 'leaseUntil': '', 'key': ''},
+            }
+
+        if not self._finish(job, worker_id, update, expired_before):
+            outcome = 'lease_lost'
+        self._record_run(job['name'], 'failed' if outcome == 'rescheduled' else outcome, seconds)
+        return outcome
+
+    def release(self, job: dict, worker_id: str) -> bool:
+        """
+        Gives a claimed job back without running it (worker shutting down).
+        The attempt is not counted.
+        """
+        released = self._finish(job, worker_id, {
+            '$set'  : {'status': QUEUED, 'runAt': _now()},
+            '$unset': {'workerId': '', 'leaseUntil': ''},
+            '$inc'  : {'attempts': -1},
+        })
+        if released:
+            self._count('released')
+        return released
+
+    def recover_expired(self) -> int:
+        """
+        Requeues (or fails, when out of attempts) running jobs whose lease
+        expired because their worker died or hung. Returns how many were recovered.
+        """
+        recovered = 0
+        now       = _now()
+        expired   = self.collection.find(
+            {'status': RUNNING, 'leaseUntil': {'$lt': now}},
+            {'name': 1, 'attempts': 1, 'maxAttempts': 1, 'cron': 1, 'workerId': 1}
+        )
+        for document in expired:
+            # a heartbeat landing in between wins: the lease is checked again in the update
+            if self.fail(document, document.get('workerId'), 'lease expired', expired_before=now) != 'lease_lost':
+                recovered += 1
+        if recovered:
+            self._count('recovered', recovered)
+        return recovered
+
+    def backoff(self, attempts: int) -> float:
+        """
+        Seconds to wait before retrying a job that failed `attempts` times.
+        """
+        delay = min(self.backoff_max, self.backoff_base * 2 ** max(0, attempts - 1))
+        return delay * (0.5 + random.random() / 2)
+
+    # ----- statistics --------------------------------
+    def queue_stats(self) -> dict:
+        """
+        Reads the state of the whole queue (all workers) from the collection.
+
+        Returns:
+            dict: job counts per status, 'due' (queued jobs whose runAt passed)
+            and 'oldest_due_seconds', how long the oldest due job has waited.
+        """
+        now    = _now()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for row in self.collection.aggregate([{'$group': {'_id': '$status', 'count': {'$sum': 1}}}]):
+            counts[row['_id']] = row['count']
+
+        due    = {'status': QUEUED, 'runAt': {'$lte': now}}
+        oldest = self.collection.find_one(due, {'runAt': 1}, sort=[('runAt', 1)])
+        counts['due']                = self.collection.count_documents(due)
+        counts['oldest_due_seconds'] = (now - oldest['runAt']).total_seconds() if oldest else 0.0
+        return counts
+
+    def stats(self, include_queue: bool = True) -> dict:
+        """
+        Returns this process's counters: claims, completions, retries and
+        failures, throughput since start, and average / max / last claim
+        latency, queue lag (due -> claimed) and run time. With include_queue,
+        also the collection-wide counts of queue_stats under 'queue'.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+
+        claimed  = stats['claimed']
+        finished = stats['completed'] + stats['retried'] + stats['failed']
+        uptime   = time.monotonic() - self._started
+        stats['uptime_seconds']        = uptime
+        stats['completed_per_second']  = stats['completed'] / uptime if uptime else 0.0
+        stats['claim_seconds_avg']     = stats['claim_seconds'] / claimed if claimed else 0.0
+        stats['lag_seconds_avg']       = stats['lag_seconds'] / claimed if claimed else 0.0
+        stats['run_seconds_avg']       = stats['run_seconds'] / finished if finished else 0.0
+        if include_queue:
+            stats['queue'] = self.queue_stats()
+        return stats
+
+    # ----- internals --------------------------------
+    def _max_attempts_of(self, name: str) -> int:
+        entry = _handlers.get(name)
+        return (entry and entry[1]) or self.max_attempts
+
+    def _finish(self, job: dict, worker_id: str, update: dict, expired_before: datetime = None) -> bool:
+        # fenced on the owner: a worker whose lease was taken over must not overwrite the new run
+        filter = {'_id': job['_id'], 'status': RUNNING, 'workerId': worker_id}
+        if expired_before is not None:
+            filter['leaseUntil'] = {'$lt': expired_before}
+        return self.collection.update_one(filter, update).modified_count == 1
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _record_run(self, name: str, outcome: str, seconds: float) -> None:
+        with self._lock:
+            counters = self._counters
+            counters[outcome]        += 1
+            counters['run_seconds']     += seconds
+            counters['run_seconds_max']  = max(counters['run_seconds_max'], seconds)
+        if seconds:
+            _observe_run(name, outcome, seconds)
+
+
+def _observe_claim(name: str, elapsed: float, lag: float) -> None:
+    from monitoring.metrics import JOB_CLAIM_DURATION, JOB_QUEUE_LAG, _child
+    JOB_CLAIM_DURATION.observe(elapsed)
+    _child(JOB_QUEUE_LAG, name).observe(lag)
+
+
+def _observe_run(name: str, outcome: str, seconds: float) -> None:
+    from monitoring.metrics import JOB_RUN_DURATION, _child
+    _child(JOB_RUN_DURATION, name, outcome).observe(seconds)
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Returns this process's JobQueue on the scheduler_data collection,
+    configured from BaseConfig.JOBS.
+    """
+    def create():
+        from models.models import SchedulerData
+        return JobQueue(SchedulerData().collection, BaseConfig.JOBS)
+
+    return per_process('job_queue', create)
+
+
+# ======================================
+#     WORKER POOL
+# ======================================
+def _run_handler(func, payload):
+    # module level so process pools can pickle it
+    started = time.perf_counter()
+    return func(payload), time.perf_counter() - started
+
+
+class JobWorker:
+
+    MODES = ("thread", "process")
+
+    def __init__(self, queue: JobQueue, concurrency: int = 4, mode: str = "thread", names: list = None,
+                 poll_interval: float = 1.0, max_poll_interval: float = 5.0,
+                 heartbeat_interval: float = 15.0, recover_interval: float = 30.0):
+        """
+        Initializes the JobWorker class.
+
+        Args:
+            queue (JobQueue): The queue to claim jobs from.
+            concurrency (int): Jobs run at the same time. Defaults to 4.
+            mode (str): "thread" runs handlers on a thread pool, "process" on a
+                process pool (CPU bound handlers). Defaults to "thread".
+            names (list, optional): Only claim jobs with these handler names.
+            poll_interval (float): Seconds to wait after finding the queue empty.
+                Doubles on every empty poll up to max_poll_interval.
+            heartbeat_interval (float): Seconds between lease renewals.
+                Must be well below JOBS["LEASE_SECONDS"].
+            recover_interval (float): Seconds between sweeps for expired leases.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}, got {mode!r}")
+
+        self.queue              = queue
+        self.concurrency        = max(1, int(concurrency))
+        self.mode               = mode
+        self.names              = list(names) if names else sorted(_handlers)
+        self.poll_interval      = poll_interval
+        self.max_poll_interval  = max(poll_interval, max_poll_interval)
+        self.heartbeat_interval = heartbeat_interval
+        self.recover_interval   = recover_interval
+        self.worker_id          = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._slots             = threading.Semaphore(self.concurrency)
+        self._running           = {}
+        self._running_lock      = threading.Lock()
+        self._stop              = threading.Event()
+        self._threads           = []
+        self._executor          = None
+
+    def start(self) -> 'JobWorker':
+        """
+        Starts claiming in background threads and returns immediately.
+        """
+        if self.mode == "process":
+            context        = multiprocessing.get_context(BaseConfig.JOBS.get("PROCESS_START_METHOD", "spawn"))
+            self._executor = ProcessPoolExecutor(max_workers=self.concurrency, mp_context=context)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="job")
+
+        for target, name in ((self._claim_loop, "jobs-claim"), (self._lease_loop, "jobs-lease")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def run(self, timeout: float = 30) -> None:
+        """
+        Runs until SIGTERM / SIGINT, then stops (see stop). Call from the main thread.
+        """
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.set())
+
+        self.start()
+        print(f"jobs: worker {self.worker_id} running {self.concurrency} {self.mode}s for {self.names}")
+        while not stopping.wait(1):
+            pass
+        self.stop(timeout)
+
+    def stop(self, timeout: float = 30) -> bool:
+        """
+        Stops claiming, waits up to `timeout` seconds for running jobs to
+        finish and gives the others back to the queue.
+
+        Returns:
+            bool: True if every running job finished in time.
+        """
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        while self.running() and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        with self._running_lock:
+            unfinished = list(self._running.values())
+        for job in unfinished:
+            # it may still finish later; its completion is then fenced out
+            self.queue.release(job, self.worker_id)
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=not unfinished, cancel_futures=True)
+        for thread in self._threads:
+            thread.join(timeout=1)
+        return not unfinished
+
+    def running(self) -> int:
+        """
+        Returns the number of jobs this worker is running.
+        """
+        with self._running_lock:
+            return len(self._running)
+
+    def stats(self) -> dict:
+        """
+        Returns the queue counters of this process plus the worker's own state.
+        """
+        stats = self.queue.stats()
+        stats.update({
+            'worker_id'  : self.worker_id,
+            'mode'       : self.mode,
+            'concurrency': self.concurrency,
+            'running'    : self.running(),
+        })
+        return stats
+
+    def _claim_loop(self) -> None:
+        idle = self.poll_interval
+        while not self._stop.is_set():
+            if not self._slots.acquire(timeout=self.poll_interval):
+                continue
+            try:
+                job = self.queue.claim(self.worker_id, self.names)
+            except Exception:
+                print(f"jobs: claim failed\n{traceback.format_exc(limit=1)}")
+                job = None
+
+            if job is None:
+                self._slots.release()
+                self._stop.wait(idle)
+                idle = min(idle * 2, self.max_poll_interval)
+                continue
+
+            idle = self.poll_interval
+            self._start_job(job)
+
+    def _start_job(self, job: dict) -> None:
+        entry = _handlers.get(job['name'])
+        if entry is None:
+            self.queue.fail(job, self.worker_id, f"no handler registered for {job['name']!r}")
+            self._slots.release()
+            return
+
+        with self._running_lock:
+            self._running[job['_id']] = job
+        future = self._executor.submit(_run_handler, entry[0], job.get('payload') or {})
+        future.add_done_callback(lambda done: self._finish_job(job, done))
+
+    def _finish_job(self, job: dict, future) -> None:
+        try:
+            try:
+                result, seconds = future.result()
+            except Exception as e:
+                print(f"jobs: {job['name']} {job['_id']} failed (attempt {job['attempts']})\n{traceback.format_exc()}")
+                self.queue.fail(job, self.worker_id, f"{type(e).__name__}: {e}")
+            else:
+                self.queue.complete(job, self.worker_id, result, seconds)
+        except Exception:
+            # the lease expires and the job is recovered by a sweep
+            print(f"jobs: could not record the outcome of {job['_id']}\n{traceback.format_exc()}")
+        finally:
+            with self._running_lock:
+                self._running.pop(job['_id'], None)
+            self._slots.release()
+
+    def _lease_loop(self) -> None:
+        next_recover = time.monotonic()
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                with self._running_lock:
+                    ids = list(self._running)
+                extended = self.queue.heartbeat(self.worker_id, ids)
+                if extended < len(ids):
+                    print(f"jobs: {len(ids) - extended} leases of {self.worker_id} were lost")
+
+                if time.monotonic() >= next_recover:
+                    next_recover = time.monotonic() + self.recover_interval
+                    recovered    = self.queue.recover_expired()
+                    if recovered:
+                        print(f"jobs: requeued {recovered} jobs with expired leases")
+            except Exception:
+                print(f"jobs: lease renewal failed\n{traceback.format_exc(limit=1)}")
+
+
+def create_worker(concurrency: int = None, mode: str = None, names: list = None) -> JobWorker:
+    """
+    Builds a JobWorker from BaseConfig.JOBS after importing HANDLER_MODULES.
+    """
+    import importlib
+    settings = BaseConfig.JOBS
+    for module in settings.get("HANDLER_MODULES", []):
+        importlib.import_module(module)
+
+    return JobWorker(
+        get_job_queue(),
+        concurrency        = concurrency or settings.get("CONCURRENCY", 4),
+        mode               = mode or settings.get("MODE", "thread"),
+        names              = names,
+        poll_interval      = settings.get("POLL_INTERVAL", 1.0),
+        max_poll_interval  = settings.get("MAX_POLL_INTERVAL", 5.0),
+        heartbeat_interval = settings.get("HEARTBEAT_SECONDS", 15),
+        recover_interval   = settings.get("RECOVER_INTERVAL", 30)
+    )
+
+
+@click.command('jobs-worker')
+@click.option('--concurrency', type=int, help='Jobs run at the same time (JOBS["CONCURRENCY"]).')
+@click.option('--mode', type=click.Choice(JobWorker.MODES), help='Run handlers on threads or processes.')
+@click.option('--names', help='Comma separated handler names to claim, default all registered.')
+def jobs_worker_command(concurrency, mode, names):
+    """Claim and run jobs from scheduler_data until stopped."""
+    worker = create_worker(concurrency, mode, names.split(',') if names else None)
+    if not worker.names:
+        raise click.UsageError('no job handlers registered, see JOBS["HANDLER_MODULES"]')
+    worker.run(BaseConfig.JOBS.get("DRAIN_TIMEOUT", 30))
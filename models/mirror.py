@@ -0,0 +1,643 @@
+import copy
+import re
+import threading
+import time
+import traceback
+from collections.abc import Mapping
+from bson import ObjectId, Regex
+from pymongo import ASCENDING
+from pymongo.errors import ConnectionFailure, OperationFailure
+from config import BaseConfig
+from configs.connections import per_process, resources
+
+"""
+In-memory mirror of small, hot collections
+-------------------------------
+Opt in per model by setting a MIRROR dict on the class, and for the
+deployment with BaseConfig.MIRRORS["ENABLED"]:
+
+    class User(BaseModel):
+        MIRROR = {"INDEXES": ["email"]}
+
+The whole collection is loaded into memory on first use (or when the worker
+starts, see configs/lifecycle.py) and BaseModel.find_by_id / find_one /
+find_all / count are answered from it, without a round trip:
+
+    - filters made of equality conditions on scalar values ({"email": "a@b.c",
+      "plan.tier": 2}, array fields match any element, None matches missing
+      fields); operators, regexes, sub-document and array values, raw reads
+      and rows still go to MongoDB,
+    - projections on top-level fields; dotted projections go to MongoDB,
+    - fields listed in INDEXES narrow equality lookups through an in-memory
+      hash index, other fields are matched by a scan of the mirror.
+
+The mirror is kept fresh by a background thread:
+
+    change stream : on a replica set, insert / update / replace / delete events
+                    are applied as they happen (fullDocument "updateLookup");
+                    a lost resume token reloads the collection
+    polling       : on a standalone server, documents whose UPDATED_FIELD
+                    (updatedAt) is newer than the last poll are fetched every
+                    POLL_INTERVAL seconds. BaseModel stamps it ($currentDate)
+                    on every write of a model declaring MIRROR; other writers
+                    must set it too. Deletes are only seen by the full reload
+                    every RESYNC_SECONDS. Until a stamped document exists, polls
+                    do not count as syncs and reads fall back to MongoDB
+                    MAX_STALENESS seconds after each reload.
+
+Writes through BaseModel in this process refresh the written ids before they
+return, so a process reads its own writes: filter writes first read the _ids
+they match (and upserts the _ids they created afterwards). Write-behind
+(*_on_thread) writes refresh the ids the mirror matched when they were queued,
+once they have been written. When no ids are known the sync thread reloads
+the collection and reads go to MongoDB until it is done.
+
+Reloads only run on the sync thread, between two change stream events (or
+polls), so no event is applied to a mirror that is being replaced. Ids
+refreshed by writers while a reload reads the collection are read again
+after the swap.
+
+Reads go to MongoDB while the mirror is loading, and whenever its last
+confirmed sync is older than MAX_STALENESS seconds (sync thread failing).
+Staleness and event lag are in stats() and the geeta_mirror_* metrics.
+A local single-node replica set is enough for change streams:
+
+    mongod --replSet rs0 --dbpath ...   then   mongosh --eval "rs.initiate()"
+
+Settings live in BaseConfig.MIRRORS.
+"""
+
+# not a replica set / mongos: change streams are not available
+_NO_CHANGE_STREAMS = {40573, 40324}
+# the resume token is no longer in the oplog
+_HISTORY_LOST      = {280, 286}
+
+_MISSING = object()
+
+# returned by the readers when a read must go to MongoDB
+NOT_MIRRORED = object()
+
+
+class _Unsupported(Exception):
+    """
+    Raised while matching a filter the mirror cannot answer exactly.
+    """
+
+
+def _path(document: dict, field: str):
+    value = document
+    for part in field.split('.'):
+        if isinstance(value, list):
+            # positional / array-of-documents paths: leave them to MongoDB
+            raise _Unsupported(field)
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _equal(value, expected) -> bool:
+    # bool is an int in Python but not in MongoDB
+    if isinstance(value, bool) != isinstance(expected, bool):
+        return False
+    return value == expected
+
+
+def _matches(document: dict, filter: dict) -> bool:
+    for field, expected in filter.items():
+        value = _path(document, field)
+        if value is _MISSING:
+            if expected is not None:
+                return False
+        elif not (_equal(value, expected) or
+                  (isinstance(value, list) and any(_equal(item, expected) for item in value))):
+            return False
+    return True
+
+
+def _supported_filter(filter: dict) -> bool:
+    for field, expected in filter.items():
+        if field.startswith('$'):
+            return False
+        if isinstance(expected, Mapping):
+            # operators, and sub-document equality, which is key-order sensitive in MongoDB
+            return False
+        if isinstance(expected, (list, tuple)):
+            # array equality has element-order rules of its own
+            return False
+        if isinstance(expected, (re.Pattern, Regex)):
+            # a regex value is a pattern match, not an equality
+            return False
+    return True
+
+
+def _projector(projection):
+    """
+    Returns a function applying a top-level projection to a document, or
+    None when the projection needs MongoDB (dotted fields, operators).
+    """
+    if not projection:
+        return lambda document: document
+    if not isinstance(projection, dict):
+        projection = {field: 1 for field in projection}
+    if any('.' in field or isinstance(value, dict) for field, value in projection.items()):
+        return None
+
+    with_id  = bool(projection.get('_id', 1))
+    included = {field for field, value in projection.items() if value and field != '_id'}
+    excluded = {field for field, value in projection.items() if not value and field != '_id'}
+    if included and excluded:
+        return None
+    if included:
+        if with_id:
+            included.add('_id')
+        return lambda document: {field: value for field, value in document.items() if field in included}
+    if not with_id:
+        excluded.add('_id')
+    return lambda document: {field: value for field, value in document.items() if field not in excluded}
+
+
+def _index_keys(value) -> list:
+    # an array is indexed under each of its elements, like a multikey index
+    values = value if isinstance(value, list) else [value]
+    keys   = []
+    for item in values:
+        try:
+            hash(item)
+            keys.append(item)
+        except TypeError:
+            keys.append(repr(item))
+    return keys
+
+
+class CollectionMirror:
+
+    def __init__(self, collection, settings: dict, indexes: list = None):
+        """
+        Initializes the CollectionMirror class.
+
+        Args:
+            collection (Collection): The pymongo collection to mirror.
+            settings (dict): BaseConfig.MIRRORS
+            indexes (list): Fields to keep an in-memory index on, from the model's MIRROR.
+        """
+        self.collection     = collection
+        self.name           = collection.name
+        self.index_fields   = list(indexes or [])
+        self.max_staleness  = settings.get("MAX_STALENESS", 30)
+        self.max_documents  = settings.get("MAX_DOCUMENTS", 100000)
+        self.max_await_ms   = settings.get("MAX_AWAIT_MS", 1000)
+        self.poll_interval  = settings.get("POLL_INTERVAL", 2)
+        self.poll_overlap   = settings.get("POLL_OVERLAP", 5)
+        self.resync_seconds = settings.get("RESYNC_SECONDS", 300)
+        self.retry_seconds  = settings.get("RETRY_SECONDS", 5)
+        self.updated_field  = settings.get("UPDATED_FIELD", "updatedAt")
+        self.mode           = None
+        self._documents     = {}
+        self._indexes       = {}
+        self._positions     = {}
+        self._next_position = 0
+        self._lock          = threading.RLock()
+        self._start_lock    = threading.Lock()
+        self._stop          = threading.Event()
+        self._thread        = None
+        self._stream        = None
+        self._loaded        = False
+        self._synced_at     = 0.0
+        self._loaded_at     = 0.0
+        self._watermark     = None
+        self._resume_token  = None
+        self._touched       = None
+        self._counters      = {
+            'hits'       : 0,
+            'fallbacks'  : 0,
+            'events'     : 0,
+            'polled'     : 0,
+            'reloads'    : 0,
+            'sync_errors': 0,
+        }
+
+    # ----- lifecycle ----------------------------------------------------
+
+    def start(self) -> None:
+        """
+        Loads the collection and starts the sync thread, once. Never raises:
+        if MongoDB cannot be reached, reads keep going to MongoDB and the
+        thread retries.
+        """
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            try:
+                self._stream = self._open_stream()
+                self.reload()
+            except Exception:
+                self._sync_failed()
+            self._thread = threading.Thread(target=self._run, name=f"mirror-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def fresh(self) -> bool:
+        """
+        True when reads can be served from memory: loaded, and synced
+        within MAX_STALENESS seconds.
+        """
+        return self._loaded and time.time() - self._synced_at <= self.max_staleness
+
+    # ----- reads ----------------------------------------------------------
+
+    def get(self, _id, projection=None):
+        """
+        Returns the document with this _id, or NOT_MIRRORED when the projection
+        cannot be applied in memory.
+        """
+        project = _projector(projection)
+        if project is None:
+            return self._fallback()
+        with self._lock:
+            document = self._documents.get(_id)
+        self._count('hits')
+        return None if document is None else copy.deepcopy(project(document))
+
+    def find(self, filter: dict, projection=None, skip: int = 0, limit: int = 0):
+        """
+        Returns the matching documents in natural (load / insert) order, or
+        NOT_MIRRORED when the filter or projection needs MongoDB.
+        """
+        project = _projector(projection)
+        if project is None or not _supported_filter(filter or {}):
+            return self._fallback()
+        try:
+            with self._lock:
+                found = []
+                for document in self._candidates(filter or {}):
+                    if not _matches(document, filter or {}):
+                        continue
+                    if skip > 0:
+                        skip -= 1
+                        continue
+                    found.append(project(document))
+                    if limit > 0 and len(found) >= limit:
+                        break
+                found = copy.deepcopy(found)
+        except _Unsupported:
+            return self._fallback()
+        self._count('hits')
+        return found
+
+    def count(self, filter: dict):
+        """
+        Returns the number of matching documents, or NOT_MIRRORED, see find.
+        """
+        if not filter:
+            with self._lock:
+                self._counters['hits'] += 1
+                return len(self._documents)
+        if not _supported_filter(filter):
+            return self._fallback()
+        try:
+            with self._lock:
+                count = sum(1 for document in self._candidates(filter) if _matches(document, filter))
+        except _Unsupported:
+            return self._fallback()
+        self._count('hits')
+        return count
+
+    def ids(self, filter: dict):
+        """
+        Returns the _ids of the mirrored documents matching `filter`, or
+        NOT_MIRRORED when the mirror is not loaded or the filter needs MongoDB.
+        """
+        if not self._loaded or not _supported_filter(filter or {}):
+            return NOT_MIRRORED
+        try:
+            with self._lock:
+                return [document['_id'] for document in self._candidates(filter or {})
+                        if _matches(document, filter or {})]
+        except _Unsupported:
+            return NOT_MIRRORED
+
+    def _candidates(self, filter: dict):
+        # caller holds the lock; the smallest bucket of an indexed field, else everything
+        buckets = [
+            self._indexes[field].get(_index_keys(expected)[0], ())
+            for field, expected in filter.items()
+            if field in self._indexes and not isinstance(expected, dict)
+        ]
+        if not buckets:
+            return list(self._documents.values())
+        # in natural order, like the scan
+        ids = sorted(min(buckets, key=len), key=self._positions.__getitem__)
+        return [self._documents[_id] for _id in ids]
+
+    def _fallback(self):
+        self._count('fallbacks')
+        return NOT_MIRRORED
+
+    # ----- writes -------------------------------------------------------
+
+    def reload(self) -> None:
+        """
+        Replaces the mirror with a full read of the collection. Called by
+        start() and the sync thread only, see resync().
+        """
+        started   = time.time()
+        documents = {}
+        with self._lock:
+            self._touched = set()
+        try:
+            for document in self.collection.find({}).batch_size(1000):
+                documents[document['_id']] = document
+                if len(documents) > self.max_documents:
+                    # too large to mirror: stop syncing, reads keep going to MongoDB
+                    print(f"mirror [{self.name}]: more than MAX_DOCUMENTS ({self.max_documents}) documents, not mirrored")
+                    self._stop.set()
+                    return
+
+            with self._lock:
+                self._documents = documents
+                self._rebuild_indexes()
+                self._watermark = max(
+                    (document[self.updated_field] for document in documents.values()
+                     if document.get(self.updated_field) is not None),
+                    default=None
+                )
+                self._loaded    = True
+                self._loaded_at = started
+                self._counters['reloads'] += 1
+                touched, self._touched = self._touched, None
+        finally:
+            with self._lock:
+                self._touched = None
+
+        if touched:
+            # written while the collection was read: the snapshot may predate the write
+            self.refresh(list(touched))
+        self._synced(started)
+
+    def resync(self) -> None:
+        """
+        Asks the sync thread for a full reload, after a write whose ids are
+        unknown. Reads go to MongoDB until the reload is done.
+        """
+        with self._lock:
+            self._loaded = False
+
+    def refresh(self, ids: list) -> None:
+        """
+        Re-reads these ids from MongoDB, after a write made by this process.
+        """
+        ids = [ObjectId(_id) if isinstance(_id, str) and ObjectId.is_valid(_id) else _id for _id in ids]
+        with self._lock:
+            if self._touched is not None:
+                self._touched.update(ids)
+            if not self._loaded:
+                return
+        found = {document['_id']: document for document in self.collection.find({'_id': {'$in': ids}})}
+        with self._lock:
+            for _id in ids:
+                self._apply(_id, found.get(_id))
+
+    def _apply(self, _id, document) -> None:
+        # caller holds the lock; document None removes _id
+        old = self._documents.get(_id)
+        if old is not None:
+            self._unindex(old)
+        if document is None:
+            self._documents.pop(_id, None)
+            self._positions.pop(_id, None)
+            return
+        if old is None:
+            self._positions[_id] = self._next_position
+            self._next_position += 1
+        self._documents[_id] = document
+        self._index(document)
+
+    def _rebuild_indexes(self) -> None:
+        self._indexes        = {field: {} for field in self.index_fields}
+        self._positions      = {_id: position for position, _id in enumerate(self._documents)}
+        self._next_position  = len(self._positions)
+        for document in self._documents.values():
+            self._index(document)
+
+    def _index(self, document: dict) -> None:
+        for field, index in self._indexes.items():
+            try:
+                value = _path(document, field)
+            except _Unsupported:
+                continue
+            if value is _MISSING:
+                value = None
+            for key in _index_keys(value):
+                index.setdefault(key, set()).add(document['_id'])
+
+    def _unindex(self, document: dict) -> None:
+        for field, index in self._indexes.items():
+            try:
+                value = _path(document, field)
+            except _Unsupported:
+                continue
+            if value is _MISSING:
+                value = None
+            for key in _index_keys(value):
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(document['_id'])
+                    if not ids:
+                        del index[key]
+
+    # ----- sync thread --------------------------------------------------
+
+    def _open_stream(self):
+        """
+        Opens the change stream before the initial load, so no write made
+        during the load is missed. Returns None and switches to polling on
+        a server without change streams.
+        """
+        options = {'full_document': 'updateLookup', 'max_await_time_ms': self.max_await_ms}
+        if self._resume_token is not None:
+            options['resume_after'] = self._resume_token
+        else:
+            # nothing to resume from: what happened meanwhile is only seen by a reload
+            self._loaded = False
+        try:
+            stream             = self.collection.watch(**options)
+            self.mode          = 'change_stream'
+            self._resume_token = stream.resume_token
+            return stream
+        except OperationFailure as e:
+            if e.code in _HISTORY_LOST and self._resume_token is not None:
+                # too far behind: start over from a fresh load
+                self._resume_token = None
+                return self._open_stream()
+            if e.code not in _NO_CHANGE_STREAMS:
+                raise
+        except ConnectionFailure:
+            raise
+        except Exception:
+            # drivers / mocks without watch()
+            pass
+        if self.mode != 'poll':
+            print(f"mirror [{self.name}]: change streams unavailable, polling {self.updated_field} "
+                  f"every {self.poll_interval}s")
+        self.mode = 'poll'
+        return None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._stream is None and self.mode != 'poll':
+                    # first start failed, or reopening after an error, resuming where it stopped
+                    self._stream = self._open_stream()
+                if not self._loaded:
+                    self.reload()
+                if self._stream is not None:
+                    self._follow(self._stream)
+                else:
+                    self._poll()
+            except Exception:
+                self._sync_failed()
+                self._close_stream()
+                self._stop.wait(self.retry_seconds)
+
+    def _follow(self, stream) -> None:
+        from monitoring.metrics import MIRROR_EVENT_LAG, _child
+        while not self._stop.is_set() and self._loaded:
+            asked = time.time()
+            event = stream.try_next()
+            self._resume_token = stream.resume_token
+            if event is None:
+                # the server had nothing newer when it answered
+                self._synced(asked)
+                continue
+
+            operation = event['operationType']
+            if operation in ('insert', 'update', 'replace', 'delete'):
+                _id = event['documentKey']['_id']
+                with self._lock:
+                    # the document may have been deleted before the lookup: fullDocument is then None
+                    self._apply(_id, None if operation == 'delete' else event.get('fullDocument'))
+                    self._counters['events'] += 1
+                if event.get('clusterTime') is not None:
+                    _child(MIRROR_EVENT_LAG, self.name).observe(max(0.0, time.time() - event['clusterTime'].time))
+                self._synced(asked)
+            elif operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+                # the stream is over: reopen and reload
+                self._resume_token = None
+                self._close_stream()
+                return
+
+    def _poll(self) -> None:
+        asked = time.time()
+        if asked - self._loaded_at >= self.resync_seconds:
+            # the only way deleted documents leave the mirror when polling
+            self.reload()
+        else:
+            if self._watermark is not None:
+                since  = self._watermark - _overlap(self._watermark, self.poll_overlap)
+                filter = {self.updated_field: {'$gte': since}}
+            else:
+                # nothing stamped yet: look for the first stamped document
+                filter = {self.updated_field: {'$exists': True, '$ne': None}}
+            documents = list(self.collection.find(filter).sort(self.updated_field, ASCENDING))
+            with self._lock:
+                for document in documents:
+                    self._apply(document['_id'], document)
+                    if document.get(self.updated_field) is not None:
+                        self._watermark = document[self.updated_field]
+                self._counters['polled'] += len(documents)
+            # without a watermark a write that is not stamped cannot be seen: claim no
+            # sync, so reads go to MongoDB once the last reload is MAX_STALENESS old
+            if self._watermark is not None:
+                self._synced(asked)
+        self._stop.wait(self.poll_interval)
+
+    def _close_stream(self) -> None:
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
+    def _synced(self, at: float) -> None:
+        self._synced_at = max(self._synced_at, at)
+        from monitoring.metrics import MIRROR_SYNCED, _child
+        _child(MIRROR_SYNCED, self.name).set(self._synced_at)
+
+    def _sync_failed(self) -> None:
+        with self._lock:
+            self._counters['sync_errors'] += 1
+            first = self._counters['sync_errors'] == 1
+        if first:
+            print(f"mirror [{self.name}]: sync failed, reads fall back to MongoDB after "
+                  f"{self.max_staleness}s\n{traceback.format_exc()}")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the mirror's size, sync mode, staleness (seconds since the
+        last confirmed sync) and hit / fallback / event counters.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['documents'] = len(self._documents)
+        stats['mode']      = self.mode
+        stats['loaded']    = self._loaded
+        stats['staleness'] = time.time() - self._synced_at if self._synced_at else None
+        stats['fresh']     = self.fresh()
+        return stats
+
+
+def _overlap(watermark, seconds: float):
+    # updatedAt is a datetime normally, a number of seconds otherwise
+    import datetime
+    return datetime.timedelta(seconds=seconds) if isinstance(watermark, datetime.datetime) else seconds
+
+
+def get_mirror(model) -> CollectionMirror:
+    """
+    Returns this process's mirror of a model's collection, loading it and
+    starting its sync thread on first use. A forked worker starts without
+    mirrors, see configs.connections.
+    """
+    mirror = per_process(('mirror', model.collection.name), lambda: CollectionMirror(
+        model.collection, BaseConfig.MIRRORS, model.MIRROR.get("INDEXES", [])
+    ))
+    mirror.start()
+    return mirror
+
+
+def open_mirrors() -> dict:
+    """
+    Loads the mirror of every model declaring MIRROR, so the first requests
+    of a worker are already served from memory. Returns {collection: loaded}.
+    """
+    from models.base_model import BaseModel
+    import models.models  # registers the application models
+
+    if not BaseConfig.MIRRORS.get("ENABLED", False):
+        return {}
+    loaded  = {}
+    pending = list(BaseModel.__subclasses__())
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        if cls.__dict__.get('MIRROR'):
+            model = cls()
+            loaded[model.collection.name] = model.mirror is not None and model.mirror.fresh()
+    return loaded
+
+
+def mirror_stats() -> dict:
+    """
+    Returns the stats of every mirror started in this process, keyed by collection.
+    """
+    return {key[1]: mirror.stats() for key, mirror in resources('mirror').items()}
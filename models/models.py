@@ -1,17 +1,56 @@
 from models.base_model import BaseModel
+from models.job_queue import KEY_INDEX
+from config import BaseConfig
 
 class Account(BaseModel):
+    CACHE   = {"TTL": 300, "LOCAL_TTL": 10, "MAX_ENTRIES": 5000, "REDIS": True}
+    # read from memory, see models/mirror.py
+    MIRROR  = {"INDEXES": []}
+    INDEXES = [
+        {"KEYS": [("updatedAt", 1)]},
+    ]
+
     def __init__(self):
         super().__init__('accounts')
 
 class User(BaseModel):
+    CACHE   = {"TTL": 300, "LOCAL_TTL": 10, "MAX_ENTRIES": 5000, "REDIS": True}
+    MIRROR  = {"INDEXES": ["email"]}
+    INDEXES = [
+        # unique among users that have an email, users without one are not indexed
+        {"KEYS": [("email", 1)], "UNIQUE": True, "PARTIAL": {"email": {"$type": "string"}}},
+        {"KEYS": [("updatedAt", 1)]},
+    ]
+
     def __init__(self):
         super().__init__('users')
 
 class RequestLogs(BaseModel):
+    # secondary index of the time series: latest requests per route
+    INDEXES = [
+        {"KEYS": [("meta.route", 1), ("timestamp", -1)]},
+    ]
+
     def __init__(self):
         super().__init__('request_logs')
 
+    def ensure_collection(self) -> None:
+        # must exist as a time series / capped collection before create_indexes makes a plain one
+        from monitoring.request_logging import ensure_request_logs_collection
+        ensure_request_logs_collection(self.db, BaseConfig.REQUEST_LOGS)
+
 class SchedulerData(BaseModel):
+    # job queue, see models/job_queue.py
+    INDEXES = [
+        # claim: the most urgent due job
+        {"KEYS": [("status", 1), ("priority", -1), ("runAt", 1)]},
+        # recovery sweep: running jobs with an expired lease
+        {"KEYS": [("status", 1), ("leaseUntil", 1)]},
+        # one pending job per deduplication key, also created on first use
+        KEY_INDEX,
+        # finished jobs are removed after JOBS["RETENTION_SECONDS"]
+        {"KEYS": [("expiresAt", 1)], "TTL": 0},
+    ]
+
     def __init__(self):
-        super().__init__('scheduler_data')
\ No newline at end of file
+        super().__init__('scheduler_data')
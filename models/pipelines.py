@@ -0,0 +1,144 @@
+"""
+Aggregation pipeline builders
+-------------------------------
+Small functions returning pipeline stages, for BaseModel.aggregate and its
+group / facet / top_n shortcuts. They compose by list concatenation:
+
+    from models.pipelines import match, group, top_n
+    pipeline = match({"active": True}) + group("plan.tier", {"accounts": "count", "mrr": ("sum", "amount")})
+    for row in Account().aggregate(pipeline):
+        row["_id"]["plan_tier"], row["accounts"], row["mrr"]
+
+Accumulators are {output field: spec} where spec is
+    "count"                  -> {"$sum": 1}
+    (operator, field)        -> {"$<operator>": "$<field>"}, e.g. ("avg", "age"), ("addToSet", "tag")
+    a dict                   -> used as it is, e.g. {"$max": {"$size": "$items"}}
+"""
+
+
+def field_ref(field: str) -> str:
+    """
+    "plan.tier" -> "$plan.tier"
+    """
+    return field if field.startswith('$') else f"${field}"
+
+
+def group_key(by):
+    """
+    Returns the _id of a $group stage:
+        None               -> null, one group for everything
+        "plan.tier"        -> "$plan.tier"
+        ["country", "a.b"] -> {"country": "$country", "a_b": "$a.b"}
+        a dict             -> used as it is
+    """
+    if by is None or isinstance(by, dict):
+        return by
+    if isinstance(by, str):
+        return field_ref(by)
+    return {field.replace('.', '_'): field_ref(field) for field in by}
+
+
+def accumulator(spec) -> dict:
+    if spec == "count":
+        return {"$sum": 1}
+    if isinstance(spec, dict):
+        return spec
+    operator, field = spec
+    return {f"${operator}": field_ref(field) if isinstance(field, str) else field}
+
+
+def match(filter: dict) -> list:
+    return [{"$match": filter}] if filter else []
+
+
+def group(by, accumulators: dict = None, filter: dict = None, sort: list = None, limit: int = 0) -> list:
+    """
+    Groups the documents matching `filter` by `by` (see group_key).
+
+    Args:
+        by: Grouping key, see group_key.
+        accumulators (dict): Output fields, see the module docstring.
+            Defaults to {"count": "count"}.
+        filter (dict, optional): $match before grouping.
+        sort (list, optional): [(output field, 1 | -1), ...] applied to the groups.
+        limit (int, optional): Keep only the first `limit` groups.
+    """
+    accumulators = accumulators or {"count": "count"}
+    stage        = {"_id": group_key(by)}
+    stage.update({name: accumulator(spec) for name, spec in accumulators.items()})
+
+    pipeline = match(filter) + [{"$group": stage}]
+    if sort:
+        pipeline.append({"$sort": dict(sort)})
+    if limit > 0:
+        pipeline.append({"$limit": limit})
+    return pipeline
+
+
+def top_n(n: int, sort_key: str, direction: int = -1, filter: dict = None, by=None, projection=None) -> list:
+    """
+    The `n` documents with the highest (direction -1) or lowest (1) `sort_key`.
+
+    Without `by`, a $sort followed by a $limit, which the server runs as a
+    top-k sort keeping only n documents in memory (or walks an index on
+    sort_key). With `by`, the top n of every group through $topN (MongoDB 5.2+):
+    one result per group, {"_id": group key, "top": [documents]}.
+
+    Args:
+        projection (list | dict, optional): Fields of the returned documents.
+    """
+    sort = {sort_key: direction, "_id": direction}
+    if by is None:
+        pipeline = match(filter) + [{"$sort": sort}, {"$limit": n}]
+        if projection:
+            pipeline.append({"$project": projection if isinstance(projection, dict) else {field: 1 for field in projection}})
+        return pipeline
+
+    if projection:
+        fields = projection if not isinstance(projection, dict) else [field for field, value in projection.items() if value]
+        output = {field.replace('.', '_'): field_ref(field) for field in fields}
+    else:
+        output = "$$ROOT"
+    return match(filter) + [{"$group": {
+        "_id": group_key(by),
+        "top": {"$topN": {"n": n, "sortBy": sort, "output": output}}
+    }}]
+
+
+def facet(facets: dict, filter: dict = None) -> list:
+    """
+    Runs several sub-pipelines over the same matched documents in one pass.
+    The result is a single document {name: [results of that sub-pipeline]}.
+
+    Args:
+        facets (dict): {name: pipeline}, e.g. {"by_tier": group("plan.tier"), "total": count()}
+        filter (dict, optional): $match applied once, before the facets.
+    """
+    return match(filter) + [{"$facet": facets}]
+
+
+def count(output: str = "count") -> list:
+    """
+    Stage counting its input documents, for facets: [{"count": n}], or [] for none.
+    """
+    return [{"$count": output}]
+
+
+def distinct(field: str, filter: dict = None) -> list:
+    """
+    One {"_id": value} per distinct value of `field` among the documents
+    matching `filter`, with the semantics of the distinct command: array
+    values contribute each element (an empty array none), null is a value,
+    documents without the field are skipped.
+
+    $unwind would drop null values (and keep empty arrays as null with
+    preserveNullAndEmptyArrays), so scalars are wrapped in a one-element
+    array first and only arrays are unwound.
+    """
+    exists = {field: {"$exists": True}}
+    value  = field_ref(field)
+    return match({"$and": [filter, exists]} if filter else exists) + [
+        {"$project": {"_id": 0, "value": {"$cond": [{"$isArray": value}, value, [value]]}}},
+        {"$unwind": "$value"},
+        {"$group": {"_id": "$value"}},
+    ]
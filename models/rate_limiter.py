@@ -0,0 +1,341 @@
+import hashlib
+import math
+import threading
+import time
+import traceback
+import uuid
+from collections import namedtuple
+import redis
+from config import BaseConfig
+from configs.connections import per_process
+from models.redis_client import RedisClient
+
+"""
+Admission control for /test/implementation
+-------------------------------
+Every request is checked against token buckets and concurrency limits
+before it runs:
+
+    per token      : BaseConfig.ADMISSION["TOKENS"][token], else ["DEFAULT"]
+    per method     : ["METHODS"][method name]         shared by all clients
+    per collection : ["COLLECTIONS"][collection name] shared by all clients
+
+A rule is {"RATE": requests per second, "BURST": bucket size, "CONCURRENCY":
+requests in flight}, each part optional. A batch costs one token per
+operation; its methods and collections are charged for the operations
+that use them.
+
+All buckets and slots of a request are checked and taken by one Lua script,
+so admission is one Redis round trip and either everything is taken or
+nothing is. Releasing the concurrency slots afterwards is one more. Slots of
+a worker that died expire after SLOT_TTL seconds. The script reads the
+clock with TIME, which needs Redis 5 or later.
+
+When Redis cannot be reached the same limits are enforced per process by
+in-memory buckets, and Redis is tried again RETRY_SECONDS later.
+
+    limiter = get_rate_limiter()
+    ticket  = limiter.acquire(token, [("test_mongo_get", {"collection": "accounts"})])
+    try:
+        ...
+    finally:
+        ticket.release()
+
+A refused request raises RateLimited; its retry_after is what the client
+gets in the Retry-After header of the 429.
+"""
+
+# KEYS   : token bucket keys, then concurrency keys
+# ARGV   : bucket count, slot member, slot ttl (ms),
+#          rate (per second), burst, cost for every bucket,
+#          limit for every concurrency key
+# returns: {1, 0} admitted, {0, retry after ms, index of the refusing key} refused
+ACQUIRE_SCRIPT = """
+local clock   = redis.call('TIME')
+local now     = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local buckets = tonumber(ARGV[1])
+local member  = ARGV[2]
+local ttl     = tonumber(ARGV[3])
+local tokens  = {}
+local wait    = 0
+local refused = 0
+
+for i = 1, buckets do
+    local rate  = tonumber(ARGV[1 + i * 3])
+    local burst = tonumber(ARGV[2 + i * 3])
+    local cost  = tonumber(ARGV[3 + i * 3])
+    local saved = redis.call('HMGET', KEYS[i], 'tokens', 'at')
+    local left  = tonumber(saved[1]) or burst
+    local at    = tonumber(saved[2]) or now
+    left = math.min(burst, left + math.max(0, now - at) * rate / 1000)
+    if left < cost then
+        local need = math.ceil((cost - left) * 1000 / rate)
+        if need > wait then wait = need; refused = i end
+    end
+    tokens[i] = left
+end
+
+local first = 4 + buckets * 3
+for j = buckets + 1, #KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[j], '-inf', now)
+    if redis.call('ZCARD', KEYS[j]) >= tonumber(ARGV[first + j - buckets - 1]) then
+        if wait < 1000 then wait = 1000; refused = j end
+    end
+end
+
+if refused > 0 then
+    return {0, wait, refused}
+end
+
+for i = 1, buckets do
+    local rate  = tonumber(ARGV[1 + i * 3])
+    local burst = tonumber(ARGV[2 + i * 3])
+    local left  = tokens[i] - tonumber(ARGV[3 + i * 3])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(left), 'at', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil((burst - left) * 1000 / rate) + 1000)
+end
+for j = buckets + 1, #KEYS do
+    redis.call('ZADD', KEYS[j], now + ttl, member)
+    redis.call('PEXPIRE', KEYS[j], ttl)
+end
+return {1, 0, 0}
+"""
+
+# one checked limit: scope is "token", "method" or "collection", name what it applies to
+Limit = namedtuple('Limit', ['scope', 'name', 'key', 'rate', 'burst', 'cost', 'concurrency'])
+
+
+class RateLimited(Exception):
+    """
+    Raised by RateLimiter.acquire when a request is over one of its limits.
+    """
+
+    def __init__(self, retry_after: float, scope: str, name: str):
+        self.retry_after = retry_after
+        self.scope       = scope
+        self.name        = name
+        super().__init__(f"Too many requests for {scope} {name}, retry in {retry_after:.1f}s")
+
+
+class Ticket:
+    """
+    Admission of one request. release() gives its concurrency slots back;
+    calling it more than once does nothing.
+    """
+
+    def __init__(self, limiter, limits: list, member: str, local: bool):
+        self._limiter = limiter
+        self._limits  = [limit for limit in limits if limit.concurrency]
+        self._member  = member
+        self._local   = local
+        self._done    = not self._limits
+
+    def release(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._limiter._release(self._limits, self._member, self._local)
+
+
+class LocalLimiter:
+    """
+    In-process token buckets and concurrency counters with the same rules,
+    used while Redis is unreachable. Every process enforces them on its own.
+    """
+
+    def __init__(self):
+        self._buckets  = {}
+        self._inflight = {}
+        self._lock     = threading.Lock()
+
+    def acquire(self, limits: list):
+        """
+        Returns None if admitted, else (retry after seconds, refusing limit).
+        """
+        now = time.monotonic()
+        with self._lock:
+            wait, refused, levels = 0.0, None, {}
+            for limit in limits:
+                if limit.rate:
+                    tokens, at = self._buckets.get(limit.key, (limit.burst, now))
+                    tokens     = min(limit.burst, tokens + (now - at) * limit.rate)
+                    levels[limit.key] = tokens
+                    if tokens < limit.cost and (limit.cost - tokens) / limit.rate > wait:
+                        wait, refused = (limit.cost - tokens) / limit.rate, limit
+                if limit.concurrency and self._inflight.get(limit.key, 0) >= limit.concurrency and wait < 1:
+                    wait, refused = 1.0, limit
+            if refused is not None:
+                return wait, refused
+
+            for limit in limits:
+                if limit.rate:
+                    self._buckets[limit.key] = (levels[limit.key] - limit.cost, now)
+                if limit.concurrency:
+                    self._inflight[limit.key] = self._inflight.get(limit.key, 0) + 1
+        return None
+
+    def release(self, limits: list) -> None:
+        with self._lock:
+            for limit in limits:
+                self._inflight[limit.key] = max(0, self._inflight.get(limit.key, 0) - 1)
+
+
+class RateLimiter:
+
+    def __init__(self, settings: dict):
+        """
+        Initializes the RateLimiter class.
+
+        Args:
+            settings (dict): BaseConfig.ADMISSION
+        """
+        self.enabled       = settings.get("ENABLED", True)
+        self.prefix        = settings.get("KEY_PREFIX", "admission:")
+        self.default       = settings.get("DEFAULT", {})
+        self.tokens        = settings.get("TOKENS", {})
+        self.methods       = settings.get("METHODS", {})
+        self.collections   = settings.get("COLLECTIONS", {})
+        self.slot_ttl      = settings.get("SLOT_TTL", 60)
+        self.retry_seconds = settings.get("RETRY_SECONDS", 5)
+        self.redis_db      = settings.get("REDIS_DB", 0)
+        self.local         = LocalLimiter()
+        self._script       = None
+        self._redis_down   = 0.0
+        self._lock         = threading.Lock()
+        self._counters     = {'admitted': 0, 'limited': 0, 'local': 0, 'redis_errors': 0}
+
+    def limits(self, token: str, operations: list) -> list:
+        """
+        Returns the Limits that apply to a request.
+
+        Args:
+            token (str): The client's auth token.
+            operations (list): [(method name, parameters), ...], one per operation.
+        """
+        limits = []
+        rule   = self.tokens.get(token, self.default)
+        # tokens are secrets, keep them out of Redis keys
+        digest = hashlib.sha1(token.encode()).hexdigest()[:16] if token else 'anonymous'
+        self._add(limits, 'token', digest, rule, len(operations))
+
+        for scope, rules, names in (
+            ('method', self.methods, [method for method, _ in operations]),
+            ('collection', self.collections, [(parameters or {}).get('collection') for _, parameters in operations]),
+        ):
+            counts = {}
+            for name in names:
+                if name in rules:
+                    counts[name] = counts.get(name, 0) + 1
+            for name, cost in counts.items():
+                self._add(limits, scope, name, rules[name], cost)
+        return limits
+
+    def _add(self, limits: list, scope: str, name: str, rule: dict, cost: int) -> None:
+        rate        = float(rule.get("RATE") or 0)
+        concurrency = int(rule.get("CONCURRENCY") or 0)
+        if not rate and not concurrency:
+            return
+        burst = float(rule.get("BURST") or rate)
+        # a batch larger than the bucket could never be admitted
+        cost  = min(cost, burst) if rate else 0
+        limits.append(Limit(scope, name, f"{self.prefix}{scope}:{name}", rate, burst, cost, concurrency))
+
+    def acquire(self, token: str, operations: list) -> Ticket:
+        """
+        Takes the tokens and concurrency slots of a request.
+
+        Returns:
+            Ticket: release() it when the request is finished.
+
+        Raises:
+            RateLimited: when any limit is exceeded; nothing is taken then.
+        """
+        limits = self.limits(token, operations) if self.enabled else []
+        member = uuid.uuid4().hex
+        if not limits:
+            return Ticket(self, limits, member, local=True)
+
+        if time.monotonic() >= self._redis_down:
+            try:
+                refused = self._acquire_redis(limits, member)
+                return self._decide(limits, member, refused, local=False)
+            except redis.RedisError:
+                # unreachable, or refusing the script (OOM, READONLY replica, ...)
+                self._redis_down = time.monotonic() + self.retry_seconds
+                self._count('redis_errors')
+                print(f"admission: Redis failed, limiting per process for {self.retry_seconds}s\n"
+                      f"{traceback.format_exc(limit=1)}")
+
+        self._count('local')
+        return self._decide(limits, member, self.local.acquire(limits), local=True)
+
+    def _decide(self, limits: list, member: str, refused, local: bool) -> Ticket:
+        if refused is not None:
+            wait, limit = refused
+            self._count('limited')
+            from monitoring.metrics import ADMISSION_REJECTED, _child
+            _child(ADMISSION_REJECTED, limit.scope).inc()
+            raise RateLimited(wait, limit.scope, limit.name)
+        self._count('admitted')
+        return Ticket(self, limits, member, local)
+
+    def _acquire_redis(self, limits: list, member: str):
+        buckets = [limit for limit in limits if limit.rate]
+        slots   = [limit for limit in limits if limit.concurrency]
+        args    = [len(buckets), member, int(self.slot_ttl * 1000)]
+        for limit in buckets:
+            args.extend((limit.rate, limit.burst, limit.cost))
+        args.extend(limit.concurrency for limit in slots)
+
+        admitted, wait, index = self._acquire_script()(keys=[limit.key for limit in buckets] +
+                                                            [f"{limit.key}:inflight" for limit in slots], args=args)
+        if admitted:
+            return None
+        return wait / 1000, (buckets + slots)[index - 1]
+
+    def _acquire_script(self):
+        # Script runs EVALSHA and loads the script only when Redis does not know it yet
+        if self._script is None:
+            self._script = RedisClient(db=self.redis_db).redis_client.register_script(ACQUIRE_SCRIPT)
+        return self._script
+
+    def _release(self, limits: list, member: str, local: bool) -> None:
+        if local:
+            self.local.release(limits)
+            return
+        try:
+            pipeline = RedisClient(db=self.redis_db).redis_client.pipeline(transaction=False)
+            for limit in limits:
+                pipeline.zrem(f"{limit.key}:inflight", member)
+            pipeline.execute()
+        except redis.RedisError:
+            # the slot expires after SLOT_TTL
+            print(f"admission: could not release slots\n{traceback.format_exc(limit=1)}")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> dict:
+        """
+        Returns admitted / limited request counts of this process, how many
+        were decided locally, and whether Redis is currently bypassed.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats['redis_bypassed'] = time.monotonic() < self._redis_down
+        return stats
+
+
+def retry_after_header(seconds: float) -> str:
+    """
+    Retry-After value for a RateLimited: whole seconds, at least 1.
+    """
+    return str(max(1, math.ceil(seconds)))
+
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Returns this process's RateLimiter, configured from BaseConfig.ADMISSION.
+    """
+    return per_process('rate_limiter', lambda: RateLimiter(BaseConfig.ADMISSION))
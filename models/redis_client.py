@@ -1,51 +1,197 @@
 import redis
-import pickle
-from os import environ
-from flask import Flask
+import threading
+import time
+import uuid
+from configs.connections import per_process, resources, setting, env_verb
+from models.redis_codecs import ValueSerializer
+from monitoring.metrics import instrument_redis
 
-app = Flask(__name__)
-app.config.from_object('config.BaseConfig')
+_serializers = {}
 
-env_verb     = "LOCAL" if environ['FLASK_ENV'] == 'development' else "PROD"
-redis_config = app.config['REDIS'][env_verb]
 
+def redis_settings() -> dict:
+    """
+    Returns the REDIS section (HOST, PORT, SSL) for the current environment.
+    """
+    return setting('REDIS')[env_verb()]
+
+
+def pool_options(host, port, db=0) -> dict:
+    """
+    Connection pool arguments for (host, port, db) from BaseConfig.REDIS_POOL,
+    shared by the sync and async clients.
+    """
+    pool_config = setting('REDIS_POOL', {})
+    return {
+        'host'                  : host,
+        'port'                  : int(port),
+        'db'                    : int(db),
+        'max_connections'       : pool_config.get('MAX_CONNECTIONS', 50),
+        'timeout'               : pool_config.get('POOL_TIMEOUT', 5),
+        'health_check_interval' : pool_config.get('HEALTH_CHECK_INTERVAL', 30),
+        'socket_timeout'        : pool_config.get('SOCKET_TIMEOUT', 5),
+        'socket_connect_timeout': pool_config.get('CONNECT_TIMEOUT', 5)
+    }
+
+
+def expires_now(expire_seconds) -> bool:
+    """
+    True for a TTL of zero or less. Redis refuses SET ... EX with it, where
+    EXPIRE deletes the key, so writes with such a TTL delete the key instead.
+    """
+    return expire_seconds is not None and expire_seconds <= 0
+
+
+def get_serializer(codec: str = None) -> ValueSerializer:
+    """
+    Returns the shared value serializer for a codec name, built from
+    BaseConfig.REDIS_CODEC. None selects the configured default codec.
+    """
+    codec_config = setting('REDIS_CODEC', {})
+    codec        = codec or codec_config.get('CODEC', 'pickle')
+    serializer   = _serializers.get(codec)
+    if serializer is None:
+        serializer = ValueSerializer(
+            codec,
+            compression  = codec_config.get('COMPRESSION'),
+            threshold    = codec_config.get('COMPRESS_THRESHOLD', 1024),
+            prefixes     = codec_config.get('PREFIXES'),
+            allow_pickle = codec_config.get('ALLOW_PICKLE', True)
+        )
+        _serializers[codec] = serializer
+    return serializer
+
+
+class TimedConnectionPool(redis.BlockingConnectionPool):
+    """
+    BlockingConnectionPool that keeps track of checked-out connections
+    and of how long callers waited to get one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock  = threading.Lock()
+        self._checked_out = 0
+        self._checkouts   = 0
+        self._wait_total  = 0.0
+        self._wait_max    = 0.0
+
+    def get_connection(self, *args, **kwargs):
+        started    = time.perf_counter()
+        connection = super().get_connection(*args, **kwargs)
+        waited     = time.perf_counter() - started
+        with self._stats_lock:
+            self._checked_out += 1
+            self._checkouts   += 1
+            self._wait_total  += waited
+            self._wait_max     = max(self._wait_max, waited)
+        return connection
+
+    def reset(self):
+        super().reset()
+        # also called after a fork: the child starts with no checked-out connections
+        self._checked_out = 0
+
+    def release(self, connection):
+        super().release(connection)
+        with self._stats_lock:
+            self._checked_out = max(0, self._checked_out - 1)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            created = len(self._connections)
+            return {
+                'max_connections' : self.max_connections,
+                'created'         : created,
+                'in_use'          : self._checked_out,
+                'idle'            : max(0, created - self._checked_out),
+                'checkouts'       : self._checkouts,
+                'wait_seconds_avg': self._wait_total / self._checkouts if self._checkouts else 0.0,
+                'wait_seconds_max': self._wait_max
+            }
+
+
+def get_pool(host, port, db=0, ssl=False) -> TimedConnectionPool:
+    """
+    Returns this process's connection pool for (host, port, db, ssl),
+    creating it from BaseConfig.REDIS_POOL on first use. A forked worker
+    gets its own pool, see configs.connections.
+    """
+    def create():
+        options = pool_options(host, port, db)
+        if ssl:
+            options['connection_class'] = redis.SSLConnection
+            options['ssl_cert_reqs']    = None
+        return TimedConnectionPool(**options)
+
+    return per_process(('redis', host, int(port), int(db), bool(ssl)), create)
+
+
+def pool_stats() -> dict:
+    """
+    Returns the stats of every Redis pool of this process,
+    keyed by "host:port/db".
+    """
+    return {f"{host}:{port}/{db}": pool.stats() for (_, host, port, db, ssl), pool in resources('redis').items()}
+
+
+@instrument_redis
 class RedisClient:
 
-    ENCODING   = 'utf-8'
-    REDIS_HOST = redis_config['HOST']
-    REDIS_PORT = redis_config['PORT']
-    REDIS_SSL  = redis_config['SSL']
+    ENCODING = 'utf-8'
+
+    # optionally stores a result, then deletes the lock only if it still holds the caller's token
+    RELEASE_LOCK_SCRIPT = """
+if #KEYS > 1 then redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3]) end
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
 
-    # print(redis_config) if app.config['DEBUG'] else None
+    # releases the lock unless waiters registered at KEYS[2]: 1 released, 2 awaited, 0 not held
+    RELEASE_UNLESS_AWAITED_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then return 0 end
+if tonumber(redis.call('GET', KEYS[2]) or '0') > 0 then return 2 end
+redis.call('DEL', KEYS[1])
+return 1
+"""
 
-    def __init__(self, host=REDIS_HOST, port=REDIS_PORT, ssl=REDIS_SSL, db=0):
+    # reads a namespace's generation counters and the value stored under them
+    GENERATION_GET_SCRIPT = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+for i = 2, #KEYS do generation = generation .. '.' .. (redis.call('GET', KEYS[i]) or '0') end
+local key = ARGV[1] .. generation .. ARGV[2]
+return {key, redis.call('GET', key)}
+"""
+
+    def __init__(self, host=None, port=None, ssl=None, db=0, codec=None):
         """
         Initializes the RedisClient class.
 
         Args:
             host (str): The host address of the Redis server.
-                Defaults to the class constant REDIS_HOST.
+                Defaults to HOST of BaseConfig.REDIS for the current environment.
             port (int): The port number of the Redis server.
-                Defaults to the class constant REDIS_PORT.
+                Defaults to PORT of BaseConfig.REDIS.
+            ssl (bool): Use TLS. Defaults to SSL of BaseConfig.REDIS.
             db (int): The Redis database to connect to.
                 Defaults to 0.
 
-            PARAMS FOR REDIS CONNECTION
-            ssl = True, ssl_cert_reqs = None, socket_connect_timeout = 50
-        """
-        self.host = host
-        self.port = port
-        self.db   = db
-        self.ssl  = ssl
-        # self.redis_client = redis.StrictRedis(
-        self.redis_client = redis.Redis(
-            host=self.host,
-            port=self.port,
-            db=self.db,
-            ssl=self.ssl,
-            ssl_cert_reqs=None,
-            socket_connect_timeout=60
-        )
+            Connections come from a process-wide pool shared by every
+            RedisClient with the same (host, port, db, ssl), so creating
+            a client per request does not open a new connection.
+            Pool sizing comes from BaseConfig.REDIS_POOL.
+            codec (str, optional): Value codec for this client ("pickle",
+                "msgpack", "orjson" or "raw"). Defaults to BaseConfig.REDIS_CODEC;
+                per-prefix overrides from the config still apply.
+        """
+        redis_config      = redis_settings()
+        self.host         = redis_config['HOST'] if host is None else host
+        self.port         = redis_config['PORT'] if port is None else port
+        self.db           = db
+        self.ssl          = redis_config['SSL'] if ssl is None else ssl
+        self.pool         = get_pool(self.host, self.port, self.db, self.ssl)
+        self.redis_client = redis.Redis(connection_pool=self.pool)
+        self.serializer   = get_serializer(codec)
 
     def check_connection(self):
         try:
@@ -75,14 +221,17 @@ class RedisClient:
             value: The value to store
             expire_seconds (int, optional): The number of seconds after which the
                 key should expire. If not given, the key will persist indefinitely.
+                Zero or less deletes the key.
 
         Returns:
             None
         """
-        serialized_data = pickle.dumps(value)
-        self.redis_client.set(key, serialized_data)
-        if expire_seconds is not None:
-            self.redis_client.expire(key, expire_seconds)
+        if expires_now(expire_seconds):
+            self.redis_client.delete(key)
+            return
+        serialized_data = self.serializer.dumps(key, value)
+        # SET ... EX in one atomic command
+        self.redis_client.set(key, serialized_data, ex=expire_seconds)
 
     def get(self, key):
         """
@@ -95,12 +244,136 @@ class RedisClient:
             The value stored at the given key, or None if the key does not
             exist.
         """
-        if self.redis_client.exists(key):
-            value = self.redis_client.get(key)
-            deserialized_data = pickle.loads(value)
-        else:
-            deserialized_data =  None
-        return deserialized_data
+        value = self.redis_client.get(key)
+        return None if value is None else self.serializer.loads(value)
+
+    def incr(self, key) -> int:
+        """
+        Increments the integer counter at the given key (0 when missing)
+        and returns its new value.
+        """
+        return self.redis_client.incr(key)
+
+    def incr_many(self, keys: list, expire_seconds=None) -> list:
+        """
+        Increments several counters in one round trip and returns their new
+        values. With `expire_seconds`, each counter expires that long after
+        its last increment.
+        """
+        if not keys:
+            return []
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.incr(key)
+            if expire_seconds:
+                pipeline.expire(key, int(expire_seconds))
+        values = pipeline.execute()
+        return values[::2] if expire_seconds else values
+
+    def get_generational(self, generation_keys: list, prefix: str, suffix: str) -> tuple:
+        """
+        Reads the counters at `generation_keys` and the value stored at
+        prefix + "<counter 1>.<counter 2>..." + suffix in one round trip.
+        Incrementing one of the counters (incr) makes every key built on its
+        old value unreachable at once; they expire on their own.
+
+        Returns:
+            tuple: (the key that was read, its value or None), so a miss can
+            be filled under the generation it was read at.
+        """
+        key, value = self.redis_client.eval(self.GENERATION_GET_SCRIPT, len(generation_keys), *generation_keys,
+                                            prefix, suffix)
+        key = key.decode(self.ENCODING) if isinstance(key, bytes) else key
+        return key, None if value is None else self.serializer.loads(value)
+
+    def acquire_lock(self, key, ttl_seconds: float):
+        """
+        Takes a short-lived lock with SET NX PX.
+
+        Args:
+            key (str): The lock key.
+            ttl_seconds (float): The lock expires after this long if it is never released.
+
+        Returns:
+            str or None: The token to release the lock with, or None if it is held.
+        """
+        token = uuid.uuid4().hex
+        # stored through the serializer like any value, so scans and dumps can read it
+        if self.redis_client.set(key, self.serializer.dumps(key, token), nx=True, px=max(1, int(ttl_seconds * 1000))):
+            return token
+        return None
+
+    def lock_token(self, key):
+        """
+        Returns the token of the lock held at `key`, or None when it is free.
+        """
+        value = self.redis_client.get(key)
+        return None if value is None else self.serializer.loads(value)
+
+    def release_lock(self, key, token: str, result_key=None, result=None, expire_seconds: int = 60) -> bool:
+        """
+        Releases a lock taken with acquire_lock, unless it expired and was
+        taken by someone else in the meantime.
+
+        Args:
+            result_key (str, optional): Also store `result` at this key for
+                `expire_seconds`, in the same round trip, before the lock goes
+                away (see wait_for).
+        """
+        stored = self.serializer.dumps(key, token)
+        if result_key is None:
+            return self.redis_client.eval(self.RELEASE_LOCK_SCRIPT, 1, key, stored) == 1
+        data = self.serializer.dumps(result_key, result)
+        return self.redis_client.eval(self.RELEASE_LOCK_SCRIPT, 2, key, result_key, stored, data, int(expire_seconds)) == 1
+
+    def release_lock_unless_awaited(self, key, token: str, result_key) -> bool:
+        """
+        Releases a lock taken with acquire_lock unless a wait_for registered
+        for its result at `result_key`. Lets the holder skip serializing and
+        storing a result nobody reads.
+
+        Returns:
+            bool: True when someone waits: the lock is still held and must be
+            released with release_lock(key, token, result_key, result).
+        """
+        stored = self.serializer.dumps(key, token)
+        return self.redis_client.eval(self.RELEASE_UNLESS_AWAITED_SCRIPT, 2, key, f"{result_key}:waiters", stored) == 2
+
+    def wait_for(self, key, lock_key, timeout: float, poll_interval: float = 0.005):
+        """
+        Waits for the holder of `lock_key` to publish its result at
+        f"{key}:{token}" (see release_lock), polling the result and the lock
+        in one round trip with a growing interval (up to 50 ms). Only the
+        result of the lock held when waiting starts is returned, never one
+        left by an earlier holder. The wait is registered at
+        f"{key}:{token}:waiters" first, see release_lock_unless_awaited.
+
+        Returns:
+            The result, or None when the lock was free, released (or the
+            timeout passed) without a result being written.
+        """
+        token = self.lock_token(lock_key)
+        if token is None:
+            return None
+        result_key = f"{key}:{token}"
+        stored     = self.serializer.dumps(lock_key, token)
+        deadline   = time.monotonic() + timeout
+        self.redis_client.pipeline(transaction=False) \
+            .incr(f"{result_key}:waiters").expire(f"{result_key}:waiters", int(timeout) + 1).execute()
+        delay      = poll_interval
+        while True:
+            pipeline = self.redis_client.pipeline(transaction=False)
+            value, holder = pipeline.get(result_key).get(lock_key).execute()
+            if value is None and holder != stored:
+                # released between the two GETs: the result was written before the lock went away
+                value = self.redis_client.get(result_key)
+            if value is not None:
+                return self.serializer.loads(value)
+            remaining = deadline - time.monotonic()
+            if holder != stored or remaining <= 0:
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.05)
 
     def delete(self, key):
         """
@@ -117,6 +390,120 @@ class RedisClient:
     def exists(self, key):
         return True if self.redis_client.exists(key) == 1 else False
 
+    def mget(self, keys: list) -> list:
+        """
+        Retrieves the values of several keys with a single MGET.
+
+        Args:
+            keys (list[str]): The keys to retrieve.
+
+        Returns:
+            list: The values in the same order as the keys,
+            with None for keys that do not exist.
+        """
+        if not keys:
+            return []
+        values = self.redis_client.mget(keys)
+        return [None if value is None else self.serializer.loads(value) for value in values]
+
+    def mset(self, mapping: dict, expire_seconds=None):
+        """
+        Stores several key-value pairs in a single round trip.
+
+        Args:
+            mapping (dict): The key-value pairs to store.
+            expire_seconds (int or dict, optional): Either one TTL applied to
+                every key, or a {key: seconds} dict for per-key TTLs. Keys
+                without a TTL persist indefinitely, keys with zero or less are deleted.
+
+        Returns:
+            None
+        """
+        if not mapping:
+            return
+
+        if expire_seconds is None:
+            self.redis_client.mset({key: self.serializer.dumps(key, value) for key, value in mapping.items()})
+            return
+
+        # MSET has no TTL option, so pipeline one SET ... EX per key instead
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            ttl = expire_seconds.get(key) if isinstance(expire_seconds, dict) else expire_seconds
+            if expires_now(ttl):
+                pipeline.delete(key)
+            else:
+                pipeline.set(key, self.serializer.dumps(key, value), ex=ttl)
+        pipeline.execute()
+
+    def delete_many(self, keys, chunk_size: int = 1000) -> int:
+        """
+        Deletes many keys, sending one DEL per chunk of keys.
+
+        Args:
+            keys (iterable[str]): The keys to delete. May be a generator.
+            chunk_size (int): Number of keys per DEL. Defaults to 1000.
+
+        Returns:
+            int: The number of keys deleted.
+        """
+        deleted = 0
+        chunk   = []
+        for key in keys:
+            chunk.append(key)
+            if len(chunk) >= chunk_size:
+                deleted += self.redis_client.delete(*chunk)
+                chunk = []
+        if chunk:
+            deleted += self.redis_client.delete(*chunk)
+        return deleted
+
+    def iter_keys(self, pattern='*', count: int = 1000):
+        """
+        Yields the keys matching the given pattern, one SCAN page at a time.
+
+        Args:
+            pattern (str): The pattern to match the keys against. Defaults to '*'.
+            count (int): SCAN COUNT hint, i.e. roughly how many keys per round trip.
+
+        Yields:
+            str: The matching keys.
+        """
+        for key in self.redis_client.scan_iter(pattern, count=count):
+            yield key.decode(self.ENCODING)
+
+    def scan_items(self, pattern='*', count: int = 1000):
+        """
+        Yields the key-value pairs matching the given pattern. Each SCAN page
+        is followed by one MGET for its keys, so a full dump costs about two
+        round trips per `count` keys and never holds more than one page.
+
+        Args:
+            pattern (str): The pattern to match the keys against. Defaults to '*'.
+            count (int): SCAN COUNT hint. Defaults to 1000.
+
+        Yields:
+            tuple[str, Any]: (key, value) pairs. Keys deleted between the
+            SCAN and the MGET are skipped, and so are values this client
+            cannot decode (written by other clients or codecs).
+        """
+        cursor = 0
+        while True:
+            cursor, keys = self.redis_client.scan(cursor, match=pattern, count=count)
+            if keys:
+                values = self.redis_client.mget(keys)
+                for key, value in zip(keys, values):
+                    if value is None:
+                        continue
+                    try:
+                        decoded = self.serializer.loads(value)
+                    except Exception:
+                        # counters (INCR) and values written by other tools
+                        continue
+                    yield key.decode(self.ENCODING), decoded
+            if cursor == 0:
+                return
+
     def keys(self, pattern='*'):
         """
         Retrieves all keys matching the given pattern
@@ -128,25 +515,32 @@ class RedisClient:
 
         Returns:
             list[str]: A list of keys matching the given pattern.
+            Use iter_keys to stream them instead.
         """
-        keys = self.redis_client.scan_iter(pattern)
-        return [key.decode(self.ENCODING) for key in keys]
+        return list(self.iter_keys(pattern))
 
-    def get_all(self):
+    def get_all(self, pattern='*'):
         """
         Retrieves all key-value pairs from the Redis database
         and returns them as a dictionary.
 
+        Args:
+            pattern (str): The pattern to match the keys against.
+            Defaults to '*' which matches all keys.
+
         Returns:
             dict: A dictionary containing all the key-value
-            pairs from the Redis database.
+            pairs from the Redis database. Use scan_items to
+            stream them instead.
         """
-        redis_dict = {}
-        for key in self.redis_client.scan_iter("*"):
-            value = self.redis_client.get(key)
-            redis_dict[key.decode(self.ENCODING)] = pickle.loads(value)
+        return dict(self.scan_items(pattern))
 
-        return redis_dict
+    def pool_stats(self) -> dict:
+        """
+        Returns the stats of the connection pool used by this client:
+        in-use and idle connections, checkouts and wait time.
+        """
+        return self.pool.stats()
 
     def flushdb(self):
         """
@@ -0,0 +1,219 @@
+import pickle
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+"""
+Serialization codecs for RedisClient values
+-------------------------------
+Every value written by RedisClient starts with a one-byte header:
+
+    header = codec_id << 4 | compression_id
+
+so values written with different codecs (or before codecs existed) can be
+read back by the same client. Values without a header are plain pickles
+from older code; they always start with the pickle PROTO opcode 0x80,
+which no header can take.
+
+    codec ids      : 1 pickle, 2 msgpack, 3 orjson, 4 raw bytes
+    compression ids: 0 none, 1 zlib, 2 lz4
+
+msgpack, orjson and lz4 are optional; selecting them without the package
+installed raises a RuntimeError when the serializer is built.
+
+    from models.redis_codecs import ValueSerializer
+    serializer = ValueSerializer("orjson", compression="zlib", prefixes={"raw:": "raw"})
+    data       = serializer.dumps("user:1", {"name": "Jhon"})
+    value      = serializer.loads(data)
+"""
+
+_LEGACY_PICKLE = 0x80
+
+
+class PickleCodec:
+    id   = 1
+    name = "pickle"
+
+    def dumps(self, value) -> bytes:
+        return pickle.dumps(value, protocol=5)
+
+    def loads(self, data: bytes):
+        return pickle.loads(data)
+
+
+class MsgpackCodec:
+    id   = 2
+    name = "msgpack"
+
+    def dumps(self, value) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data: bytes):
+        return msgpack.unpackb(data, raw=False)
+
+
+class OrjsonCodec:
+    id   = 3
+    name = "orjson"
+
+    def dumps(self, value) -> bytes:
+        # types orjson does not know (ObjectId, Decimal128, ...) are stored as strings
+        return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: bytes):
+        return orjson.loads(data)
+
+
+class RawCodec:
+    id   = 4
+    name = "raw"
+
+    def dumps(self, value) -> bytes:
+        if isinstance(value, str):
+            return value.encode('utf-8')
+        if not isinstance(value, (bytes, bytearray, memoryview)):
+            raise TypeError(f"raw codec only stores bytes or str, got {type(value).__name__}")
+        return bytes(value)
+
+    def loads(self, data: bytes):
+        return bytes(data)
+
+
+_REQUIRES = {
+    "msgpack": lambda: msgpack,
+    "orjson" : lambda: orjson,
+    "lz4"    : lambda: lz4_frame,
+}
+
+CODECS = {}
+
+
+def register_codec(codec) -> None:
+    """
+    Registers a codec by name and id. A codec is any object with `id`
+    (1-15, except 8 whose uncompressed header would be the legacy pickle
+    marker), `name`, `dumps(value) -> bytes` and `loads(bytes)`.
+    """
+    if not 0 < codec.id < 16 or codec.id << 4 == _LEGACY_PICKLE:
+        raise ValueError(f"codec id must be between 1 and 15 and not 8, got {codec.id}")
+    CODECS[codec.name] = codec
+    CODECS[codec.id]   = codec
+
+
+for _codec in (PickleCodec(), MsgpackCodec(), OrjsonCodec(), RawCodec()):
+    register_codec(_codec)
+
+
+COMPRESSION_IDS = {None: 0, "zlib": 1, "lz4": 2}
+
+
+def _compress(compression_id: int, data: bytes) -> bytes:
+    if compression_id == 1:
+        return zlib.compress(data, 1)
+    return lz4_frame.compress(data)
+
+
+def _decompress(compression_id: int, data: bytes) -> bytes:
+    if compression_id == 1:
+        return zlib.decompress(data)
+    if compression_id == 2:
+        return lz4_frame.decompress(data)
+    raise ValueError(f"Unknown compression id {compression_id}")
+
+
+def _require(name: str) -> None:
+    if name in _REQUIRES and _REQUIRES[name]() is None:
+        raise RuntimeError(f"'{name}' is selected for Redis values but the package is not installed")
+
+
+class ValueSerializer:
+
+    def __init__(self, codec: str = "pickle", compression: str = None, threshold: int = 1024,
+                 prefixes: dict = None, allow_pickle: bool = True):
+        """
+        Initializes the ValueSerializer class.
+
+        Args:
+            codec (str): Default codec name: "pickle", "msgpack", "orjson" or "raw".
+            compression (str, optional): "zlib", "lz4" or None. Defaults to None.
+            threshold (int): Only payloads of at least this many bytes are compressed.
+                Defaults to 1024.
+            prefixes (dict, optional): {key prefix: codec name} overrides. The
+                longest matching prefix wins.
+            allow_pickle (bool): If False, pickled values (new or legacy) are refused
+                when reading, for data written by untrusted parties. Defaults to True.
+        """
+        for name in [codec, compression] + list((prefixes or {}).values()):
+            if name is not None:
+                _require(name)
+        if compression not in COMPRESSION_IDS:
+            raise ValueError(f"Unknown compression {compression!r}")
+
+        self.codec          = CODECS[codec]
+        self.compression_id = COMPRESSION_IDS[compression]
+        self.threshold      = threshold
+        self.allow_pickle   = allow_pickle
+        # longest prefix first so "user:session:" beats "user:"
+        self.prefixes       = sorted(
+            ((prefix, CODECS[name]) for prefix, name in (prefixes or {}).items()),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+
+    def codec_for(self, key):
+        """
+        Returns the codec used to write the given key.
+        """
+        if self.prefixes:
+            if isinstance(key, bytes):
+                key = key.decode('utf-8', 'replace')
+            for prefix, codec in self.prefixes:
+                if key.startswith(prefix):
+                    return codec
+        return self.codec
+
+    def dumps(self, key, value) -> bytes:
+        """
+        Encodes a value for the given key and prepends the header byte.
+        """
+        codec          = self.codec_for(key)
+        payload        = codec.dumps(value)
+        compression_id = 0
+        if self.compression_id and len(payload) >= self.threshold:
+            compression_id = self.compression_id
+            payload        = _compress(compression_id, payload)
+        return bytes((codec.id << 4 | compression_id,)) + payload
+
+    def loads(self, data: bytes):
+        """
+        Decodes a value written by dumps, or a legacy header-less pickle.
+        """
+        header = data[0]
+        if header == _LEGACY_PICKLE:
+            if not self.allow_pickle:
+                raise ValueError("Refusing to unpickle a Redis value (allow_pickle is off)")
+            return pickle.loads(data)
+
+        codec = CODECS.get(header >> 4)
+        if codec is None:
+            raise ValueError(f"Unknown codec id {header >> 4} in Redis value header")
+        if codec.id == PickleCodec.id and not self.allow_pickle:
+            raise ValueError("Refusing to unpickle a Redis value (allow_pickle is off)")
+
+        payload = memoryview(data)[1:]
+        if header & 0x0F:
+            payload = _decompress(header & 0x0F, payload)
+        return codec.loads(payload)
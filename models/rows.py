@@ -0,0 +1,80 @@
+import threading
+from collections import namedtuple
+
+"""
+Compact row types for projected reads
+-------------------------------
+BaseModel.find_all / iter_all(..., projection=[...], as_rows=True) return
+one namedtuple per document instead of a dict. A row holds only the
+projected fields, in projection order, and costs a fraction of the memory
+of a dict with the same values:
+
+    for row in Account().iter_all({"active": True}, projection=["name", "plan.tier"], as_rows=True):
+        row._id, row.name, row.plan__tier
+
+Dotted paths become attributes with "__" instead of ".". Missing fields are None.
+The row classes are generated once per field list and shared.
+"""
+
+_row_types = {}
+_row_lock  = threading.Lock()
+
+
+def projection_fields(projection) -> tuple:
+    """
+    Returns the field paths an inclusion projection selects, `_id` first
+    unless it is excluded. Raises ValueError for exclusion projections.
+
+    Args:
+        projection (list | dict): ["name", "plan.tier"] or {"name": 1, "_id": 0}
+    """
+    if isinstance(projection, dict):
+        included = [field for field, value in projection.items() if field != '_id' and value]
+        excluded = [field for field, value in projection.items() if field != '_id' and not value]
+        if excluded:
+            raise ValueError(f"Rows need an inclusion projection, got exclusions {excluded}")
+        with_id  = bool(projection.get('_id', 1))
+    else:
+        included = [field for field in projection if field != '_id']
+        with_id  = True
+    return (('_id',) if with_id else ()) + tuple(included)
+
+
+def row_type(fields: tuple) -> type:
+    """
+    Returns the (cached) namedtuple class for a tuple of field paths.
+    """
+    row = _row_types.get(fields)
+    if row is None:
+        with _row_lock:
+            row = _row_types.get(fields)
+            if row is None:
+                names = [field.replace('.', '__') for field in fields]
+                # '_id' is not a valid namedtuple field name, rename=True keeps
+                # the position and calls it _0; expose it under its real name
+                row = namedtuple('Row', names, rename=True)
+                if fields and fields[0] == '_id':
+                    row._id = property(lambda self: self[0])
+                # keyed by the projected paths ("plan.tier"), used by JSON responses
+                row._asdict = lambda self: dict(zip(fields, self))
+                _row_types[fields] = row
+    return row
+
+
+def _value(document, path: str):
+    if '.' not in path:
+        return document.get(path)
+    value = document
+    for part in path.split('.'):
+        if value is None or not hasattr(value, 'get'):
+            return None
+        value = value.get(part)
+    return value
+
+
+def to_row(document, fields: tuple, row: type = None):
+    """
+    Builds the row of a document (dict or RawBSONDocument).
+    """
+    row = row or row_type(fields)
+    return row(*[_value(document, field) for field in fields])
@@ -0,0 +1,248 @@
+import copy
+import hashlib
+import threading
+import time
+import traceback
+from bson import json_util
+from config import BaseConfig
+from configs.connections import per_process
+
+"""
+Single-flight coalescing of identical concurrent reads
+-------------------------------
+When many requests ask for the same thing at the same time (a popular
+document just expired from the caches), only one of them queries MongoDB:
+
+    in-process    : calls with the same key while a query is running wait
+                    for it and get a copy of its result
+    across workers: the process that takes a short Redis lock runs the query;
+                    the others register as waiters and poll for its result
+                    instead of querying (RedisClient.wait_for). The result is
+                    only serialized and handed over, in a Redis key named after
+                    the lock token, when someone registered; so waiters only
+                    ever get the result of the flight they joined, and an
+                    uncontended read costs the lock and its release, nothing more
+
+BaseModel.find_all and find_one go through it, keyed by (collection, filter,
+projection, skip, limit):
+
+    flights = get_single_flight()
+    value   = flights.do('accounts', flights.key('accounts', 'find_all', filter), loader)
+
+Only callers that arrive while a query is in flight share its result; a
+write through BaseModel starts a new flight for later readers of that
+collection in this process. A flight of another worker may have started
+before that write, so for LOCK_TTL seconds after it this process does not
+join flights of other workers on that collection (read-your-writes). Results larger than MAX_DOCUMENTS documents are
+not handed over through Redis: the waiting workers then query themselves.
+If Redis is unreachable, coalescing stays in-process.
+
+Settings live in BaseConfig.SINGLE_FLIGHT; counters in stats().
+"""
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error', 'followers')
+
+    def __init__(self):
+        self.done      = threading.Event()
+        self.value     = None
+        self.error     = None
+        self.followers = 0
+
+
+class SingleFlight:
+
+    def __init__(self, settings: dict):
+        """
+        Initializes the SingleFlight class.
+
+        Args:
+            settings (dict): BaseConfig.SINGLE_FLIGHT
+        """
+        self.enabled       = settings.get("ENABLED", True)
+        self.use_redis     = settings.get("REDIS", True)
+        self.lock_ttl      = settings.get("LOCK_TTL", 5)
+        self.wait_timeout  = settings.get("WAIT_TIMEOUT", 5)
+        self.handoff_ttl   = settings.get("HANDOFF_TTL", 2)
+        self.max_documents = settings.get("MAX_DOCUMENTS", 1000)
+        self.retry_seconds = settings.get("RETRY_SECONDS", 30)
+        self._calls        = {}
+        self._generations  = {}
+        self._written_at   = {}
+        self._lock         = threading.Lock()
+        self._redis        = None
+        self._redis_down   = 0.0
+        self._counters     = {
+            'leaders'        : 0,
+            'coalesced_local': 0,
+            'coalesced_redis': 0,
+            'handoffs'       : 0,
+            'redis_fallbacks': 0,
+            'redis_errors'   : 0,
+        }
+
+    def key(self, namespace: str, kind: str, *args) -> str:
+        """
+        Builds the key of a read from the method name and its arguments,
+        serialized with canonical (sorted) key order.
+        """
+        raw = json_util.dumps(args, sort_keys=True)
+        return f"flight:{namespace}:{kind}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+    def do(self, namespace: str, key: str, loader, share: bool = True):
+        """
+        Returns `loader()`, sharing one call among concurrent callers with the same key.
+
+        Args:
+            namespace (str): The collection read, see invalidate.
+            key (str): The read's key, see key().
+            loader (callable): Runs the query.
+            share (bool): Also coalesce across processes through Redis. Turn off
+                for results that cannot be serialized (raw documents, rows).
+        """
+        if not self.enabled:
+            return loader()
+
+        local_key = (key, self._generations.get(namespace, 0))
+        with self._lock:
+            call = self._calls.get(local_key)
+            if call is None:
+                call = self._calls[local_key] = _Call()
+                leader = True
+            else:
+                call.followers += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            self._count('coalesced_local')
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.value)
+
+        try:
+            call.value = self._load(namespace, key, loader, share)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(local_key, None)
+            call.done.set()
+        # followers copy from call.value, so the leader's caller must not get the same object
+        return copy.deepcopy(call.value) if call.followers else call.value
+
+    def invalidate(self, namespace: str) -> None:
+        """
+        Called after a write to the collection: calls made from now on do
+        not join flights that started before the write.
+        """
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self._written_at[namespace]  = time.monotonic()
+
+    def stats(self) -> dict:
+        """
+        Returns how many calls ran a query ('leaders') and how many were
+        served by another call in this process or another worker, and how
+        many results were handed over to waiting workers ('handoffs').
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['in_flight'] = len(self._calls)
+        calls              = stats['leaders'] + stats['coalesced_local'] + stats['coalesced_redis']
+        stats['coalesced'] = stats['coalesced_local'] + stats['coalesced_redis']
+        stats['coalesced_ratio'] = stats['coalesced'] / calls if calls else 0.0
+        return stats
+
+    # ----- across processes ---------------------------------------------
+
+    def _load(self, namespace: str, key: str, loader, share: bool):
+        now = time.monotonic()
+        # a flight of another worker may predate this process's last write
+        written      = self._written_at.get(namespace)
+        recent_write = written is not None and now - written < self.lock_ttl
+        if not (share and self.use_redis and self._redis_down < now) or recent_write:
+            self._count('leaders')
+            return loader()
+
+        lock_key, result_key = f"{key}:lock", f"{key}:result"
+        try:
+            client = self._redis_client()
+            token  = client.acquire_lock(lock_key, self.lock_ttl)
+        except Exception:
+            self._redis_failed()
+            self._count('leaders')
+            return loader()
+
+        if token is not None:
+            self._count('leaders')
+            try:
+                value = loader()
+            except BaseException:
+                self._release(client, lock_key, token)
+                raise
+            # results over MAX_DOCUMENTS are not handed over, waiting workers query themselves
+            if isinstance(value, list) and len(value) > self.max_documents:
+                self._release(client, lock_key, token)
+            elif self._awaited(client, lock_key, token, f"{result_key}:{token}"):
+                # wrapped, so a None result is told apart from a missing key
+                self._count('handoffs')
+                self._release(client, lock_key, token, f"{result_key}:{token}", {'v': value})
+            return value
+
+        try:
+            entry = client.wait_for(result_key, lock_key, self.wait_timeout)
+        except Exception:
+            self._redis_failed()
+            entry = None
+        if entry is not None:
+            self._count('coalesced_redis')
+            return entry['v']
+
+        # the leader failed, timed out or had too large a result
+        self._count('redis_fallbacks')
+        self._count('leaders')
+        return loader()
+
+    def _release(self, client, lock_key: str, token: str, result_key: str = None, result=None) -> None:
+        try:
+            # one round trip: the result is written before the lock goes away
+            client.release_lock(lock_key, token, result_key, result, self.handoff_ttl)
+        except Exception:
+            # expires after LOCK_TTL
+            self._redis_failed()
+
+    def _awaited(self, client, lock_key: str, token: str, result_key: str) -> bool:
+        # releases the lock when no other worker waits; True when one does
+        try:
+            return client.release_lock_unless_awaited(lock_key, token, result_key)
+        except Exception:
+            # expires after LOCK_TTL
+            self._redis_failed()
+            return False
+
+    def _redis_client(self):
+        if self._redis is None:
+            from models.redis_client import RedisClient
+            self._redis = RedisClient()
+        return self._redis
+
+    def _redis_failed(self) -> None:
+        # reads must never fail because of Redis: coalesce in-process only for a while
+        self._count('redis_errors')
+        if self._redis_down == 0.0:
+            print(f"single flight: redis unavailable, coalescing in-process only\n{traceback.format_exc(limit=1)}")
+        self._redis_down = time.monotonic() + self.retry_seconds
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    Returns this process's SingleFlight, configured from BaseConfig.SINGLE_FLIGHT.
+    """
+    return per_process('single_flight', lambda: SingleFlight(BaseConfig.SINGLE_FLIGHT))
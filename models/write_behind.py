@@ -0,0 +1,463 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import Union
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteMany
+from pymongo.errors import BulkWriteError, WriteError
+from pymongo.results import BulkWriteResult
+from config import BaseConfig
+from configs.connections import per_process
+
+"""
+Write-behind engine used by BaseModel.*_on_thread
+-------------------------------
+Operations are pushed into a bounded queue and drained by a fixed pool of
+worker threads. Every worker owns one shard of the queue and a collection
+is always routed to the same shard, so writes to one collection are applied
+in the order they were submitted. A worker coalesces everything it can grab
+(up to BATCH_SIZE) into one `bulk_write` per collection.
+
+The operations of a batch are unrelated writes, so one failing must not
+fail the others: every future is resolved on its own. The batch is sent
+unordered when each operation touches its own document (inserts, writes by
+_id), else ordered; the operations an ordered batch skipped after a failed
+one are sent again right away, in order.
+
+    from models.write_behind import get_write_behind
+    engine = get_write_behind()
+    engine.submit(collection, InsertOne({"name": "Jhon"}))
+    engine.stats()
+"""
+
+_STOP = object()
+
+
+class WriteBehindFull(Exception):
+    """
+    Raised by WriteBehindExecutor.submit when the queue is full
+    and the executor is configured with ON_FULL = "raise".
+    """
+    pass
+
+
+class WriteBehindExecutor:
+
+    ON_FULL_POLICIES = ("block", "drop", "raise")
+
+    def __init__(self, workers: int = 4, queue_size: int = 10000, batch_size: int = 500,
+                 on_full: str = "block", block_timeout: float = None):
+        """
+        Initializes the WriteBehindExecutor class.
+
+        Args:
+            workers (int): Number of worker threads draining the queue. Defaults to 4.
+            queue_size (int): Total number of operations that may be pending.
+                It is split evenly across the workers. Defaults to 10000.
+            batch_size (int): Maximum number of operations sent in one bulk_write.
+                Defaults to 500.
+            on_full (str): What submit does when the queue is full, one of
+                "block", "drop" or "raise". Defaults to "block".
+            block_timeout (float, optional): With on_full="block", how long to wait
+                for a free slot before dropping. None waits forever.
+        """
+        if on_full not in self.ON_FULL_POLICIES:
+            raise ValueError(f"on_full must be one of {self.ON_FULL_POLICIES}, got {on_full!r}")
+
+        self.workers       = max(1, int(workers))
+        self.batch_size    = max(1, int(batch_size))
+        self.on_full       = on_full
+        self.block_timeout = block_timeout
+        shard_size         = max(1, int(queue_size) // self.workers)
+        self._queues       = [queue.Queue(maxsize=shard_size) for _ in range(self.workers)]
+        self._threads      = []
+        self._lock         = threading.Lock()
+        # with on_full="raise", makes checking room for a list and queuing it one step
+        self._reserve      = threading.RLock()
+        self._closed       = False
+        self._counters     = {
+            'submitted'         : 0,
+            'dropped'           : 0,
+            'written'           : 0,
+            'failed'            : 0,
+            'batches'           : 0,
+            'batch_size_max'    : 0,
+            'batch_size_last'   : 0,
+            'flush_seconds'     : 0.0,
+            'flush_seconds_max' : 0.0,
+            'flush_seconds_last': 0.0,
+        }
+
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._run,
+                args=(self._queues[index],),
+                name=f"write-behind-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, collection, operation, return_future: bool = False) -> Union[Future, None]:
+        """
+        Queues a single pymongo write operation for the given collection.
+
+        Args:
+            collection (Collection): The pymongo collection to write to.
+            operation: A pymongo bulk operation (InsertOne, UpdateOne, UpdateMany, DeleteMany, ...).
+            return_future (bool): If True, return a Future that resolves to the
+                BulkWriteResult of the batch the operation was written in.
+
+        Returns:
+            Future or None: The future if requested, otherwise None. A dropped
+            operation gets a future that is already failed with WriteBehindFull.
+        """
+        if self._closed:
+            raise RuntimeError("WriteBehindExecutor is shut down")
+
+        future = Future() if return_future else None
+        shard  = self._queues[hash(collection.full_name) % self.workers]
+        item   = (collection, operation, future)
+
+        try:
+            if self.on_full == "block":
+                shard.put(item, timeout=self.block_timeout)
+            elif self.on_full == "raise":
+                with self._reserve:
+                    shard.put_nowait(item)
+            else:
+                shard.put_nowait(item)
+        except queue.Full:
+            self._count('dropped')
+            if self.on_full == "raise":
+                raise WriteBehindFull(f"write-behind queue is full ({shard.maxsize} pending)")
+            if future is not None:
+                future.set_exception(WriteBehindFull("write-behind queue is full, operation dropped"))
+            return future
+
+        self._count('submitted')
+        return future
+
+    def submit_many(self, collection, operations: list, return_future: bool = False) -> Union[Future, None]:
+        """
+        Queues several operations for the given collection, see submit.
+
+        Returns:
+            Future or None: If requested, one future resolving to the list of
+            the operations' results once all are written, or failing with the
+            first error (a failed or dropped operation). With on_full="raise",
+            WriteBehindFull is raised before anything is queued when the list
+            does not fit.
+        """
+        if self.on_full == "raise":
+            shard = self._queues[hash(collection.full_name) % self.workers]
+            with self._reserve:
+                if shard.maxsize - shard.qsize() < len(operations):
+                    self._count('dropped', len(operations))
+                    raise WriteBehindFull(f"write-behind queue is full ({shard.maxsize} pending), "
+                                          f"{len(operations)} operations not queued")
+                futures = [self.submit(collection, operation, return_future) for operation in operations]
+        else:
+            futures = [self.submit(collection, operation, return_future) for operation in operations]
+        return _all_of(futures) if return_future else None
+
+    def insert(self, collection, data: Union[dict, list], return_future: bool = False) -> Union[Future, None]:
+        """
+        Queues an insert of a single document or a list of documents.
+        With a list, the future (if any) covers every document, see submit_many.
+        """
+        if type(data) != list:
+            return self.submit(collection, InsertOne(data), return_future)
+        return self.submit_many(collection, [InsertOne(document) for document in data], return_future)
+
+    def update(self, collection, filter: dict, update_data: dict, update_all: bool = True,
+               return_future: bool = False, current_date: str = None) -> Union[Future, None]:
+        """
+        Queues a `$set` update of the documents matching the filter, also
+        setting `current_date` to the server's time when given.
+        """
+        operation = UpdateMany if update_all else UpdateOne
+        update    = {'$set': update_data}
+        if current_date is not None and current_date not in update_data:
+            update['$currentDate'] = {current_date: True}
+        return self.submit(collection, operation(filter, update), return_future)
+
+    def delete(self, collection, filter: dict, return_future: bool = False) -> Union[Future, None]:
+        """
+        Queues a delete of all documents matching the filter.
+        """
+        return self.submit(collection, DeleteMany(filter), return_future)
+
+    def queue_depth(self) -> int:
+        """
+        Returns the number of operations currently waiting to be written.
+        """
+        return sum(shard.qsize() for shard in self._queues)
+
+    def stats(self) -> dict:
+        """
+        Returns a snapshot of the executor counters.
+
+        Returns:
+            dict: queue depth and capacity, submitted / dropped / written / failed
+            operation counts, number of batches with average, max and last batch
+            size, and average, max and last flush latency in seconds.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+
+        batches = stats['batches']
+        stats['queue_depth']       = self.queue_depth()
+        stats['queue_capacity']    = sum(shard.maxsize for shard in self._queues)
+        stats['workers']           = self.workers
+        stats['batch_size_avg']    = (stats['written'] + stats['failed']) / batches if batches else 0.0
+        stats['flush_seconds_avg'] = stats['flush_seconds'] / batches if batches else 0.0
+        return stats
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every queued operation has been written.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the queue drained before the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for shard in self._queues:
+            with shard.all_tasks_done:
+                while shard.unfinished_tasks:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    shard.all_tasks_done.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: float = 30) -> bool:
+        """
+        Stops accepting new operations, writes everything still queued
+        and stops the worker threads.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait for the drain.
+
+        Returns:
+            bool: True if all pending operations were written in time.
+        """
+        if self._closed:
+            return True
+        self._closed = True
+
+        drained = self.flush(timeout)
+        for shard in self._queues:
+            try:
+                shard.put_nowait(_STOP)
+            except queue.Full:
+                pass
+        for thread in self._threads:
+            thread.join(timeout=1)
+        return drained
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _run(self, shard: queue.Queue) -> None:
+        """
+        Worker loop: wait for one operation, grab whatever else is already
+        queued (up to batch_size) and write it.
+        """
+        while True:
+            item = shard.get()
+            if item is _STOP:
+                shard.task_done()
+                return
+
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = shard.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    # put it back so the loop exits after this batch
+                    shard.task_done()
+                    shard.put(_STOP)
+                    break
+                batch.append(item)
+
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    shard.task_done()
+
+    def _write(self, batch: list) -> None:
+        """
+        Groups a batch by collection, keeping submission order,
+        and sends one bulk_write per collection. Operations queued through
+        Collection objects with another write concern (BaseModel.using) go
+        in a group of their own: a run of consecutive operations with the
+        same write concern, so a collection's runs are still written in order.
+        """
+        grouped = {}
+        runs    = {}
+        for collection, operation, future in batch:
+            concern = collection.write_concern.document
+            run     = runs.get(collection.full_name)
+            if run is None or run[0] != concern:
+                run = runs[collection.full_name] = (concern, run[1] + 1 if run else 0)
+            entry = grouped.setdefault((collection.full_name, run[1]), (collection, [], []))
+            entry[1].append(operation)
+            entry[2].append(future)
+
+        for collection, operations, futures in grouped.values():
+            self._write_group(collection, operations, futures)
+
+    def _write_group(self, collection, operations: list, futures: list) -> None:
+        ordered = not _independent(operations)
+        while operations:
+            started = time.perf_counter()
+            try:
+                result = collection.bulk_write(operations, ordered=ordered)
+            except BulkWriteError as e:
+                operations, futures = self._partial(collection, operations, futures, e.details, ordered,
+                                                    time.perf_counter() - started)
+                continue
+            except Exception as e:
+                # nothing tells which operations were applied
+                print(f"write-behind: bulk_write on {collection.full_name} failed\n{traceback.format_exc()}")
+                self._record(0, len(operations), time.perf_counter() - started)
+                for future in futures:
+                    if future is not None:
+                        future.set_exception(e)
+                return
+
+            self._record(len(operations), 0, time.perf_counter() - started)
+            for future in futures:
+                if future is not None:
+                    future.set_result(result)
+            return
+
+    def _partial(self, collection, operations: list, futures: list, details: dict, ordered: bool,
+                 elapsed: float) -> tuple:
+        """
+        Resolves the futures of a bulk_write that failed for some operations:
+        failed ones get their WriteError, applied ones the batch result.
+        Returns the operations an ordered batch skipped, to be sent again.
+        """
+        errors = {error['index']: error for error in details.get('writeErrors', [])}
+        # an ordered batch stops at its first error, the rest was not attempted
+        end    = min(errors) + 1 if ordered and errors else len(operations)
+        result = BulkWriteResult(details, True)
+        print(f"write-behind: {len(errors)} of {end} operations failed on {collection.full_name}: "
+              f"{[error.get('errmsg') for error in errors.values()][:3]}")
+
+        self._record(end - len(errors), len(errors), elapsed)
+        for index in range(end):
+            future = futures[index]
+            if future is None:
+                continue
+            error = errors.get(index)
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(WriteError(error.get('errmsg'), error.get('code'), error))
+        return operations[end:], futures[end:]
+
+    def _record(self, written: int, failed: int, elapsed: float) -> None:
+        size = written + failed
+        with self._lock:
+            counters = self._counters
+            counters['written']            += written
+            counters['failed']             += failed
+            counters['batches']            += 1
+            counters['batch_size_last']     = size
+            counters['batch_size_max']      = max(counters['batch_size_max'], size)
+            counters['flush_seconds']      += elapsed
+            counters['flush_seconds_last']  = elapsed
+            counters['flush_seconds_max']   = max(counters['flush_seconds_max'], elapsed)
+
+
+def _document_key(operation):
+    """
+    The document an operation writes: the _id of an insert (a new object when
+    pymongo will generate it) or of an {"_id": value} filter, else None.
+    """
+    if isinstance(operation, InsertOne):
+        _id = operation._doc.get('_id')
+        return object() if _id is None else ('_id', _id)
+    filter = getattr(operation, '_filter', None)
+    if isinstance(filter, dict) and list(filter) == ['_id'] and not isinstance(filter['_id'], dict):
+        return ('_id', filter['_id'])
+    return None
+
+
+def _independent(operations: list) -> bool:
+    # true when no two operations can touch the same document, so order does not matter
+    seen = set()
+    for operation in operations:
+        key = _document_key(operation)
+        if key is None or key in seen:
+            return False
+        seen.add(key)
+    return True
+
+
+def _all_of(futures: list) -> Future:
+    """
+    Returns a future resolving to the results of `futures` once all of them
+    are done, or failing with the first error in submission order.
+    """
+    combined = Future()
+    pending  = [len(futures)]
+    lock     = threading.Lock()
+
+    def resolve(_):
+        with lock:
+            pending[0] -= 1
+            if pending[0] > 0:
+                return
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if errors:
+            combined.set_exception(errors[0])
+        else:
+            combined.set_result([future.result() for future in futures])
+
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(resolve)
+    return combined
+
+
+def get_write_behind() -> WriteBehindExecutor:
+    """
+    Returns this process's write-behind executor, creating it
+    from BaseConfig.WRITE_BEHIND on first use. The executor is
+    drained automatically when the interpreter exits; a forked
+    worker gets its own, see configs.connections.
+    """
+    def create():
+        settings = BaseConfig.WRITE_BEHIND
+        executor = WriteBehindExecutor(
+            workers       = settings.get("WORKERS", 4),
+            queue_size    = settings.get("QUEUE_SIZE", 10000),
+            batch_size    = settings.get("BATCH_SIZE", 500),
+            on_full       = settings.get("ON_FULL", "block"),
+            block_timeout = settings.get("BLOCK_TIMEOUT")
+        )
+        atexit.register(_shutdown_at_exit, executor, os.getpid(), settings.get("SHUTDOWN_TIMEOUT", 30))
+        return executor
+
+    return per_process('write_behind', create)
+
+
+def _shutdown_at_exit(executor: WriteBehindExecutor, pid: int, timeout: float) -> None:
+    # atexit handlers are inherited by forked children, whose copy has no worker threads
+    if pid == os.getpid():
+        executor.shutdown(timeout)
@@ -0,0 +1,332 @@
+import functools
+import inspect
+import os
+import threading
+import time
+from flask import Blueprint, Response, g, request
+from pymongo import monitoring
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest
+)
+
+"""
+Prometheus metrics for routes, BaseModel, MongoDB commands and RedisClient
+-------------------------------
+    geeta_http_request_duration_seconds{method, route, status}
+    geeta_model_call_duration_seconds{collection, method}
+    geeta_model_client_seconds{collection, method}       time spent in Python (decode, copies)
+    geeta_mongo_command_duration_seconds{command}        server round trip, from a CommandListener
+    geeta_mongo_command_failures_total{command}
+    geeta_mongo_pool_checked_out{client}                 connections in use, from a ConnectionPoolListener
+    geeta_mongo_pool_wait_seconds{client}                time to check a connection out of the pool
+    geeta_mongo_pool_checkout_failures_total{client, reason}
+    geeta_redis_command_duration_seconds{command}
+    geeta_redis_command_failures_total{command}
+    geeta_job_claim_duration_seconds                     find_one_and_update of a claim
+    geeta_job_queue_lag_seconds{name}                    from runAt to claimed
+    geeta_job_run_duration_seconds{name, outcome}
+    geeta_admission_rejected_total{scope}                429s of /test/implementation
+    geeta_mirror_synced_timestamp_seconds{collection}    last confirmed sync of a mirror (staleness = now - this)
+    geeta_mirror_event_lag_seconds{collection}           from a change's clusterTime to applied in the mirror
+
+Everything is exported on GET /metrics in the Prometheus text format.
+
+Multi-process servers: set PROMETHEUS_MULTIPROC_DIR to an empty, writable
+directory before the workers start. Each worker then writes its samples to
+that directory and /metrics aggregates all of them. Without it, every
+process only reports its own samples.
+"""
+
+MULTIPROCESS = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+# latency buckets from 0.5 ms to 10 s
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    'geeta_http_request_duration_seconds', 'Flask request latency',
+    ['method', 'route', 'status'], buckets=BUCKETS
+)
+MODEL_CALL_DURATION = Histogram(
+    'geeta_model_call_duration_seconds', 'BaseModel method latency',
+    ['collection', 'method'], buckets=BUCKETS
+)
+MODEL_CLIENT_SECONDS = Histogram(
+    'geeta_model_client_seconds', 'Part of a BaseModel call not spent waiting on MongoDB commands',
+    ['collection', 'method'], buckets=BUCKETS
+)
+MONGO_COMMAND_DURATION = Histogram(
+    'geeta_mongo_command_duration_seconds', 'MongoDB command round-trip time',
+    ['command'], buckets=BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter(
+    'geeta_mongo_command_failures_total', 'Failed MongoDB commands', ['command']
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    'geeta_mongo_pool_checked_out', 'MongoDB connections checked out of the pool',
+    ['client'], multiprocess_mode='livesum'
+)
+MONGO_POOL_WAIT = Histogram(
+    'geeta_mongo_pool_wait_seconds', 'Time to check a connection out of the MongoDB pool',
+    ['client'], buckets=BUCKETS
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    'geeta_mongo_pool_checkout_failures_total', 'Failed MongoDB connection checkouts',
+    ['client', 'reason']
+)
+REDIS_COMMAND_DURATION = Histogram(
+    'geeta_redis_command_duration_seconds', 'RedisClient call latency',
+    ['command'], buckets=BUCKETS
+)
+REDIS_COMMAND_FAILURES = Counter(
+    'geeta_redis_command_failures_total', 'Failed RedisClient calls', ['command']
+)
+
+JOB_CLAIM_DURATION = Histogram(
+    'geeta_job_claim_duration_seconds', 'Time to claim a job from scheduler_data', buckets=BUCKETS
+)
+JOB_QUEUE_LAG = Histogram(
+    'geeta_job_queue_lag_seconds', 'Time a due job waited before it was claimed',
+    ['name'], buckets=BUCKETS + (30.0, 60.0, 300.0, 900.0)
+)
+JOB_RUN_DURATION = Histogram(
+    'geeta_job_run_duration_seconds', 'Job handler run time',
+    ['name', 'outcome'], buckets=BUCKETS + (30.0, 60.0, 300.0, 900.0)
+)
+ADMISSION_REJECTED = Counter(
+    'geeta_admission_rejected_total', 'Requests refused by the rate limiter', ['scope']
+)
+# with several workers, the stalest one is reported
+MIRROR_SYNCED = Gauge(
+    'geeta_mirror_synced_timestamp_seconds', 'Last confirmed sync of an in-memory mirror',
+    ['collection'], multiprocess_mode='min'
+)
+MIRROR_EVENT_LAG = Histogram(
+    'geeta_mirror_event_lag_seconds', 'Time from a change to its application in the mirror',
+    ['collection'], buckets=BUCKETS
+)
+
+# labels() takes a lock and builds a tuple on every call; cache the children
+_children      = {}
+_children_lock = threading.Lock()
+
+
+def _child(metric, *labels):
+    key   = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        with _children_lock:
+            child = _children.get(key)
+            if child is None:
+                child = metric.labels(*labels)
+                _children[key] = child
+    return child
+
+
+# ======================================
+#     MONGODB COMMAND LISTENER
+# ======================================
+_command_time = threading.local()
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Records the server round-trip time of every MongoDB command, and adds
+    it to a per-thread total so instrumented BaseModel calls can tell
+    waiting on the server apart from Python-side work.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        seconds = event.duration_micros / 1e6
+        _child(MONGO_COMMAND_DURATION, event.command_name).observe(seconds)
+        _command_time.seconds = getattr(_command_time, 'seconds', 0.0) + seconds
+
+    def failed(self, event):
+        seconds = event.duration_micros / 1e6
+        _child(MONGO_COMMAND_DURATION, event.command_name).observe(seconds)
+        _child(MONGO_COMMAND_FAILURES, event.command_name).inc()
+        _command_time.seconds = getattr(_command_time, 'seconds', 0.0) + seconds
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Follows the connection pools of one named MongoClient (one pool per
+    server): connections in use, checkout wait times and failures. Exported
+    as metrics labelled by client, and per process by stats().
+    """
+
+    def __init__(self, client: str):
+        self.client    = client
+        self._lock     = threading.Lock()
+        self._counters = {
+            'created'          : 0,
+            'closed'           : 0,
+            'checked_out'      : 0,
+            'checkouts'        : 0,
+            'checkout_failures': 0,
+            'wait_seconds_max' : 0.0,
+            'pool_cleared'     : 0,
+        }
+        self._failures   = {}
+        self._wait_total = 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._count('pool_cleared')
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count('created')
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count('closed')
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._counters['checked_out'] += 1
+            self._counters['checkouts']   += 1
+            self._wait_total              += event.duration
+            self._counters['wait_seconds_max'] = max(self._counters['wait_seconds_max'], event.duration)
+        _child(MONGO_POOL_CHECKED_OUT, self.client).inc()
+        _child(MONGO_POOL_WAIT, self.client).observe(event.duration)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._counters['checkout_failures'] += 1
+            self._failures[event.reason] = self._failures.get(event.reason, 0) + 1
+        _child(MONGO_POOL_WAIT, self.client).observe(event.duration)
+        _child(MONGO_POOL_CHECKOUT_FAILURES, self.client, event.reason).inc()
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._counters['checked_out'] = max(0, self._counters['checked_out'] - 1)
+        _child(MONGO_POOL_CHECKED_OUT, self.client).dec()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the connections open and in use, checkouts, checkout wait
+        times and failures (by reason: "timeout", "connectionError", "poolClosed").
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['open']             = stats['created'] - stats['closed']
+            stats['wait_seconds_avg'] = self._wait_total / stats['checkouts'] if stats['checkouts'] else 0.0
+            stats['failures']         = dict(self._failures)
+        return stats
+
+
+# ======================================
+#     BASEMODEL / REDISCLIENT WRAPPERS
+# ======================================
+def instrument_model(cls):
+    """
+    Class decorator timing every public BaseModel method per collection.
+    Generator methods (iter_all, find_pages) are left alone: their cost is
+    paid while the caller iterates.
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(method) or inspect.isgeneratorfunction(method):
+            continue
+        setattr(cls, name, _time_model_method(name, method))
+    return cls
+
+
+def _time_model_method(name, method):
+    @functools.wraps(method)
+    def wrapped(self, *args, **kwargs):
+        before  = getattr(_command_time, 'seconds', 0.0)
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            elapsed    = time.perf_counter() - started
+            server     = getattr(_command_time, 'seconds', 0.0) - before
+            collection = getattr(self.collection, 'name', '')
+            _child(MODEL_CALL_DURATION, collection, name).observe(elapsed)
+            _child(MODEL_CLIENT_SECONDS, collection, name).observe(max(0.0, elapsed - server))
+    return wrapped
+
+
+def instrument_redis(cls):
+    """
+    Class decorator timing every public RedisClient method as one Redis command.
+    Generator methods (iter_keys, scan_items) are left alone.
+    """
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_') or name == 'pool_stats' or not inspect.isfunction(method) \
+                or inspect.isgeneratorfunction(method):
+            continue
+        setattr(cls, name, _time_redis_method(name, method))
+    return cls
+
+
+def _time_redis_method(name, method):
+    @functools.wraps(method)
+    def wrapped(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            _child(REDIS_COMMAND_FAILURES, name).inc()
+            raise
+        finally:
+            _child(REDIS_COMMAND_DURATION, name).observe(time.perf_counter() - started)
+    return wrapped
+
+
+# ======================================
+#     FLASK
+# ======================================
+metrics_routes = Blueprint('metrics_routes', __name__)
+
+
+@metrics_routes.route('/metrics', methods=['GET'])
+def metrics():
+    if MULTIPROCESS:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app) -> None:
+    """
+    Registers the /metrics endpoint and the per-route latency hooks on the app.
+    Routes are labelled by their URL rule, not the raw path, to keep the
+    number of series bounded.
+    """
+    @app.before_request
+    def start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None and request.endpoint != 'metrics_routes.metrics':
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            _child(HTTP_REQUEST_DURATION, request.method, route, str(response.status_code)) \
+                .observe(time.perf_counter() - started)
+        return response
+
+    app.register_blueprint(metrics_routes)
@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+from config import BaseConfig
+
+"""
+Development guard against collection scans
+-------------------------------
+BaseModel calls query_guard.check(collection, filter) before it runs a
+filtered find / count / update / delete. The first time a filter *shape*
+is seen on a collection, the guard runs `explain` (queryPlanner verbosity,
+so the query itself is not executed) and prints a warning when the winning
+plan contains a COLLSCAN and the collection holds at least MIN_DOCUMENTS
+documents:
+
+    query guard: COLLSCAN on geeta-db.accounts (48210 documents) in find
+                 for filter {"email": "<str>", "age": {"$gt": "<int>"}}
+
+A shape is the filter with its values replaced by their type names, so
+{"email": "a@b.c"} and {"email": "x@y.z"} are explained only once.
+Empty filters are never checked: scanning everything is what they ask for.
+
+Settings live in BaseConfig.QUERY_GUARD. With DEVELOPMENT_ONLY the guard
+only runs when FLASK_ENV is development.
+"""
+
+
+def filter_shape(value):
+    """
+    Returns the filter with every value replaced by "<type name>",
+    keeping field names and operators.
+    """
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $and / $or / $in lists: keep the distinct shapes of their items
+        shapes = []
+        for item in value:
+            shape = filter_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return f"<{type(value).__name__}>"
+
+
+def _shape_key(shape) -> str:
+    if isinstance(shape, dict):
+        return '{' + ','.join(f"{key}:{_shape_key(item)}" for key, item in sorted(shape.items())) + '}'
+    if isinstance(shape, list):
+        return '[' + ','.join(_shape_key(item) for item in shape) + ']'
+    return shape
+
+
+def _stages(plan):
+    """
+    Yields every stage name of an explain plan tree (classic and SBE layouts).
+    """
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+class QueryPlanGuard:
+
+    def __init__(self, settings: dict):
+        """
+        Initializes the QueryPlanGuard class.
+
+        Args:
+            settings (dict): BaseConfig.QUERY_GUARD
+        """
+        development        = os.environ.get('FLASK_ENV') == 'development'
+        self.enabled       = settings.get("ENABLED", True) and (development or not settings.get("DEVELOPMENT_ONLY", True))
+        self.min_documents = settings.get("MIN_DOCUMENTS", 1000)
+        self.max_shapes    = settings.get("MAX_SHAPES", 10000)
+        self._seen         = set()
+        self._lock         = threading.Lock()
+        self.warnings      = 0
+
+    def check(self, collection, filter: dict, operation: str = 'find', sort: list = None) -> None:
+        """
+        Explains `filter` on `collection` the first time its shape is seen
+        and prints a warning for a collection scan. Never raises.
+        """
+        if not self.enabled or not filter:
+            return
+
+        shape = filter_shape(filter)
+        key   = (collection.full_name, _shape_key(shape), repr(sort))
+        with self._lock:
+            if key in self._seen or len(self._seen) >= self.max_shapes:
+                return
+            self._seen.add(key)
+
+        try:
+            command = {'find': collection.name, 'filter': filter}
+            if sort:
+                command['sort'] = dict(sort)
+            plan = collection.database.command({'explain': command, 'verbosity': 'queryPlanner'})
+            if 'COLLSCAN' not in set(_stages(plan.get('queryPlanner', plan))):
+                return
+            documents = collection.estimated_document_count()
+            if documents < self.min_documents:
+                return
+        except Exception as e:
+            # explain is not available everywhere (e.g. mongomock); the query still runs
+            print(f"query guard: explain failed on {collection.full_name}: {e}")
+            return
+
+        self.warnings += 1
+        print(f"query guard: COLLSCAN on {collection.full_name} ({documents} documents) in {operation} "
+              f"for filter {json.dumps(shape)}")
+
+    def reset(self) -> None:
+        """
+        Forgets the shapes seen so far, so they are explained again.
+        """
+        with self._lock:
+            self._seen.clear()
+
+
+query_guard = QueryPlanGuard(BaseConfig.QUERY_GUARD)
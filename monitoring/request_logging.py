@@ -0,0 +1,206 @@
+import atexit
+import datetime
+import os
+import random
+import threading
+import time
+import traceback
+from collections import deque
+from flask import g, request
+from pymongo.errors import CollectionInvalid
+from config import BaseConfig
+
+"""
+Request logging into the request_logs collection
+-------------------------------
+An after_request hook captures method, route, path, status, latency and
+payload sizes of (a sample of) requests and appends them to an in-memory
+buffer. A background thread flushes the buffer with one insert_many every
+FLUSH_INTERVAL seconds or as soon as BATCH_SIZE entries are waiting.
+
+The buffer never blocks a request: past MAX_BUFFERED entries new entries
+are dropped and counted. Settings live in BaseConfig.REQUEST_LOGS.
+
+Collection layout (LAYOUT):
+    "timeseries": time-series collection on `timestamp` with `meta`
+                  (method / route / status) as metaField, expiring after TTL_DAYS
+    "capped"    : capped collection of CAPPED_SIZE_MB
+    "regular"   : plain collection with a TTL index on `timestamp`
+"""
+
+
+class RequestLogBuffer:
+
+    def __init__(self, settings: dict):
+        """
+        Initializes the RequestLogBuffer class.
+
+        Args:
+            settings (dict): BaseConfig.REQUEST_LOGS
+        """
+        self.settings       = settings
+        self.batch_size     = settings.get("BATCH_SIZE", 500)
+        self.flush_interval = settings.get("FLUSH_INTERVAL", 2)
+        self.max_buffered   = settings.get("MAX_BUFFERED", 10000)
+        self._entries       = deque()
+        self._lock          = threading.Lock()
+        self._wakeup        = threading.Event()
+        self._thread        = None
+        self._pid           = None
+        self._collection    = None
+        self._counters      = {
+            'buffered': 0,
+            'written' : 0,
+            'dropped' : 0,
+            'failed'  : 0,
+            'flushes' : 0,
+        }
+
+    def append(self, entry: dict) -> bool:
+        """
+        Adds an entry without blocking. Returns False if it was dropped
+        because the buffer is full.
+        """
+        self._ensure_flusher()
+        with self._lock:
+            if len(self._entries) >= self.max_buffered:
+                self._counters['dropped'] += 1
+                return False
+            self._entries.append(entry)
+            self._counters['buffered'] += 1
+            ready = len(self._entries) >= self.batch_size
+        if ready:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """
+        Writes everything buffered so far, one insert_many per BATCH_SIZE
+        entries. Returns the number of entries written.
+        """
+        written = 0
+        while True:
+            with self._lock:
+                count = min(len(self._entries), self.batch_size)
+                batch = [self._entries.popleft() for _ in range(count)]
+            if not batch:
+                return written
+
+            try:
+                self._get_collection().insert_many(batch, ordered=False)
+                written += len(batch)
+                self._count('written', len(batch))
+            except Exception:
+                # logs are best effort, never retry into an unbounded backlog
+                self._count('failed', len(batch))
+                print(f"request logs: insert_many of {len(batch)} entries failed\n{traceback.format_exc()}")
+            self._count('flushes')
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['pending'] = len(self._entries)
+        return stats
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def _get_collection(self):
+        # resolved on the flusher thread, so a slow or missing Mongo never delays startup
+        if self._collection is None:
+            from models.models import RequestLogs
+            model = RequestLogs()
+            if self.settings.get("CREATE_COLLECTION", True):
+                ensure_request_logs_collection(model.db, self.settings)
+            self._collection = model.collection
+        return self._collection
+
+    def _ensure_flusher(self) -> None:
+        # started lazily and once per process, so forked workers get their own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._entries.clear()
+            self._collection = None
+            self._thread     = threading.Thread(target=self._run, name="request-log-flusher", daemon=True)
+            self._thread.start()
+            self._pid        = os.getpid()
+            atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def ensure_request_logs_collection(db, settings: dict) -> None:
+    """
+    Creates the request_logs collection with the configured layout if it
+    does not exist yet. An existing collection is left as it is.
+    """
+    layout     = settings.get("LAYOUT", "timeseries")
+    ttl        = int(settings.get("TTL_DAYS", 30) * 86400)
+    collection = 'request_logs'
+
+    try:
+        if layout == "timeseries":
+            db.create_collection(
+                collection,
+                timeseries={'timeField': 'timestamp', 'metaField': 'meta', 'granularity': 'seconds'},
+                expireAfterSeconds=ttl
+            )
+        elif layout == "capped":
+            db.create_collection(collection, capped=True, size=int(settings.get("CAPPED_SIZE_MB", 512)) * 1024 * 1024)
+        else:
+            db.create_collection(collection)
+            db[collection].create_index('timestamp', expireAfterSeconds=ttl)
+    except CollectionInvalid:
+        pass
+    except Exception as e:
+        # e.g. no permission or a server without time-series support: plain inserts still work
+        print(f"request logs: could not create '{collection}' ({layout}): {e}")
+
+
+buffer = RequestLogBuffer(BaseConfig.REQUEST_LOGS)
+
+
+def init_request_logging(app) -> None:
+    """
+    Registers the request logging hooks on the app when
+    BaseConfig.REQUEST_LOGS["ENABLED"] is set.
+    """
+    settings = BaseConfig.REQUEST_LOGS
+    if not settings.get("ENABLED", False):
+        return
+
+    sample_rate   = settings.get("SAMPLE_RATE", 1.0)
+    always_errors = settings.get("ALWAYS_LOG_ERRORS", True)
+    skip_paths    = set(settings.get("SKIP_PATHS", ['/metrics']))
+
+    @app.before_request
+    def start_request_log():
+        g._request_log_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_log(response):
+        started = g.pop('_request_log_started', None)
+        if started is None or request.path in skip_paths:
+            return response
+        if random.random() >= sample_rate and not (always_errors and response.status_code >= 500):
+            return response
+
+        route = request.url_rule.rule if request.url_rule else None
+        buffer.append({
+            'timestamp'    : datetime.datetime.now(datetime.timezone.utc),
+            'meta'         : {'method': request.method, 'route': route, 'status': response.status_code},
+            'path'         : request.path,
+            'latency_ms'   : round((time.perf_counter() - started) * 1000, 3),
+            'request_size' : request.content_length,
+            'response_size': None if response.is_streamed else response.calculate_content_length(),
+            'remote_addr'  : request.remote_addr
+        })
+        return response